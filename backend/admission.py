@@ -0,0 +1,133 @@
+"""
+Admission control for expensive endpoints
+Login, registration and submission hash passwords and write to the database in
+the shared threadpool. Under a burst they used to queue there until every
+request timed out, health checks included. Each limited route now gets a
+number of concurrent slots and a short queue in front of them:
+
+    ADMISSION_LIMITS="/login=8:1,/register=4:1"   # path=concurrency:queue budget in seconds
+
+A request that would wait longer than the budget, or finds the queue full, is
+answered with 503 and Retry-After straight away. The limits add up to well
+below the threadpool size (40 threads), so health checks and static files
+always find a free thread. Limits are per worker process.
+"""
+import asyncio
+import collections
+import logging
+import time
+
+from starlette.responses import JSONResponse
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("http_requests_shed_total", "counter", "Requests answered with 503 by admission control")
+metrics.describe("admission_queue_wait_seconds", "summary", "Time admitted requests waited for a slot")
+
+
+class Overloaded(Exception):
+    """No slot within the queue budget, reason is queue_full or timeout"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class RouteLimit:
+    """Concurrency slots for one route, handed to waiters in arrival order"""
+
+    def __init__(self, path: str, concurrency: int, queue_budget: float, max_waiting: int = None):
+        if concurrency < 1:
+            raise ValueError(f"Admission limit for {path} needs at least one slot")
+        self.path = path
+        self.concurrency = concurrency
+        self.queue_budget = queue_budget
+        self.max_waiting = concurrency * 4 if max_waiting is None else max_waiting
+        self.active = 0
+        self._waiters = collections.deque()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    async def acquire(self):
+        """Take a slot, or raise Overloaded"""
+        if self.active < self.concurrency and not self.waiting:
+            self.active += 1
+            return
+        if self.waiting >= self.max_waiting:
+            raise Overloaded("queue_full")
+
+        # A plain future per waiter rather than an asyncio.Semaphore, which
+        # binds to the first event loop it sees
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_budget)
+        except asyncio.TimeoutError:
+            raise Overloaded("timeout")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # Handed a slot just as we were cancelled, pass it on
+            raise
+        finally:
+            if waiter in self._waiters and waiter.done():
+                self._waiters.remove(waiter)
+
+    def release(self):
+        """Give the slot to the next waiter, or free it"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # The slot changes hands, active stays the same
+                return
+        self.active -= 1
+
+
+def parse_limits(spec: str) -> dict:
+    """Parse ADMISSION_LIMITS, e.g. "/login=8:1,/register=4:1.5", into {path: RouteLimit}"""
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        path, _, limit = item.strip().partition("=")
+        concurrency, _, budget = limit.partition(":")
+        limits[path] = RouteLimit(path, int(concurrency), float(budget or 1))
+    return limits
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that sheds requests to limited routes instead of queueing them"""
+
+    def __init__(self, app, limits: dict, retry_after: int = 2):
+        self.app = app
+        self.limits = limits
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        try:
+            await limit.acquire()
+        except Overloaded as exc:
+            metrics.inc("http_requests_shed_total", {"route": limit.path, "reason": exc.reason})
+            logger.info(f"Shedding {scope['method']} {limit.path}: {exc.reason} ({limit.active} running, {limit.waiting} waiting)")
+            response = JSONResponse(
+                {"detail": "Server is busy, please try again shortly"},
+                status_code=503,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        metrics.observe("admission_queue_wait_seconds", time.perf_counter() - started_at, {"route": limit.path})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.release()
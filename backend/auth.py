@@ -4,7 +4,8 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from database import get_db
+from typing import Optional
+from database import get_db, replica_router, SessionLocal
 from crud import get_user_by_email
 from config import settings
 
@@ -15,6 +16,7 @@ ACCESS_TOKEN_EXPIRE_MINUTES = settings.JWT_EXPIRATION_HOURS * 60
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -32,6 +34,18 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_access_token(token: str) -> Optional[dict]:
+    """Claims of a valid, unexpired token, or None"""
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+def get_token_subject(token: str) -> Optional[str]:
+    """Email the token was issued for, or None if it is invalid"""
+    payload = decode_access_token(token)
+    return payload.get("sub") if payload else None
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
@@ -42,16 +56,61 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    email = get_token_subject(credentials.credentials)
+    if email is None:
         raise credentials_exception
     
     user = get_user_by_email(db, email=email)
     if user is None:
         raise credentials_exception
     
-    return user
\ No newline at end of file
+    return user
+
+def get_current_reviewer(current_user = Depends(get_current_user)):
+    """Only accounts listed in REVIEWER_EMAILS may use the review endpoints"""
+    if current_user.email.lower() not in settings.reviewer_emails:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Reviewer access required",
+        )
+    return current_user
+
+def get_read_db(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db)
+):
+    """
+    Session for read-only endpoints
+    Uses a read replica when one is configured and healthy, unless the caller
+    wrote something moments ago (read-your-own-writes stays on the primary)
+    """
+    email = get_token_subject(credentials.credentials) if credentials else None
+    replica = None if replica_router.wrote_recently(email) else replica_router.pick()
+    if replica is None:
+        yield db
+        return
+    
+    replica_db = SessionLocal(bind=replica)
+    try:
+        yield replica_db
+    finally:
+        replica_db.close()
+
+def get_current_reader(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    read_db: Session = Depends(get_read_db),
+    db: Session = Depends(get_db)
+):
+    """Same as get_current_user, but looks the user up on a read replica"""
+    email = get_token_subject(credentials.credentials)
+    user = get_user_by_email(read_db, email=email) if email else None
+    if user is None and email and read_db is not db:
+        # Just registered and the replica hasn't caught up yet
+        user = get_user_by_email(db, email=email)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
@@ -0,0 +1,224 @@
+"""
+Similar photo lookup benchmark: multi-index chunks against a linear scan
+
+    PYTHONPATH=. python benchmarks/bench_photos.py --rows 1000000
+    PYTHONPATH=. python benchmarks/bench_photos.py --photos --rows 200000
+    PYTHONPATH=. python benchmarks/bench_photos.py --photos --database-url postgresql://localhost/ibuyer_bench
+
+Fills a scratch database with perceptual hashes plus families of near copies
+(a few bits flipped, like recompressed reposts) and times "photos within k
+bits" with find_similar_photos, with a full table scan, and with a scan over
+hashes already loaded in memory (the best case for a linear scan).
+
+Random hashes spread evenly over the chunk indexes, real photos don't: with
+--photos every hash comes from a rendered room (lit wall, furniture, windows),
+whose plain ceiling and floor strips give a few very common chunk values, which
+lookups leave out (photohash.probe_plan). Unrelated rooms end up around 28
+bits apart, "unrelated" is the share of random pairs within the distance.
+Lookups are compared with the scan: "recall" is the share of its matches found,
+"copies" the share of the query photo's reposted copies found, "candidates" the
+rows the probes read - recall is below 100% only where a probe ran into the
+--cap backstop.
+Never point --database-url at a real database, the tables are dropped first.
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+os.environ.setdefault("METRICS_BACKEND", "memory")
+os.environ.setdefault("EVENTS_BACKEND", "memory")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+from sqlalchemy import create_engine, insert, select, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import photohash  # noqa: E402
+from crud import common_chunk_values, find_similar_photos  # noqa: E402
+from database import Base, PropertyApplication, PropertyPhoto, User  # noqa: E402
+
+COPIES_PER_FAMILY = 5
+MAX_COPY_BITS = 4
+
+
+def room_photo_hash(rng):
+    """dHash of a small rendered room: lit wall, furniture and windows, maybe a plain ceiling and floor"""
+    width, height = 72, 64
+    if rng.random() < 0.7:
+        image = Image.linear_gradient("L").rotate(rng.randrange(360)).resize((width, height))
+    else:
+        image = Image.new("L", (width, height), rng.randrange(60, 240))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randrange(4, 12)):
+        x, y = rng.randrange(-10, width), rng.randrange(height)
+        box = [x, y, x + rng.randrange(4, 30), y + rng.randrange(4, 30)]
+        (draw.ellipse if rng.random() < 0.3 else draw.rectangle)(box, fill=rng.randrange(256))
+    # Plain strips hash to runs of 0s: the common chunk values
+    if rng.random() < 0.5:
+        draw.rectangle([0, 0, width, rng.randrange(8, 17)], fill=rng.randrange(150, 256))
+    if rng.random() < 0.4:
+        draw.rectangle([0, rng.randrange(48, 57), width, height], fill=rng.randrange(40, 160))
+    image = image.filter(ImageFilter.GaussianBlur(rng.random() * 1.5))
+    buffer = io.BytesIO()
+    image.save(buffer, "BMP")
+    return photohash.dhash(buffer)
+
+
+def fake_hashes(count, seed=42, photos=False):
+    """(hash, family base or None); one row in ten is a copy of a family photo"""
+    rng = random.Random(seed)
+    bases = []
+    for _ in range(count):
+        if bases and rng.random() < 0.1:
+            base = rng.choice(bases)
+            flipped = rng.sample(range(64), rng.randint(0, MAX_COPY_BITS))
+            yield base ^ sum(1 << bit for bit in flipped), base
+        else:
+            value = room_photo_hash(rng) if photos else rng.getrandbits(64)
+            if len(bases) < count // (10 * COPIES_PER_FAMILY) and photohash.is_detailed(value):
+                bases.append(value)
+            yield value, None
+
+
+def fill(engine, rows, photos=False, batch_size=20000):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        user_id = connection.execute(
+            insert(User).values(email="bench@example.com", hashed_password="x", full_name="Bench", phone_number="0")
+        ).inserted_primary_key[0]
+        application_id = connection.execute(insert(PropertyApplication).values(
+            user_id=user_id, property_type="CONDO", project_name="Bench", province="Bangkok",
+            property_address="Room 1", property_size_sqm=35, bedrooms=1, bathrooms=1, asking_price=1e6,
+            property_condition="good", preferred_timeline="flexible", status="SUBMITTED",
+        )).inserted_primary_key[0]
+
+    started_at = time.perf_counter()
+    batch, bases = [], set()
+    for value, base in fake_hashes(rows, photos=photos):
+        if base is not None:
+            bases.add(base)
+        # Like tasks.media.hash_property_photo: flat photos get no chunks
+        chunk_0, chunk_1, chunk_2, chunk_3 = photohash.chunks(value) if photohash.is_detailed(value) else [None] * 4
+        batch.append({
+            "application_id": application_id, "photo_name": "photo.jpg", "file_path": "/bench/photo.jpg",
+            "file_size": 1, "perceptual_hash": photohash.to_signed(value),
+            "hash_chunk_0": chunk_0, "hash_chunk_1": chunk_1, "hash_chunk_2": chunk_2, "hash_chunk_3": chunk_3,
+        })
+        if len(batch) == batch_size:
+            with engine.begin() as connection:
+                connection.execute(insert(PropertyPhoto), batch)
+            batch = []
+    if batch:
+        with engine.begin() as connection:
+            connection.execute(insert(PropertyPhoto), batch)
+    if engine.dialect.name == "postgresql":
+        # pg_stats holds the common chunk values, autovacuum would get there eventually
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("ANALYZE property_photos"))
+    return time.perf_counter() - started_at
+
+
+def hashing_speed(repeats=5):
+    """ms to hash one 12 megapixel JPEG"""
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "photo.jpg")
+        image = Image.linear_gradient("L").resize((4000, 3000)).convert("RGB")
+        ImageDraw.Draw(image).rectangle([800, 600, 2400, 2000], fill=(200, 80, 40))
+        image.save(path, "JPEG", quality=85)
+        started_at = time.perf_counter()
+        for _ in range(repeats):
+            photohash.dhash(path)
+        return (time.perf_counter() - started_at) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--distances", type=int, nargs="+", default=[4, 6, 8, 10])
+    parser.add_argument("--photos", action="store_true", help="Hashes of rendered rooms instead of random values")
+    parser.add_argument("--cap", type=int, default=photohash.MAX_CANDIDATES_PER_CHUNK,
+                        help="Rows a probe reads at most, 0 for no cap")
+    parser.add_argument("--database-url", default=None, help="Scratch database, defaults to a temporary SQLite file")
+    parser.add_argument("--skip-fill", action="store_true", help="Reuse the rows from a previous run")
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.gettempdir(), 'ibuyer_photos_bench.db')}"
+    engine = create_engine(url)
+    Session = sessionmaker(bind=engine)
+    cap = args.cap or args.rows
+
+    print(f"Hashing a 12 MP JPEG: {hashing_speed():.1f} ms")
+    if not args.skip_fill:
+        print(f"Filling {args.rows:,} {'photo' if args.photos else 'random'} hashes into {engine.url!r} ...")
+        print(f"  took {fill(engine, args.rows, photos=args.photos):.1f}s")
+
+    db = Session()
+    started_at = time.perf_counter()
+    rows = db.execute(select(
+        PropertyPhoto.perceptual_hash, PropertyPhoto.hash_chunk_0, PropertyPhoto.hash_chunk_1,
+        PropertyPhoto.hash_chunk_2, PropertyPhoto.hash_chunk_3,
+    )).all()
+    table_scan_ms = (time.perf_counter() - started_at) * 1000
+    all_hashes = [photohash.to_unsigned(row[0]) for row in rows if row[1] is not None]
+    buckets = [Counter(row[index] for row in rows if row[index] is not None) for index in range(1, 5)]
+    for index, bucket in enumerate(buckets):
+        value, count = bucket.most_common(1)[0]
+        print(f"  chunk {index}: {len(bucket):,} distinct values, most common {value:#06x} in {count / len(rows):.0%} of rows")
+    common = common_chunk_values(db)
+
+    # Query with family photos, so there is something to find
+    rng = random.Random(7)
+    families = {}
+    for value, base in fake_hashes(args.rows, photos=args.photos):
+        if base is not None:
+            families.setdefault(base, set()).add(value)
+    queries = rng.sample(sorted(families), min(args.queries, len(families)))
+    pairs = [(rng.choice(all_hashes) ^ rng.choice(all_hashes)).bit_count() for _ in range(20000)]
+
+    print(f"{'distance':>8} {'matches':>8} {'unrelated':>10} {'recall':>7} {'copies':>7} {'candidates':>11} {'index p50 ms':>13} "
+          f"{'index p95 ms':>13} {'memory scan ms':>15} {'table scan ms':>14}")
+    for distance in args.distances:
+        timings, scans, candidates, matches, expected_matches, copies, copies_found = [], [], [], 0, 0, 0, 0
+        for query in queries:
+            started_at = time.perf_counter()
+            found = find_similar_photos(db, query, distance, limit=args.rows, candidates_per_chunk=cap)
+            timings.append((time.perf_counter() - started_at) * 1000)
+
+            started_at = time.perf_counter()
+            expected = [value for value in all_hashes if (value ^ query).bit_count() <= distance]
+            scans.append((time.perf_counter() - started_at) * 1000)
+
+            candidates.append(sum(
+                min(cap, sum(buckets[index][value] for value in values))
+                for index, values in photohash.probe_plan(query, distance, common)
+            ))
+            found_hashes = [photohash.to_unsigned(photo.perceptual_hash) for photo, _ in found]
+            assert set(found_hashes) <= set(expected), f"index found non-matches for {query:016x} at {distance}"
+            if cap >= args.rows:
+                assert sorted(found_hashes) == sorted(expected), f"index and scan disagree for {query:016x} at {distance}"
+            matches += len(found)
+            expected_matches += len(expected)
+            copies += len(families[query])
+            copies_found += len(families[query] & set(found_hashes))
+        timings.sort()
+        print(
+            f"{distance:>8} {matches / len(queries):>8.1f} "
+            f"{sum(bits <= distance for bits in pairs) / len(pairs):>10.2%} {matches / max(expected_matches, 1):>7.1%} "
+            f"{copies_found / max(copies, 1):>7.1%} "
+            f"{statistics.mean(candidates):>11,.0f} {statistics.median(timings):>13.2f} "
+            f"{timings[max(0, int(len(timings) * 0.95) - 1)]:>13.2f} {statistics.median(scans):>15.1f} "
+            f"{table_scan_ms + statistics.median(scans):>14.1f}"
+        )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
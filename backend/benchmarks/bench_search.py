@@ -0,0 +1,137 @@
+"""
+Review console search benchmark
+
+    PYTHONPATH=. python benchmarks/bench_search.py --rows 1000000
+    PYTHONPATH=. python benchmarks/bench_search.py --database-url postgresql://localhost/ibuyer_bench
+
+Fills a scratch database with synthetic applications (Thai and English
+project names and addresses), builds the search indexes the way a deploy does
+(migrate.py, Postgres only) and reports search latency percentiles.
+Never point --database-url at a real database, the tables are dropped first.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("METRICS_BACKEND", "memory")
+os.environ.setdefault("EVENTS_BACKEND", "memory")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import crud  # noqa: E402
+from crud import search_applications  # noqa: E402
+from database import Base, PropertyApplication, User  # noqa: E402
+from migrate import run_migrations  # noqa: E402
+from search import search_document  # noqa: E402
+
+PROJECTS = [
+    "Noble Remix", "Rhythm Ekkamai", "The Line Sukhumvit", "Life Asoke", "Ideo Mobi",
+    "Supalai Oriental", "Park 24", "Quinn Condo", "Aspire Rama 9", "Lumpini Place",
+    "ศุภาลัย โอเรียนทัล", "ลุมพินี วิลล์", "เดอะ ไลน์ จตุจักร", "ไอดีโอ โมบิ", "พลัม คอนโด",
+]
+STREETS = [
+    "Sukhumvit", "Rama 9", "Phahonyothin", "Ratchadaphisek", "Silom", "Sathorn", "Charoen Krung",
+    "สุขุมวิท", "พระราม 9", "พหลโยธิน", "รัชดาภิเษก", "สีลม", "สาทร", "เจริญกรุง",
+]
+PROVINCES = ["Bangkok", "Nonthaburi", "Chiang Mai", "Phuket", "กรุงเทพมหานคร", "เชียงใหม่"]
+QUERIES = ["Sukhumvit 39", "noble", "ekka", "สุขุมวิท", "ศุภาลัย", "rama 9 room 1203", "ลุมพินี วิลล์ สาทร"]
+
+
+def fake_rows(count, user_id, seed=42):
+    rng = random.Random(seed)
+    for _ in range(count):
+        project = rng.choice(PROJECTS)
+        street = rng.choice(STREETS)
+        address = f"Room {rng.randint(1, 3000)}, {street} Soi {rng.randint(1, 101)}"
+        if rng.random() < 0.4:
+            address = f"ห้อง {rng.randint(1, 3000)} ซอย{street} {rng.randint(1, 101)}"
+        province = rng.choice(PROVINCES)
+        yield {
+            "user_id": user_id,
+            "property_type": "CONDO",
+            "project_name": project,
+            "province": province,
+            "property_address": address,
+            "property_size_sqm": rng.uniform(25, 150),
+            "bedrooms": rng.randint(1, 4),
+            "bathrooms": rng.randint(1, 3),
+            "asking_price": rng.uniform(1e6, 2e7),
+            "property_condition": "good",
+            "preferred_timeline": "flexible",
+            "status": "SUBMITTED",
+            "search_text": search_document(project, address, province),
+        }
+
+
+def fill(engine, rows, batch_size=20000):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        user_id = connection.execute(
+            insert(User).values(email="bench@example.com", hashed_password="x", full_name="Bench", phone_number="0")
+        ).inserted_primary_key[0]
+    batch = []
+    started_at = time.perf_counter()
+    for row in fake_rows(rows, user_id):
+        batch.append(row)
+        if len(batch) == batch_size:
+            with engine.begin() as connection:
+                connection.execute(insert(PropertyApplication), batch)
+            batch = []
+    if batch:
+        with engine.begin() as connection:
+            connection.execute(insert(PropertyApplication), batch)
+    # Indexes after the rows, like on a database that grew before search shipped
+    run_migrations(engine)
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("ANALYZE property_applications"))
+    return time.perf_counter() - started_at
+
+
+def measure(Session, query, repeats):
+    timings = []
+    for _ in range(repeats):
+        db = Session()
+        started_at = time.perf_counter()
+        hits = search_applications(db, query, limit=21)
+        timings.append((time.perf_counter() - started_at) * 1000)
+        db.close()
+    timings.sort()
+    return len(hits), statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--database-url", default=None, help="Scratch database, defaults to a temporary SQLite file")
+    parser.add_argument("--skip-fill", action="store_true", help="Reuse the rows from a previous run")
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.gettempdir(), 'ibuyer_search_bench.db')}"
+    engine = create_engine(url)
+    Session = sessionmaker(bind=engine)
+
+    if not args.skip_fill:
+        print(f"Filling and indexing {args.rows:,} applications into {engine.url!r} ...")
+        print(f"  took {fill(engine, args.rows):.1f}s")
+    if engine.dialect.name == "postgresql":
+        db = Session()
+        print(f"  pg_trgm indexes: {'yes' if crud.has_trigrams(db) else 'no, typo matching not measured'}")
+        db.close()
+
+    print(f"{'query':<24} {'hits':>5} {'p50 ms':>8} {'p95 ms':>8}")
+    for query in QUERIES:
+        hits, p50, p95 = measure(Session, query, args.repeats)
+        print(f"{query:<24} {hits:>5} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Production server benchmark: throughput and memory per worker count
+
+    PYTHONPATH=. python benchmarks/bench_server.py --workers 1 2 4 --seconds 10
+
+Starts server.py on a scratch SQLite database for each worker count (also
+without preloading, with --no-preload) and drives it with concurrent keep-alive clients:
+GET /api/health and an authenticated GET /my-applications. Reports requests
+per second, latency percentiles, and memory as RSS and PSS (PSS splits pages
+shared between the forked workers, so it shows what preloading saves).
+The load generator runs on the same machine, so keep --clients modest.
+"""
+import argparse
+import collections
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+from config import settings  # noqa: E402
+
+LAUNCH = """
+import json, sys
+import server
+options = server.gunicorn_options()
+options.update(json.loads(sys.argv[1]))
+server.Server(options).run()
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_tree(pid):
+    pids = [pid]
+    for child in _read(f"/proc/{pid}/task/{pid}/children").split():
+        pids.extend(process_tree(int(child)))
+    return pids
+
+
+def memory_mb(pid):
+    """(RSS, PSS) of the master and all its workers, in MB"""
+    rss = pss = 0
+    for member in process_tree(pid):
+        for line in _read(f"/proc/{member}/smaps_rollup").splitlines():
+            if line.startswith("Rss:"):
+                rss += int(line.split()[1])
+            elif line.startswith("Pss:"):
+                pss += int(line.split()[1])
+    return rss / 1024, pss / 1024
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def start_server(workers, preload, max_requests, database_url):
+    port = free_port()
+    env = dict(
+        os.environ,
+        PYTHONPATH=BACKEND,
+        DATABASE_URL=database_url,
+        METRICS_BACKEND="memory",
+        EVENTS_BACKEND="memory",
+        DEBUG="false",
+        HOST="127.0.0.1",
+        PORT=str(port),
+        WEB_CONCURRENCY=str(workers),
+    )
+    options = {"preload_app": preload, "max_requests": max_requests, "loglevel": "error"}
+    process = subprocess.Popen([sys.executable, "-c", LAUNCH, json.dumps(options)], cwd=BACKEND, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline and process.poll() is None:
+        try:
+            if httpx.get(f"{url}/api/health").status_code == 200:
+                break
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    else:
+        process.kill()
+        raise RuntimeError(f"server exited with code {process.poll()}" if process.poll() else "server did not start")
+    time.sleep(1)  # Let every worker finish booting
+    return process, url
+
+
+def login(url):
+    user = {"email": "bench@example.com", "password": "benchpass123", "full_name": "Bench", "phone_number": "+66800000000"}
+    httpx.post(f"{url}/register", json=user)
+    token = httpx.post(f"{url}/login", json={"email": user["email"], "password": user["password"]}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def drive(url, path, headers, clients, seconds):
+    latencies, errors = [], collections.Counter()
+    stop = time.perf_counter() + seconds
+
+    def client():
+        with httpx.Client(base_url=url, headers=headers, timeout=30) as http:
+            while time.perf_counter() < stop:
+                started = time.perf_counter()
+                try:
+                    status = http.get(path).status_code
+                    if status != 200:
+                        errors[f"HTTP {status}"] += 1
+                except httpx.HTTPError as exc:
+                    errors[type(exc).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return {
+        "rps": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": dict(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--no-preload", action="store_true", help="Also measure without preloading")
+    parser.add_argument("--max-requests", type=int, nargs="+", default=[settings.WEB_MAX_REQUESTS],
+                        help="Worker recycling settings to compare, 0 turns recycling off")
+    args = parser.parse_args()
+
+    print(f"CPUs available: {len(os.sched_getaffinity(0))}, clients: {args.clients}, {args.seconds:g}s per run")
+    print(f"{'workers':>7} {'preload':>7} {'max req':>7} {'RSS MB':>7} {'PSS MB':>7} "
+          f"{'endpoint':<17} {'req/s':>7} {'p50 ms':>7} {'p99 ms':>7}")
+    for workers in args.workers:
+        for preload in ([True, False] if args.no_preload else [True]):
+            for max_requests in args.max_requests:
+                setup = f"{workers:>7} {str(preload):>7} {max_requests:>7}"
+                with tempfile.TemporaryDirectory() as scratch:
+                    try:
+                        process, url = start_server(workers, preload, max_requests, f"sqlite:///{scratch}/bench.db")
+                    except RuntimeError as exc:
+                        print(f"{setup}  {exc}")
+                        continue
+                    try:
+                        try:
+                            headers = login(url)
+                        except httpx.HTTPError as exc:
+                            # e.g. without preloading every worker runs create_all, SQLite lets only one win
+                            print(f"{setup}  server stopped: {exc}")
+                            continue
+                        rss, pss = memory_mb(process.pid)
+                        for path, auth in (("/api/health", {}), ("/my-applications", headers)):
+                            result = drive(url, path, auth, args.clients, args.seconds)
+                            print(
+                                f"{setup} {rss:>7.0f} {pss:>7.0f} {path:<17} "
+                                f"{result['rps']:>7.0f} {result['p50_ms']:>7.1f} {result['p99_ms']:>7.1f}"
+                                + (f"  errors: {result['errors']}" if result["errors"] else "")
+                            )
+                    finally:
+                        process.send_signal(signal.SIGTERM)
+                        process.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    main()
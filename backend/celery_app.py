@@ -3,13 +3,25 @@ Minimal Celery configuration for iBuyer
 Just like Sidekiq - handles background jobs
 """
 from celery import Celery
-import os
+from celery.schedules import crontab
+from kombu import Queue
+
+from config import settings
+
+# Queues, in the order a worker consuming several of them drains them.
+# Transactional email comes first so it never waits behind batch work.
+TASK_QUEUES = ('email', 'media', 'valuation', 'maintenance')
+
+# Message priorities - on Redis 0 is the highest and 9 the lowest
+PRIORITY_HIGH = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_LOW = 9
 
 # Create Celery instance
 celery_app = Celery(
     'ibuyer',
-    broker=os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
-    include=['tasks.email']  # Just one task module for now
+    broker=settings.REDIS_URL,
+    include=['tasks.email', 'tasks.maintenance', 'tasks.media']
 )
 
 # Basic configuration with memory optimization
@@ -28,15 +40,62 @@ celery_app.conf.update(
     # Memory optimization settings
     worker_max_tasks_per_child=100,  # Restart worker after 100 tasks to prevent memory leaks
     worker_prefetch_multiplier=1,    # Only fetch one task at a time
-    worker_concurrency=1,             # Use only 1 worker process (lowest memory usage)
+    # Pool type and concurrency come from the worker profile, see worker.py
     worker_disable_rate_limits=True,  # Disable rate limiting to save memory
     
-    # Redis connection pooling
+    # Queue topology: one queue per kind of work so a slow media or valuation
+    # job can't hold up a welcome email
+    task_queues=[Queue(name, routing_key=name) for name in TASK_QUEUES],
+    task_default_queue='maintenance',  # Unrouted tasks go to the batch queue
+    task_default_priority=PRIORITY_DEFAULT,
+    task_routes={
+        'tasks.email.*': {'queue': 'email'},
+        'tasks.media.*': {'queue': 'media'},
+        'tasks.valuation.*': {'queue': 'valuation'},
+        'tasks.maintenance.*': {'queue': 'maintenance', 'priority': PRIORITY_LOW},
+    },
+    broker_transport_options={
+        'priority_steps': list(range(10)),   # Honour every priority level, not just 0/3/6/9
+        'sep': ':',
+        'queue_order_strategy': 'priority',  # Drain queues in the order given to -Q
+        'max_connections': settings.BROKER_POOL_LIMIT,
+        'socket_connect_timeout': 2,
+    },
+    
+    # Redis connection pooling: sized for the API's request threads publishing
+    # at once (through enqueue.py); a worker only uses one or two of them
     broker_connection_retry_on_startup=True,
-    broker_pool_limit=1,              # Minimal connection pool
-    redis_max_connections=2,          # Limit Redis connections
+    broker_pool_limit=settings.BROKER_POOL_LIMIT,
+    broker_connection_timeout=2,      # Fail over to the enqueue journal quickly
     
     # Result backend optimization (we don't really need results stored)
     result_expires=300,               # Results expire after 5 minutes
     result_backend=None,              # Don't store results at all to save memory
-)
\ No newline at end of file
+    
+    # Task events for Flower (queue wait and run time show up per task)
+    worker_send_task_events=True,
+    task_send_sent_event=True,
+    
+    # Scheduled jobs, run by the one worker started with CELERY_BEAT=true
+    beat_schedule={
+        'archive-finished-applications': {
+            'task': 'tasks.maintenance.archive_finished_applications',
+            'schedule': crontab(hour=3, minute=30),  # Quiet hours, Bangkok time
+        },
+        'process-due-applications': {
+            'task': 'tasks.maintenance.process_due_applications',
+            'schedule': 60.0,  # Offer expiry and review SLA, see database.DUE_*
+        },
+        'ingest-pending-documents': {
+            'task': 'tasks.media.ingest_pending_documents',
+            'schedule': crontab(minute='*/10'),
+        },
+        'hash-pending-photos': {
+            'task': 'tasks.media.hash_pending_photos',
+            'schedule': crontab(minute='5-59/10'),  # Between the document sweeps
+        },
+    },
+)
+
+# Metrics and trace id propagation hooks (see task_monitoring.py)
+import task_monitoring  # noqa: E402,F401
\ No newline at end of file
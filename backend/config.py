@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import List, Optional
 
 class Settings:
     # Database
@@ -8,6 +8,12 @@ class Settings:
         "postgresql://denis@localhost/ibuyer_db"
     )
     
+    # Read replicas for read-only endpoints, comma separated (optional)
+    DATABASE_REPLICA_URLS: str = os.getenv("DATABASE_REPLICA_URLS", "")
+    REPLICA_HEALTH_CHECK_SECONDS: float = float(os.getenv("REPLICA_HEALTH_CHECK_SECONDS", "30"))
+    READ_YOUR_WRITES_SECONDS: float = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+    REPLICA_CONNECT_TIMEOUT_SECONDS: int = int(os.getenv("REPLICA_CONNECT_TIMEOUT_SECONDS", "2"))
+    
     # Security
     SECRET_KEY: str = os.getenv(
         "SECRET_KEY",
@@ -16,6 +22,9 @@ class Settings:
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_HOURS: int = 24
     
+    # Accounts allowed to use the review endpoints, comma separated
+    REVIEWER_EMAILS: str = os.getenv("REVIEWER_EMAILS", "")
+    
     # Application
     APP_NAME: str = "IBuyer Thailand"
     APP_VERSION: str = "1.0.0"
@@ -32,6 +41,19 @@ class Settings:
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
     
+    # Production server (see server.py): worker count defaults to the CPU quota, capped by memory
+    WEB_CONCURRENCY: Optional[str] = os.getenv("WEB_CONCURRENCY")
+    WEB_MAX_REQUESTS: int = int(os.getenv("WEB_MAX_REQUESTS", "5000"))     # Recycle a worker after this many, 0 = never
+    WEB_WORKER_MEMORY_MB: int = int(os.getenv("WEB_WORKER_MEMORY_MB", "60"))  # Per preloaded worker, see DEPLOYMENT.md
+    WEB_MASTER_MEMORY_MB: int = int(os.getenv("WEB_MASTER_MEMORY_MB", "100"))
+    
+    # Admission control (see admission.py), per worker: path=concurrency:queue budget in seconds
+    ADMISSION_LIMITS: str = os.getenv(
+        "ADMISSION_LIMITS",
+        "/login=4:1,/register=2:1,/submit-property-with-registration=2:2"
+    )
+    ADMISSION_RETRY_AFTER_SECONDS: int = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "2"))
+    
     # Email (for future implementation)
     SMTP_HOST: Optional[str] = os.getenv("SMTP_HOST")
     SMTP_PORT: Optional[int] = int(os.getenv("SMTP_PORT", "587"))
@@ -39,10 +61,59 @@ class Settings:
     SMTP_PASSWORD: Optional[str] = os.getenv("SMTP_PASSWORD")
     EMAIL_FROM: str = os.getenv("EMAIL_FROM", "noreply@ibuyer-thailand.com")
     
+    # Redis (Celery broker, shared metrics)
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    
+    # Metrics: "redis" shares values between API processes and workers, "memory" is per process
+    METRICS_BACKEND: str = os.getenv("METRICS_BACKEND", "redis")
+    
+    # Live dashboard events: "redis" fans out across processes, "memory" is per process
+    EVENTS_BACKEND: str = os.getenv("EVENTS_BACKEND", "redis")
+    
+    # Publishing tasks from the API (see enqueue.py): "async" hands messages to a
+    # background thread, "sync" publishes in the request. Both journal to disk while Redis is down,
+    # in a directory that must survive restarts (a volume in Docker, see DEPLOYMENT.md)
+    ENQUEUE_MODE: str = os.getenv("ENQUEUE_MODE", "async")
+    ENQUEUE_JOURNAL_DIR: str = os.getenv("ENQUEUE_JOURNAL_DIR", "/var/lib/ibuyer/enqueue")
+    ENQUEUE_JOURNAL_MAX_MB: int = int(os.getenv("ENQUEUE_JOURNAL_MAX_MB", "50"))
+    # Broker connections per process, shared by all request threads
+    BROKER_POOL_LIMIT: int = int(os.getenv("BROKER_POOL_LIMIT", "10"))
+    
+    # Celery worker (see worker.py for the available profiles)
+    CELERY_WORKER_PROFILE: str = os.getenv("CELERY_WORKER_PROFILE", "solo")
+    CELERY_QUEUES: Optional[str] = os.getenv("CELERY_QUEUES")          # e.g. "email" or "media,valuation"
+    CELERY_CONCURRENCY: Optional[str] = os.getenv("CELERY_CONCURRENCY")
+    CELERY_AUTOSCALE: Optional[str] = os.getenv("CELERY_AUTOSCALE")    # "max,min", prefork only
+    
+    # Review promised in the confirmation email, and how long an offer stays open
+    REVIEW_SLA_HOURS: int = int(os.getenv("REVIEW_SLA_HOURS", "24"))
+    OFFER_VALID_DAYS: int = int(os.getenv("OFFER_VALID_DAYS", "7"))
+    
+    # Run Celery beat inside this worker (scheduled jobs). Enable it on exactly one worker
+    CELERY_BEAT: bool = os.getenv("CELERY_BEAT", "false").lower() == "true"
+    
+    # Finished (completed / declined) applications move to the archive tables after this long
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+    
+    # Document ingestion limits, per document
+    DOCUMENT_EXTRACTION_TIMEOUT_SECONDS: float = float(os.getenv("DOCUMENT_EXTRACTION_TIMEOUT_SECONDS", "60"))
+    DOCUMENT_EXTRACTION_MEMORY_MB: int = int(os.getenv("DOCUMENT_EXTRACTION_MEMORY_MB", "512"))
+    
+    # Photos whose perceptual hashes differ in at most this many of 64 bits count as the same picture
+    PHOTO_MATCH_DISTANCE: int = int(os.getenv("PHOTO_MATCH_DISTANCE", "6"))
+    
     @property
     def is_production(self) -> bool:
         return not self.DEBUG
     
+    @property
+    def database_replica_urls(self) -> List[str]:
+        return [url.strip() for url in self.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+    
+    @property
+    def reviewer_emails(self) -> List[str]:
+        return [email.strip().lower() for email in self.REVIEWER_EMAILS.split(",") if email.strip()]
+    
     @property
     def database_url_with_pool(self) -> str:
         """Add connection pooling settings for production"""
@@ -1,6 +1,19 @@
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import case, literal, select, union_all, update, func, or_, text, Integer, Float, String, DateTime
 from sqlalchemy.orm import Session
-from database import User, PropertyApplication
+from config import settings
+from database import (
+    User, PropertyApplication, PropertyPhoto, ArchivedPropertyApplication, ApplicationStatus, ALLOWED_TRANSITIONS,
+    DUE_REVIEW_SLA, DUE_OFFER_EXPIRY,
+)
 from models import UserCreate, PropertyApplicationCreate
+from search import search_document, search_phrases
+from dedup import listing_fingerprint
+import photohash
+
+# How long a process keeps using the same common chunk values
+STOP_LIST_SECONDS = 600
 
 def get_user_by_email(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
@@ -17,25 +30,314 @@ def create_user(db: Session, user: UserCreate, hashed_password: str):
     db.refresh(db_user)
     return db_user
 
+def find_duplicate_of(db: Session, fingerprint):
+    """Id of the first application with this fingerprint, if any"""
+    if fingerprint is None:
+        return None
+    first = (
+        db.query(PropertyApplication.id, PropertyApplication.duplicate_of_id)
+        .filter(PropertyApplication.fingerprint == fingerprint)
+        .order_by(PropertyApplication.id)
+        .first()
+    )
+    if first is None:
+        return None
+    return first.duplicate_of_id or first.id
+
+_chunk_stop_lists = {}
+
+def common_chunk_values(db: Session) -> dict:
+    """
+    {chunk index: ({value: share of photos}, share of any other value)} for
+    the most common values of each chunk column, refreshed every
+    STOP_LIST_SECONDS. Postgres keeps these in pg_stats (filled by ANALYZE),
+    other databases count them.
+    """
+    url = str(db.get_bind().url)
+    cached = _chunk_stop_lists.get(url)
+    if cached is not None and time.monotonic() - cached[0] < STOP_LIST_SECONDS:
+        return cached[1]
+
+    common = {}
+    if db.get_bind().dialect.name == "postgresql":
+        rows = db.execute(text(
+            "SELECT attname, most_common_vals::text::integer[], most_common_freqs, null_frac, n_distinct, "
+            "(SELECT reltuples FROM pg_class WHERE oid = 'property_photos'::regclass) FROM pg_stats "
+            "WHERE schemaname = current_schema() AND tablename = 'property_photos' AND attname LIKE 'hash_chunk_%'"
+        ))
+        for name, values, shares, null_share, distinct, total in rows:
+            values, shares = values or [], shares or []
+            # A negative n_distinct is a share of the rows
+            distinct = -distinct * total if distinct < 0 else distinct
+            other = (1 - null_share - sum(shares)) / max(distinct - len(values), 1)
+            common[int(name[-1])] = (dict(zip(values, shares)), max(other, 0))
+    else:
+        total = db.query(func.count(PropertyPhoto.id)).scalar() or 1
+        columns = (PropertyPhoto.hash_chunk_0, PropertyPhoto.hash_chunk_1, PropertyPhoto.hash_chunk_2, PropertyPhoto.hash_chunk_3)
+        for index, column in enumerate(columns):
+            counts = dict(
+                db.query(column, func.count()).filter(column.isnot(None))
+                .group_by(column).order_by(func.count().desc()).limit(100)
+            )
+            hashed, distinct = db.query(func.count(column), func.count(column.distinct())).one()
+            other = (hashed - sum(counts.values())) / max(distinct - len(counts), 1) / total
+            common[index] = ({value: count / total for value, count in counts.items()}, other)
+    _chunk_stop_lists[url] = (time.monotonic(), common)
+    return common
+
+def find_similar_photos(db: Session, photo_hash: int, max_distance: int, exclude_application_id: int = None, limit: int = 50,
+                        candidates_per_chunk: int = photohash.MAX_CANDIDATES_PER_CHUNK):
+    """
+    Photos whose perceptual hash is at most max_distance bits from photo_hash,
+    closest first, as (row, distance) with the row's id, application_id and
+    perceptual_hash. Probes the chunk indexes (see photohash.probe_plan),
+    leaving out chunks whose values are too common to be worth reading, and
+    checks the full distance on the candidates only. A probe that still finds
+    more than candidates_per_chunk rows stops there.
+    """
+    if not photohash.is_detailed(photo_hash):
+        return []
+    columns = (PropertyPhoto.hash_chunk_0, PropertyPhoto.hash_chunk_1, PropertyPhoto.hash_chunk_2, PropertyPhoto.hash_chunk_3)
+    probes = []
+    for index, values in photohash.probe_plan(photo_hash, max_distance, common_chunk_values(db)):
+        probe = select(PropertyPhoto.id, PropertyPhoto.application_id, PropertyPhoto.perceptual_hash).where(columns[index].in_(values))
+        if exclude_application_id is not None:
+            probe = probe.where(PropertyPhoto.application_id != exclude_application_id)
+        probes.append(select(probe.limit(candidates_per_chunk).subquery()))
+    
+    matches, seen = [], set()
+    for row in db.execute(union_all(*probes)):
+        if row.id in seen:
+            continue
+        seen.add(row.id)
+        distance = photohash.hamming(photo_hash, photohash.to_unsigned(row.perceptual_hash))
+        if distance <= max_distance:
+            matches.append((row, distance))
+    matches.sort(key=lambda match: (match[1], match[0].id))
+    return matches[:limit]
+
+def next_due(status: ApplicationStatus, now: datetime):
+    """(due_at, due_action) for an application that just moved to this status"""
+    if status == ApplicationStatus.SUBMITTED:
+        return now + timedelta(hours=settings.REVIEW_SLA_HOURS), DUE_REVIEW_SLA
+    if status == ApplicationStatus.OFFER_MADE:
+        return now + timedelta(days=settings.OFFER_VALID_DAYS), DUE_OFFER_EXPIRY
+    return None, None
+
 def create_property_application(db: Session, application: PropertyApplicationCreate, user_id: int):
+    fingerprint = listing_fingerprint(
+        application.project_name,
+        application.property_type,
+        application.property_size_sqm,
+        application.bedrooms,
+        application.property_address
+    )
+    due_at, due_action = next_due(ApplicationStatus.SUBMITTED, datetime.now(timezone.utc))
     db_application = PropertyApplication(
         user_id=user_id,
         property_type=application.property_type,
+        project_name=application.project_name,
+        province=application.province,
         property_address=application.property_address,
         property_size_sqm=application.property_size_sqm,
         bedrooms=application.bedrooms,
         bathrooms=application.bathrooms,
         asking_price=application.asking_price,
         property_condition=application.property_condition,
-        preferred_timeline=application.preferred_timeline
+        preferred_timeline=application.preferred_timeline,
+        search_text=search_document(application.project_name, application.property_address, application.province),
+        fingerprint=fingerprint,
+        duplicate_of_id=find_duplicate_of(db, fingerprint),
+        due_at=due_at,
+        due_action=due_action
     )
     db.add(db_application)
     db.commit()
     db.refresh(db_application)
     return db_application
 
-def get_user_applications(db: Session, user_id: int):
-    return db.query(PropertyApplication).filter(PropertyApplication.user_id == user_id).all()
+def get_user_applications(db: Session, user_id: int, include_archived: bool = False):
+    applications = db.query(PropertyApplication).filter(PropertyApplication.user_id == user_id).all()
+    if include_archived:
+        applications += (
+            db.query(ArchivedPropertyApplication)
+            .filter(ArchivedPropertyApplication.user_id == user_id)
+            .all()
+        )
+        applications.sort(key=lambda application: application.id)
+    return applications
 
-def get_all_applications(db: Session):
-    return db.query(PropertyApplication).all()
\ No newline at end of file
+def get_all_applications(db: Session, include_archived: bool = False):
+    applications = db.query(PropertyApplication).all()
+    if include_archived:
+        applications += db.query(ArchivedPropertyApplication).all()
+        applications.sort(key=lambda application: application.id)
+    return applications
+
+def bulk_transition_applications(db: Session, transitions):
+    """
+    Move many applications to a new status with a single UPDATE ... RETURNING
+    Transitions are validated against ALLOWED_TRANSITIONS in memory first. The
+    UPDATE only matches rows that are still in the status we validated, so a
+    concurrent change comes back as a rejection instead of being overwritten.
+    
+    Returns (updated, rejected): updated rows as dicts including the seller's
+    email and name, and (application_id, reason) pairs for the rest.
+    """
+    requested = {transition.application_id: transition for transition in transitions}
+    
+    current = {
+        row.id: row
+        for row in db.query(
+            PropertyApplication.id, PropertyApplication.status, User.email, User.full_name
+        ).join(User).filter(PropertyApplication.id.in_(requested))
+    }
+    
+    rejected = []
+    valid = {}
+    for application_id, transition in requested.items():
+        row = current.get(application_id)
+        if row is None:
+            rejected.append((application_id, "Application not found"))
+        elif transition.status not in ALLOWED_TRANSITIONS[row.status]:
+            rejected.append((application_id, f"Cannot move from {row.status.value} to {transition.status.value}"))
+        elif transition.status == ApplicationStatus.OFFER_MADE and not transition.offer_amount:
+            rejected.append((application_id, "offer_amount is required to make an offer"))
+        else:
+            valid[application_id] = transition
+    
+    if not valid:
+        return [], rejected
+    
+    now = datetime.now(timezone.utc)
+    status_type = PropertyApplication.status.type
+    offers = {
+        application_id: transition.offer_amount
+        for application_id, transition in valid.items()
+        if transition.status == ApplicationStatus.OFFER_MADE
+    }
+    
+    values = {
+        "status": case(
+            {application_id: literal(transition.status, status_type) for application_id, transition in valid.items()},
+            value=PropertyApplication.id,
+        ),
+        "updated_at": now,
+    }
+    # Every transition replaces whatever the scheduler was waiting for
+    due = {application_id: next_due(transition.status, now) for application_id, transition in valid.items()}
+    values["due_at"] = case(
+        {application_id: literal(due_at, DateTime(timezone=True)) for application_id, (due_at, _) in due.items()},
+        value=PropertyApplication.id,
+    )
+    values["due_action"] = case(
+        {application_id: literal(action, String) for application_id, (_, action) in due.items()},
+        value=PropertyApplication.id,
+    )
+    if offers:
+        values["offer_amount"] = case(offers, value=PropertyApplication.id, else_=PropertyApplication.offer_amount)
+        values["offer_made_at"] = case((PropertyApplication.id.in_(offers), now), else_=PropertyApplication.offer_made_at)
+    
+    statement = (
+        update(PropertyApplication)
+        .where(
+            PropertyApplication.id.in_(valid),
+            PropertyApplication.status == case(
+                {application_id: literal(current[application_id].status, status_type) for application_id in valid},
+                value=PropertyApplication.id,
+            ),
+        )
+        .values(values)
+        .returning(
+            PropertyApplication.id,
+            PropertyApplication.status,
+            PropertyApplication.offer_amount,
+            PropertyApplication.offer_made_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.execute(statement).all()
+    db.commit()
+    
+    updated = [
+        {
+            "application_id": row.id,
+            "status": row.status,
+            "offer_amount": row.offer_amount,
+            "offer_made_at": row.offer_made_at,
+            "email": current[row.id].email,
+            "full_name": current[row.id].full_name,
+        }
+        for row in rows
+    ]
+    changed_meanwhile = set(valid) - {row.id for row in rows}
+    rejected.extend((application_id, "Status changed while updating, try again") for application_id in changed_meanwhile)
+    return updated, rejected
+
+
+_trigram_support = {}
+
+def has_trigrams(db: Session) -> bool:
+    """Whether pg_trgm is installed (by migrate.py), checked once per database"""
+    url = str(db.get_bind().url)
+    if url not in _trigram_support:
+        _trigram_support[url] = db.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).first() is not None
+    return _trigram_support[url]
+
+
+def search_applications(db: Session, query: str, offset: int = 0, limit: int = 20):
+    """
+    Full-text search over project name, address and province, best matches first
+    Postgres uses the tsvector index plus pg_trgm similarity for typos (once
+    migrate.py has installed it), SQLite the FTS5 table. Every query word must
+    match; the bigrams of a Thai word must be adjacent, and the last word is
+    matched as a prefix.
+    Returns up to `limit` applications.
+    """
+    phrases = search_phrases(query)
+    if not phrases:
+        return []
+    
+    if db.get_bind().dialect.name == "postgresql":
+        document = func.to_tsvector("simple", func.coalesce(PropertyApplication.search_text, ""))
+        terms = [" <-> ".join(f"'{token}'" for token in phrase) for phrase in phrases]
+        terms[-1] += ":*"
+        tsquery = func.to_tsquery("simple", " & ".join(f"({term})" for term in terms))
+        matches, ranks = [document.op("@@")(tsquery)], [func.ts_rank(document, tsquery)]
+        if has_trigrams(db):
+            matches += [
+                PropertyApplication.project_name.op("%")(query),
+                PropertyApplication.property_address.op("%")(query),
+            ]
+            ranks += [
+                func.similarity(PropertyApplication.project_name, query),
+                func.word_similarity(query, PropertyApplication.property_address),
+            ]
+        return (
+            db.query(PropertyApplication)
+            .filter(or_(*matches))
+            .order_by(func.greatest(*ranks).desc(), PropertyApplication.id.desc())
+            .offset(offset)
+            .limit(limit)
+            .all()
+        )
+    
+    # Rank and page inside FTS5 so only one page of rows is joined back
+    match = " ".join('"' + " ".join(phrase) + '"' for phrase in phrases) + "*"
+    matches = (
+        text(
+            "SELECT rowid AS id, rank FROM property_applications_fts "
+            "WHERE property_applications_fts MATCH :match ORDER BY rank LIMIT :limit OFFSET :offset"
+        )
+        .bindparams(match=match, limit=limit, offset=offset)
+        .columns(id=Integer, rank=Float)
+        .subquery()
+    )
+    return (
+        db.query(PropertyApplication)
+        .join(matches, matches.c.id == PropertyApplication.id)
+        .order_by(matches.c.rank, PropertyApplication.id.desc())
+        .all()
+    )
@@ -1,8 +1,15 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, ForeignKey, Enum
+from sqlalchemy import create_engine, Column, BigInteger, Integer, String, Float, DateTime, Text, ForeignKey, Enum, Index, Table, text, event, DDL
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.sql import func
 import enum
+import itertools
+import logging
+import threading
+import time
+
+import redis
 
 Base = declarative_base()
 
@@ -12,8 +19,29 @@ class ApplicationStatus(enum.Enum):
     OFFER_MADE = "offer_made"
     OFFER_ACCEPTED = "offer_accepted"
     OFFER_DECLINED = "offer_declined"
+    OFFER_EXPIRED = "offer_expired"
     COMPLETED = "completed"
 
+# Which status an application may move to next (reviewer and seller actions)
+ALLOWED_TRANSITIONS = {
+    ApplicationStatus.SUBMITTED: {ApplicationStatus.UNDER_REVIEW},
+    ApplicationStatus.UNDER_REVIEW: {ApplicationStatus.OFFER_MADE},
+    ApplicationStatus.OFFER_MADE: {
+        ApplicationStatus.OFFER_ACCEPTED, ApplicationStatus.OFFER_DECLINED, ApplicationStatus.OFFER_EXPIRED,
+    },
+    ApplicationStatus.OFFER_ACCEPTED: {ApplicationStatus.COMPLETED},
+    ApplicationStatus.OFFER_DECLINED: set(),
+    ApplicationStatus.OFFER_EXPIRED: set(),
+    ApplicationStatus.COMPLETED: set(),
+}
+
+# Nothing happens to these any more; they get archived after ARCHIVE_AFTER_DAYS
+TERMINAL_STATUSES = {status for status, targets in ALLOWED_TRANSITIONS.items() if not targets}
+
+# What tasks.maintenance.process_due_applications does once due_at has passed
+DUE_REVIEW_SLA = "review_sla"      # Still not reviewed: escalate to the reviewers
+DUE_OFFER_EXPIRY = "offer_expiry"  # Offer not answered: expire it
+
 class PropertyType(enum.Enum):
     CONDO = "condo"
     HOUSE = "house"
@@ -35,6 +63,17 @@ class User(Base):
 
 class PropertyApplication(Base):
     __tablename__ = "property_applications"
+    __table_args__ = (
+        # Only applications waiting on the scheduler are in the index, so
+        # finding due work stays cheap however many applications there are
+        Index(
+            "ix_property_applications_due_at", "due_at",
+            postgresql_where=text("due_at IS NOT NULL"),
+            sqlite_where=text("due_at IS NOT NULL"),
+        ),
+        # Never hand out the id of an archived row again
+        {"sqlite_autoincrement": True},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -60,6 +99,18 @@ class PropertyApplication(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Review console search: project, address and province run through search.search_document
+    search_text = Column(Text, nullable=True)
+    
+    # Near-duplicate detection (see dedup.py). duplicate_of_id points at the
+    # first application with the same fingerprint; a plain column, not a foreign key
+    fingerprint = Column(String(40), nullable=True, index=True)
+    duplicate_of_id = Column(Integer, nullable=True, index=True)
+    
+    # Scheduler: when the application next needs attention and what to do (DUE_*)
+    due_at = Column(DateTime(timezone=True), nullable=True)
+    due_action = Column(String(20), nullable=True)
+    
     # Relationships
     user = relationship("User", back_populates="property_applications")
     documents = relationship("PropertyDocument", back_populates="application")
@@ -76,6 +127,16 @@ class PropertyDocument(Base):
     file_size = Column(Integer, nullable=False)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # Filled in by tasks.media.ingest_property_document
+    ingestion_status = Column(String(20), nullable=False, default="pending", server_default="pending", index=True)  # pending, queued, processing, done, failed
+    queued_at = Column(DateTime(timezone=True), nullable=True)  # Last queued or claimed, to spot lost tasks
+    ingestion_error = Column(Text, nullable=True)
+    ingested_at = Column(DateTime(timezone=True), nullable=True)
+    page_count = Column(Integer, nullable=True)
+    extracted_text = Column(Text, nullable=True)
+    deed_number = Column(String(50), nullable=True, index=True)
+    land_area_sqm = Column(Float, nullable=True)
+    
     # Relationship
     application = relationship("PropertyApplication", back_populates="documents")
 
@@ -89,9 +150,106 @@ class PropertyPhoto(Base):
     file_size = Column(Integer, nullable=False)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # Filled in by tasks.media.hash_property_photo (see photohash.py). The
+    # chunk columns are the 16-bit quarters of the hash, indexed for lookups
+    perceptual_hash = Column(BigInteger, nullable=True)  # dHash, stored signed
+    hash_chunk_0 = Column(Integer, nullable=True, index=True)
+    hash_chunk_1 = Column(Integer, nullable=True, index=True)
+    hash_chunk_2 = Column(Integer, nullable=True, index=True)
+    hash_chunk_3 = Column(Integer, nullable=True, index=True)
+    hashed_at = Column(DateTime(timezone=True), nullable=True)  # Also set when the file can't be read
+    
     # Relationship
     application = relationship("PropertyApplication", back_populates="photos")
 
+def archive_table(source, primary_key, *args, **kwargs):
+    """
+    Table with the same columns as source, for rows moved out of it
+    Rows are copied over as they are, so no defaults; and no foreign keys, the
+    rows they pointed at may have been archived too.
+    """
+    return Table(
+        f"{source.name}_archive", Base.metadata,
+        *[
+            Column(
+                column.name, column.type,
+                primary_key=column.name in primary_key,
+                nullable=column.nullable and column.name not in primary_key,
+                index=column.index,
+            )
+            for column in source.columns
+        ],
+        *args,
+        **kwargs,
+    )
+
+# Finished applications older than ARCHIVE_AFTER_DAYS, moved here by
+# tasks.maintenance.archive_finished_applications so the dashboard and review
+# queries only touch live rows. On Postgres the archive is range partitioned
+# by created_at (one partition per year, see ensure_archive_partitions)
+class ArchivedPropertyApplication(Base):
+    __table__ = archive_table(
+        PropertyApplication.__table__, ("id", "created_at"),
+        Index("ix_property_applications_archive_user_id", "user_id"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+
+class ArchivedPropertyDocument(Base):
+    __table__ = archive_table(
+        PropertyDocument.__table__, ("id",),
+        Index("ix_property_documents_archive_application_id", "application_id"),
+    )
+
+class ArchivedPropertyPhoto(Base):
+    __table__ = archive_table(
+        PropertyPhoto.__table__, ("id",),
+        Index("ix_property_photos_archive_application_id", "application_id"),
+    )
+
+# Catches rows whose yearly partition doesn't exist yet
+event.listen(
+    ArchivedPropertyApplication.__table__, "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS property_applications_archive_default "
+        "PARTITION OF property_applications_archive DEFAULT"
+    ).execute_if(dialect="postgresql"),
+)
+
+# Columns and indexes added to existing Postgres tables are migrate.py's job.
+# SQLite (tests, local dev) has no such tables to upgrade; it gets an FTS5
+# index over search_text instead of the tsvector one
+SQLITE_SCHEMA_UPGRADES = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS property_applications_fts USING fts5("
+    "search_text, content='property_applications', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS property_applications_fts_insert AFTER INSERT ON property_applications BEGIN "
+    "INSERT INTO property_applications_fts(rowid, search_text) VALUES (new.id, new.search_text); END",
+    "CREATE TRIGGER IF NOT EXISTS property_applications_fts_delete AFTER DELETE ON property_applications BEGIN "
+    "INSERT INTO property_applications_fts(property_applications_fts, rowid, search_text) "
+    "VALUES ('delete', old.id, old.search_text); END",
+    "CREATE TRIGGER IF NOT EXISTS property_applications_fts_update AFTER UPDATE OF search_text ON property_applications BEGIN "
+    "INSERT INTO property_applications_fts(property_applications_fts, rowid, search_text) "
+    "VALUES ('delete', old.id, old.search_text); "
+    "INSERT INTO property_applications_fts(rowid, search_text) VALUES (new.id, new.search_text); END",
+]
+
+for statement in SQLITE_SCHEMA_UPGRADES:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(
+    Base.metadata, "before_drop",
+    DDL("DROP TABLE IF EXISTS property_applications_fts").execute_if(dialect="sqlite"),
+)
+
+def ensure_archive_partitions(db, years):
+    """Create the yearly archive partitions rows are about to be moved into (Postgres only)"""
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for year in sorted(years):
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS property_applications_archive_{int(year)} "
+            f"PARTITION OF property_applications_archive "
+            f"FOR VALUES FROM ('{int(year)}-01-01') TO ('{int(year) + 1}-01-01')"
+        ))
+
 from config import settings
 
 # Database connection - using PostgreSQL
@@ -102,6 +260,165 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+logger = logging.getLogger(__name__)
+
+class LocalWriteMarks:
+    """Recent writes remembered by this process only (tests, single process dev)"""
+    
+    def __init__(self):
+        self._marks = {}   # user key -> expires_at
+        self._lock = threading.Lock()
+    
+    def mark(self, key, seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            self._marks[key] = now + seconds
+            if len(self._marks) > 10000:
+                self._marks = {k: expires_at for k, expires_at in self._marks.items() if expires_at > now}
+    
+    def recent(self, key) -> bool:
+        expires_at = self._marks.get(key)
+        return expires_at is not None and time.monotonic() < expires_at
+
+
+class RedisWriteMarks:
+    """
+    Recent writes shared by every API worker and container through Redis
+    keys that expire on their own. The next request after a write can land on
+    any worker, so a per-process marker would miss it. While Redis can't be
+    reached everybody reads from the primary: stale reads are what this prevents.
+    """
+    
+    KEY_PREFIX = "ibuyer:recent-write:"
+    
+    def __init__(self, url: str, retry_seconds: float = 5.0):
+        self.url = url
+        self.retry_seconds = retry_seconds
+        self._client = None
+        self._down_until = 0.0
+    
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._client
+    
+    def mark(self, key, seconds: float):
+        if time.monotonic() < self._down_until:
+            return
+        try:
+            self.client.set(self.KEY_PREFIX + key, 1, px=max(1, int(seconds * 1000)))
+        except redis.RedisError as exc:
+            self._redis_down(exc)
+    
+    def recent(self, key) -> bool:
+        if time.monotonic() < self._down_until:
+            return True
+        try:
+            return bool(self.client.exists(self.KEY_PREFIX + key))
+        except redis.RedisError as exc:
+            self._redis_down(exc)
+            return True
+    
+    def _redis_down(self, exc):
+        # Don't make every request wait for a Redis timeout
+        if time.monotonic() >= self._down_until:
+            logger.warning(f"Read-your-writes markers unavailable, reading from the primary for {self.retry_seconds}s: {exc}")
+        self._down_until = time.monotonic() + self.retry_seconds
+
+
+class ReplicaRouter:
+    """
+    Picks a read replica for read-only queries
+    Round-robin over the replicas that pass a periodic health check. Callers
+    fall back to the primary when no replica is healthy, or when the same user
+    wrote something a moment ago and the replicas may not have caught up yet.
+    """
+    
+    def __init__(self, replica_engines, health_check_seconds: float = 30, read_your_writes_seconds: float = 10,
+                 write_marks=None):
+        self.replica_engines = list(replica_engines)
+        self.health_check_seconds = health_check_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.write_marks = write_marks or LocalWriteMarks()
+        self._next = itertools.count()
+        self._health = {}          # engine -> (healthy, checked_at)
+        self._refreshing = set()   # engines with a health check running
+        self._lock = threading.Lock()
+    
+    def pick(self):
+        """Next healthy replica engine, or None to use the primary"""
+        for _ in range(len(self.replica_engines)):
+            replica = self.replica_engines[next(self._next) % len(self.replica_engines)]
+            if self.is_healthy(replica):
+                return replica
+        return None
+    
+    def is_healthy(self, replica) -> bool:
+        """
+        Last health check result. Only the very first check runs on a request
+        thread, once for everybody; after that stale results are refreshed in
+        the background while requests keep using the previous answer.
+        """
+        state = self._health.get(replica)
+        if state is None:
+            with self._lock:
+                state = self._health.get(replica)
+                if state is None:
+                    state = self._check(replica)
+        healthy, checked_at = state
+        if time.monotonic() - checked_at >= self.health_check_seconds:
+            self._refresh_in_background(replica)
+        return healthy
+    
+    def _refresh_in_background(self, replica):
+        with self._lock:
+            if replica in self._refreshing:
+                return
+            self._refreshing.add(replica)
+        
+        def refresh():
+            try:
+                self._check(replica)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(replica)
+        
+        threading.Thread(target=refresh, name="replica-health-check", daemon=True).start()
+    
+    def _check(self, replica):
+        try:
+            with replica.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            healthy = True
+        except SQLAlchemyError as exc:
+            logger.warning(f"Read replica {replica.url!r} failed its health check: {exc}")
+            healthy = False
+        self._health[replica] = (healthy, time.monotonic())
+        return self._health[replica]
+    
+    def mark_write(self, key):
+        """Keep this user's reads on the primary for a little while, in every worker"""
+        if key is not None:
+            self.write_marks.mark(key, self.read_your_writes_seconds)
+    
+    def wrote_recently(self, key) -> bool:
+        return key is not None and self.write_marks.recent(key)
+
+def create_replica_engine(url: str):
+    # A replica that stopped answering must fail fast, not hang the request
+    # (or health check) that happens to connect to it
+    connect_args = {"connect_timeout": settings.REPLICA_CONNECT_TIMEOUT_SECONDS} if url.startswith("postgresql") else {}
+    return create_engine(url, pool_pre_ping=True, connect_args=connect_args)
+
+replica_router = ReplicaRouter(
+    [create_replica_engine(url) for url in settings.database_replica_urls],
+    health_check_seconds=settings.REPLICA_HEALTH_CHECK_SECONDS,
+    read_your_writes_seconds=settings.READ_YOUR_WRITES_SECONDS,
+    # Only needed with replicas; without them every read goes to the primary anyway
+    write_marks=RedisWriteMarks(settings.REDIS_URL) if settings.database_replica_urls else None,
+)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -0,0 +1,64 @@
+"""
+Near-duplicate listing detection
+The same unit often comes in several times (owner, agents, relatives) with
+slightly different addresses. Each submission gets a fingerprint built from
+the parts that don't change between copies: project, property type, size
+bucket, bedrooms and the unit number parsed from the address. Equal
+fingerprints mean "probably the same unit", found with one index lookup.
+"""
+import hashlib
+import re
+
+SIZE_BUCKET_SQM = 2  # 35.0 and 35.8 sqm land in the same bucket
+
+_UNIT = re.compile(
+    r"(?:\bunit|\broom|\brm|\bapt|\bno|#|ห้องเลขที่|ห้อง|เลขที่)\.?\s*:?\s*(\d+[a-z]?(?:\s*[/-]\s*\d+[a-z]?)?)",
+    re.IGNORECASE,
+)
+_FLOOR = re.compile(r"(?:\bfloor|\bfl|ชั้นที่|ชั้น)\.?\s*:?\s*(\d+)|\b(\d+)(?:st|nd|rd|th)\s*(?:floor|fl)\b", re.IGNORECASE)
+_HOUSE_NUMBER = re.compile(r"^\s*(\d+[a-z]?(?:\s*/\s*\d+)?)\b", re.IGNORECASE)
+_NOT_WORD = re.compile(r"[\W_]+")
+
+
+def unit_tokens(address: str) -> list:
+    """
+    Unit and floor tokens of an address, e.g. ["f:5", "u:12"]
+    A leading house number ("99/123 Moo 4 ...") counts as the unit number.
+    Units with three or more digits already encode the floor (1203 is on the
+    12th floor), so the floor is only kept for short unit numbers.
+    """
+    address = address or ""
+    units = {_normalize_number(match) for match in _UNIT.findall(address)}
+    house = _HOUSE_NUMBER.match(address)
+    if house:
+        units.add(_normalize_number(house.group(1)))
+    if not units:
+        return []
+
+    tokens = {f"u:{unit}" for unit in units}
+    if all(len(re.sub(r"\D", "", unit.split("/")[0])) < 3 for unit in units):
+        floors = {int(a or b) for a, b in _FLOOR.findall(address)}
+        tokens.update(f"f:{floor}" for floor in floors)
+    return sorted(tokens)
+
+
+def listing_fingerprint(project_name, property_type, size_sqm, bedrooms, address):
+    """
+    Fingerprint of the unit a submission is about, or None when the address
+    has no unit or house number (too little to tell units apart)
+    """
+    tokens = unit_tokens(address)
+    if not tokens:
+        return None
+    parts = [
+        _NOT_WORD.sub("", (project_name or "").lower()),
+        getattr(property_type, "value", property_type) or "",
+        str(int(round((size_sqm or 0) / SIZE_BUCKET_SQM))),
+        str(bedrooms),
+        *tokens,
+    ]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def _normalize_number(number: str) -> str:
+    return re.sub(r"\s+", "", number).replace("-", "/").lower()
@@ -0,0 +1,130 @@
+"""
+Document text extraction
+Reads page count and embedded text from uploaded PDFs (title deeds / chanote,
+condo certificates) and picks out the fields reviewers look for.
+
+Each document is extracted in a child process of its own (this file run as a
+script): a broken or huge PDF can only take down that process, and it gets a
+time and memory limit. A plain subprocess rather than a multiprocessing pool,
+because prefork Celery workers are daemonic and may not start pool children.
+PDFs are read page by page from an open file, never loaded into memory as a whole.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+
+MAX_PAGES = 200
+MAX_TEXT_CHARS = 100_000  # Stored per document, the rest is dropped
+
+_THAI_DIGITS = str.maketrans("๐๑๒๓๔๕๖๗๘๙", "0123456789")
+
+_DEED_NUMBER = re.compile(
+    r"(?:โฉนด(?:ที่ดิน)?\s*(?:เลขที่|ฉบับที่)?|title\s*deed\s*(?:no\.?|number)?|chanote\s*(?:no\.?|number)?)"
+    r"\s*:?\s*(\d[\d,/-]*\d|\d)",
+    re.IGNORECASE,
+)
+_RAI_NGAN_WAH = re.compile(
+    r"(\d+(?:\.\d+)?)\s*ไร่\s*(\d+(?:\.\d+)?)\s*งาน\s*(\d+(?:\.\d+)?)\s*(?:ตารางวา|ตร\.?\s*ว\.?)"
+)
+_SQUARE_METRES = re.compile(
+    r"(\d[\d,]*(?:\.\d+)?)\s*(?:ตารางเมตร|ตร\.?\s*ม\.?|sq\.?\s*m\b|square\s*met(?:er|re)s?)",
+    re.IGNORECASE,
+)
+
+
+class DocumentTimeout(Exception):
+    """The document took longer than its time limit and its process was killed"""
+
+
+class DocumentExtractionError(Exception):
+    """The extraction process failed: unreadable file, memory limit, crash"""
+
+
+def extract_key_fields(text: str) -> dict:
+    """Deed number and area in square metres (1 rai = 4 ngan = 400 wah = 1600 sqm)"""
+    text = (text or "").translate(_THAI_DIGITS)
+    fields = {"deed_number": None, "area_sqm": None}
+
+    deed = _DEED_NUMBER.search(text)
+    if deed:
+        fields["deed_number"] = re.sub(r"[,\s]", "", deed.group(1))
+
+    land = _RAI_NGAN_WAH.search(text)
+    if land:
+        rai, ngan, wah = (float(value) for value in land.groups())
+        fields["area_sqm"] = rai * 1600 + ngan * 400 + wah * 4
+    else:
+        area = _SQUARE_METRES.search(text)
+        if area:
+            fields["area_sqm"] = float(area.group(1).replace(",", ""))
+    return fields
+
+
+def extract_pdf(path: str, max_pages: int = MAX_PAGES, max_chars: int = MAX_TEXT_CHARS) -> dict:
+    """Page count, embedded text and key fields of a PDF. Runs in the child process."""
+    from pypdf import PdfReader
+
+    chunks = []
+    remaining = max_chars
+    # Passing an open file (not a path) keeps pypdf from reading it all into memory
+    with open(path, "rb") as stream:
+        reader = PdfReader(stream)
+        page_count = len(reader.pages)
+        for number in range(min(page_count, max_pages)):
+            if remaining <= 0:
+                break
+            page_text = reader.pages[number].extract_text() or ""
+            chunks.append(page_text[:remaining])
+            remaining -= len(chunks[-1])
+
+    text = "\n".join(chunks).strip()
+    return {"page_count": page_count, "text": text, **extract_key_fields(text)}
+
+
+def _limit_memory(max_memory_mb: int):
+    """Cap the address space of the extraction process"""
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    limit = max_memory_mb * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def extract_in_subprocess(path: str, timeout: float = 60, max_memory_mb: int = 512) -> dict:
+    """extract_pdf in a fresh child process, killed after timeout seconds"""
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), path, str(max_memory_mb)],
+            capture_output=True, text=True, timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise DocumentTimeout(f"Extraction took longer than {timeout}s")
+    try:
+        result = json.loads(completed.stdout)
+    except ValueError:
+        # Killed before it could report, e.g. by the memory limit
+        raise DocumentExtractionError(
+            f"Extraction process exited with code {completed.returncode}: {completed.stderr.strip()[-500:]}"
+        )
+    if "error" in result:
+        raise DocumentExtractionError(result["error"])
+    return result
+
+
+def _main(path: str, max_memory_mb: str):
+    _limit_memory(int(max_memory_mb))
+    try:
+        result = extract_pdf(path)
+    except Exception as exc:
+        result = {"error": f"{type(exc).__name__}: {exc}"}
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    _main(*sys.argv[1:3])
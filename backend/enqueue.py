@@ -0,0 +1,313 @@
+"""
+Task enqueue client for the API
+Request handlers hand task messages to this client instead of calling
+.delay() on the broker themselves:
+
+    enqueue(send_property_submission_email, args=[email_data], priority=PRIORITY_HIGH)
+
+In "async" mode (the default) a background thread publishes them through the
+broker connection pool, so a request never waits on Redis. When Redis can't be
+reached, messages spill to a bounded JSONL journal on local disk and are
+replayed once the broker is back - by this process, or by another one sharing
+the journal directory if this one dies first. "sync" mode publishes in the calling thread and only
+spills on failure.
+
+Each process writes enqueue-<hostname>-<pid>-<random>.jsonl and holds an
+flock on it for as long as it runs. The kernel drops the lock when the process
+dies, so a journal whose lock can be taken belongs to nobody - whatever
+container wrote it, and even if its pid has since been reused. The random part
+keeps a restarted container, same hostname and same pids, from reusing an
+orphaned journal's name.
+
+Journals hold task arguments as they are, welcome emails included, which carry
+the new user's temporary password. They are created readable by their owner
+only (0600, in a 0700 directory).
+"""
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+
+from kombu.exceptions import OperationalError
+
+from celery_app import celery_app
+from config import settings
+from metrics import metrics
+from tracing import current_trace_id, new_trace_id
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("enqueue_spilled_total", "counter", "Task messages written to the local journal")
+metrics.describe("enqueue_replayed_total", "counter", "Journaled task messages published after all")
+metrics.describe("enqueue_dropped_total", "counter", "Task messages lost: journal full or message unpublishable")
+
+# Broker errors that mean "try again later", not "this message is broken"
+BROKER_ERRORS = (OperationalError, OSError)
+
+
+class TaskPublisher:
+    """Publishes task messages without blocking, spilling to disk while the broker is down"""
+
+    def __init__(self, app, journal_dir: str, mode: str = "async", max_pending: int = 10000,
+                 journal_max_bytes: int = 50 * 1024 * 1024, retry_seconds: float = 5.0):
+        if mode not in ("async", "sync"):
+            raise ValueError(f"Unknown enqueue mode {mode!r}, expected 'async' or 'sync'")
+        self.app = app
+        self.journal_dir = journal_dir
+        self.mode = mode
+        self.journal_max_bytes = journal_max_bytes
+        self.retry_seconds = retry_seconds
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._journal_lock = threading.Lock()
+        self._journal = None  # Our own journal, open and locked while it exists
+        self._journal_path = None
+        self._journal_pid = None
+        self._broker_down_until = 0.0
+        self._publisher_pid = None
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, task, args=None, kwargs=None, **options) -> str:
+        """Queue a task, returns its task id. Never raises for broker trouble."""
+        message = {
+            "task": task.name if hasattr(task, "name") else task,
+            "args": list(args or []),
+            "kwargs": kwargs or {},
+            "options": options,
+            "task_id": str(uuid.uuid4()),
+            # Taken now, not when the message finally reaches Redis, so queue
+            # wait includes time spent in the journal and the trace stays whole
+            "headers": {"trace_id": current_trace_id() or new_trace_id(), "enqueued_at": time.time()},
+        }
+        self._ensure_publisher()  # Also replays the journal in sync mode
+        if self.mode == "sync":
+            self._publish_or_spill(message)
+            return message["task_id"]
+
+        try:
+            self._pending.put_nowait(message)
+        except queue.Full:
+            self._spill(message)
+        return message["task_id"]
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until the background thread has handed over everything queued so far"""
+        deadline = time.monotonic() + timeout
+        while self._pending.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def replay(self) -> int:
+        """Publish journaled messages, returns how many went out"""
+        if time.monotonic() < self._broker_down_until:
+            return 0
+        replayed = 0
+        claimed = self._claim_journals()
+        try:
+            while claimed:
+                path, journal = claimed.pop(0)
+                replayed += self._replay_journal(path, journal)
+                if time.monotonic() < self._broker_down_until:
+                    break
+        finally:
+            # Unlocked, what's left is claimed again on the next attempt
+            for _, journal in claimed:
+                journal.close()
+        if replayed:
+            logger.info(f"Replayed {replayed} journaled task messages")
+        return replayed
+
+    def _replay_journal(self, path, journal) -> int:
+        """Publish one claimed journal and delete it, returns how many went out"""
+        replayed = 0
+        try:
+            journal.seek(0)
+            lines = journal.readlines()
+            for index, line in enumerate(lines):
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    logger.error(f"Skipping unreadable journal line in {path}: {line[:200]!r}")
+                    continue
+                try:
+                    self._publish(message)
+                except BROKER_ERRORS:
+                    self._broker_down(None)
+                    # Put the rest back for the next attempt
+                    for rest in lines[index:]:
+                        self._append_line(rest if rest.endswith("\n") else rest + "\n")
+                    break
+                except Exception:
+                    logger.exception(f"Dropping journaled message for {message.get('task')}")
+                    metrics.inc("enqueue_dropped_total", {"task": message.get("task", "unknown")})
+                    continue
+                replayed += 1
+                metrics.inc("enqueue_replayed_total", {"task": message["task"]})
+            os.remove(path)
+        finally:
+            journal.close()
+        return replayed
+
+    def shutdown(self):
+        """Move whatever is still in memory to the journal (process exit)"""
+        while True:
+            try:
+                message = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            self._spill(message)
+            self._pending.task_done()
+
+    def _publish(self, message: dict):
+        task = self.app.tasks[message["task"]]
+        task.apply_async(
+            args=message["args"],
+            kwargs=message["kwargs"],
+            task_id=message["task_id"],
+            headers=message["headers"],
+            retry=False,  # Fail fast, the journal is our retry
+            **message["options"],
+        )
+
+    def _publish_or_spill(self, message: dict):
+        if time.monotonic() < self._broker_down_until:
+            self._spill(message)
+            return
+        try:
+            self._publish(message)
+        except BROKER_ERRORS as exc:
+            self._broker_down(exc)
+            self._spill(message)
+
+    def _broker_down(self, exc):
+        # Don't make every message pay for a connection attempt while Redis is away
+        if exc is not None and time.monotonic() >= self._broker_down_until:
+            logger.warning(f"Broker unreachable, journaling task messages for {self.retry_seconds}s: {exc}")
+        self._broker_down_until = time.monotonic() + self.retry_seconds
+
+    def _spill(self, message: dict):
+        self._append_line(json.dumps(message, default=str) + "\n", task=message["task"])
+
+    def _append_line(self, line: str, task: str = None):
+        with self._journal_lock:
+            journal = self._own_journal()
+            if os.fstat(journal.fileno()).st_size + len(line) > self.journal_max_bytes:
+                logger.error(f"Enqueue journal {self._journal_path} is full, dropping task message")
+                metrics.inc("enqueue_dropped_total", {"task": task or "unknown"})
+                return
+            journal.write(line)
+            journal.flush()
+        if task is not None:
+            metrics.inc("enqueue_spilled_total", {"task": task})
+
+    def _own_journal(self):
+        """This process's journal, created and locked on first use (call with _journal_lock held)"""
+        if self._journal is not None and self._journal_pid == os.getpid():
+            return self._journal
+        if self._journal is not None:
+            # Forked: the handle and its lock are the parent's, start our own
+            self._journal.close()
+        os.makedirs(self.journal_dir, mode=0o700, exist_ok=True)
+        name = f"{_process_name()}-{uuid.uuid4().hex[:12]}"
+        path = os.path.join(self.journal_dir, f"enqueue-{name}.jsonl")
+        # Locked under a name replay doesn't look at, so nobody can take it in
+        # between; link fails rather than replace a journal with the same name
+        creating = os.path.join(self.journal_dir, f".creating-{name}")
+        fd = os.open(creating, os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_EXCL, 0o600)
+        journal = os.fdopen(fd, "a+", encoding="utf-8")
+        fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.link(creating, path)
+        os.remove(creating)
+        self._journal, self._journal_path, self._journal_pid = journal, path, os.getpid()
+        return journal
+
+    def _claim_journals(self) -> list:
+        """
+        Take over the journals nobody holds a lock on, plus our own, as
+        (path, open file) pairs locked until replayed. Each is renamed first,
+        so we keep appending to a fresh journal meanwhile.
+        """
+        claimed = []
+        suffix = f".replaying-{_process_name()}"
+        with self._journal_lock:
+            if self._journal is not None and self._journal_pid == os.getpid():
+                # The rename keeps our lock, it's on the file, not the name
+                os.rename(self._journal_path, self._journal_path + suffix)
+                claimed.append((self._journal_path + suffix, self._journal))
+                self._journal = None
+
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, "enqueue-*"))):
+            try:
+                journal = open(path, encoding="utf-8")
+            except FileNotFoundError:
+                continue  # Replayed and deleted meanwhile
+            try:
+                fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # Locked, but maybe only after another process replayed and removed it
+                if os.stat(path).st_ino != os.fstat(journal.fileno()).st_ino:
+                    raise FileNotFoundError(path)
+            except (BlockingIOError, FileNotFoundError):
+                journal.close()  # Its process is still running, or someone else got it
+                continue
+            target = path.split(".replaying-")[0] + suffix
+            os.rename(path, target)
+            claimed.append((target, journal))
+        return claimed
+
+    def _ensure_publisher(self):
+        if self._publisher_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._publisher_pid == os.getpid():
+                return
+            if self._publisher_pid is not None:
+                # Forked: the parent's queue and thread stay with the parent
+                self._pending = queue.Queue(maxsize=self._pending.maxsize)
+            self._publisher_pid = os.getpid()
+        threading.Thread(target=self._publish_forever, name="task-publisher", daemon=True).start()
+
+    def _publish_forever(self):
+        last_replay = 0.0
+        while True:
+            try:
+                message = self._pending.get(timeout=self.retry_seconds)
+            except queue.Empty:
+                message = None
+            try:
+                if message is not None:
+                    self._publish_or_spill(message)
+                if time.monotonic() - last_replay >= self.retry_seconds:
+                    last_replay = time.monotonic()
+                    self.replay()
+            except Exception:
+                logger.exception("Task publisher error")
+            finally:
+                if message is not None:
+                    self._pending.task_done()
+
+
+def _process_name() -> str:
+    # Pids repeat across containers sharing the journal directory, hostnames don't
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+publisher = TaskPublisher(
+    celery_app,
+    journal_dir=settings.ENQUEUE_JOURNAL_DIR,
+    mode=settings.ENQUEUE_MODE,
+    journal_max_bytes=settings.ENQUEUE_JOURNAL_MAX_MB * 1024 * 1024,
+)
+atexit.register(publisher.shutdown)
+
+
+def enqueue(task, args=None, kwargs=None, **options) -> str:
+    """Queue a Celery task from a request handler, see TaskPublisher"""
+    return publisher.enqueue(task, args=args, kwargs=kwargs, **options)
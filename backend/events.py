@@ -0,0 +1,270 @@
+"""
+Application status events
+Pushes status and offer changes to the seller's dashboard over server-sent events.
+
+Every API process keeps one subscription to the Redis channel and hands events
+to the connections it holds, so an idle dashboard costs a coroutine and a small
+queue - no thread and no database connection.
+
+The browser's EventSource can't send an Authorization header, and a JWT in the
+URL ends up in access logs. The dashboard trades its token for a stream
+ticket instead: random, single use, valid for TICKET_SECONDS. The stream ends
+when the token it was opened with expires.
+"""
+from collections import defaultdict
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
+import secrets
+import threading
+import time
+
+import redis
+import redis.asyncio as aioredis
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "ibuyer:application-events"
+HEARTBEAT_SECONDS = 15
+MAX_PENDING_EVENTS = 100  # Per connection, the oldest are dropped for slow clients
+TICKET_SECONDS = 30
+
+
+class LocalBroker:
+    """Fans events out to the connections held by this process (used in tests and dev)"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)  # user email -> {(loop, queue)}
+
+    def publish(self, user_key: str, event: dict):
+        """Safe to call from sync handlers running in the threadpool"""
+        self._dispatch(user_key, event)
+
+    def publish_many(self, items):
+        """Publish (user_key, event) pairs"""
+        for user_key, event in items:
+            self._dispatch(user_key, event)
+
+    @asynccontextmanager
+    async def subscription(self, user_key: str):
+        queue = asyncio.Queue(maxsize=MAX_PENDING_EVENTS)
+        subscriber = (asyncio.get_running_loop(), queue)
+        self._subscribers[user_key].add(subscriber)
+        try:
+            yield queue
+        finally:
+            self._subscribers[user_key].discard(subscriber)
+            if not self._subscribers[user_key]:
+                del self._subscribers[user_key]
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _dispatch(self, user_key: str, event: dict):
+        for loop, queue in list(self._subscribers.get(user_key, ())):
+            loop.call_soon_threadsafe(_put_dropping_oldest, queue, event)
+
+
+class RedisBroker(LocalBroker):
+    """Fans events out between API processes and Celery workers through Redis pub/sub"""
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+        self._client = None
+        self._listener = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url, socket_timeout=1, socket_connect_timeout=1)
+        return self._client
+
+    def publish(self, user_key: str, event: dict):
+        # Our own listener delivers it locally, together with every other process
+        try:
+            self.client.publish(CHANNEL, json.dumps({"user": user_key, "event": event}, default=str))
+        except redis.RedisError as exc:
+            logger.warning(f"Could not publish application event: {exc}")
+
+    def publish_many(self, items):
+        """One round trip for a whole batch of events"""
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for user_key, event in items:
+                pipe.publish(CHANNEL, json.dumps({"user": user_key, "event": event}, default=str))
+            pipe.execute()
+        except redis.RedisError as exc:
+            logger.warning(f"Could not publish application events: {exc}")
+
+    @asynccontextmanager
+    async def subscription(self, user_key: str):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        async with super().subscription(user_key) as queue:
+            yield queue
+
+    async def _listen(self):
+        retry_delay = 1
+        while True:
+            try:
+                async with aioredis.from_url(self.url) as connection:
+                    async with connection.pubsub() as pubsub:
+                        await pubsub.subscribe(CHANNEL)
+                        retry_delay = 1
+                        async for message in pubsub.listen():
+                            if message["type"] == "message":
+                                payload = json.loads(message["data"])
+                                self._dispatch(payload["user"], payload["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"Application event listener lost Redis, retrying in {retry_delay}s: {exc}")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30)
+
+
+def _put_dropping_oldest(queue: asyncio.Queue, event: dict):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+def _create_broker():
+    if settings.EVENTS_BACKEND == "redis":
+        return RedisBroker(settings.REDIS_URL)
+    return LocalBroker()
+
+
+broker = _create_broker()
+
+
+class LocalTickets:
+    """Stream tickets known to this process only (used in tests and dev)"""
+
+    def __init__(self):
+        self._tickets = {}  # ticket -> (user email, token expiry, ticket expiry)
+        self._lock = threading.Lock()
+
+    def issue(self, user_key: str, expires_at: float):
+        """New ticket for user_key, or None if it couldn't be stored"""
+        ticket = secrets.token_urlsafe(24)
+        now = time.time()
+        with self._lock:
+            self._tickets = {key: value for key, value in self._tickets.items() if value[2] > now}
+            self._tickets[ticket] = (user_key, expires_at, now + TICKET_SECONDS)
+        return ticket
+
+    def redeem(self, ticket: str):
+        """(user email, token expiry) the first time a live ticket is used, else None"""
+        with self._lock:
+            user_key, expires_at, valid_until = self._tickets.pop(ticket, (None, None, 0))
+        return (user_key, expires_at) if valid_until > time.time() else None
+
+
+class RedisTickets:
+    """Stream tickets shared by every API process, the stream may open on any of them"""
+
+    KEY_PREFIX = "ibuyer:stream-ticket:"
+
+    def __init__(self, url: str):
+        self.url = url
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url, socket_timeout=1, socket_connect_timeout=1)
+        return self._client
+
+    def issue(self, user_key: str, expires_at: float):
+        ticket = secrets.token_urlsafe(24)
+        try:
+            self.client.set(self.KEY_PREFIX + ticket, json.dumps([user_key, expires_at]), ex=TICKET_SECONDS)
+        except redis.RedisError as exc:
+            logger.warning(f"Could not store stream ticket: {exc}")
+            return None
+        return ticket
+
+    def redeem(self, ticket: str):
+        try:
+            pipe = self.client.pipeline()  # GET and DEL in one transaction, so a ticket works once
+            pipe.get(self.KEY_PREFIX + ticket)
+            pipe.delete(self.KEY_PREFIX + ticket)
+            value, _ = pipe.execute()
+        except redis.RedisError as exc:
+            logger.warning(f"Could not redeem stream ticket: {exc}")
+            return None
+        return tuple(json.loads(value)) if value else None
+
+
+def _create_tickets():
+    if settings.EVENTS_BACKEND == "redis":
+        return RedisTickets(settings.REDIS_URL)
+    return LocalTickets()
+
+
+stream_tickets = _create_tickets()
+
+
+def application_event(application_id: int, status, offer_amount=None, offer_made_at=None) -> dict:
+    return {
+        "type": "application.updated",
+        "application_id": application_id,
+        "status": status.value if status else None,
+        "offer_amount": offer_amount,
+        "offer_made_at": offer_made_at.isoformat() if offer_made_at else None,
+    }
+
+
+def publish_application_update(user_email: str, application):
+    """Tell the seller's open dashboards that an application changed"""
+    broker.publish(user_email, application_event(
+        application.id, application.status, application.offer_amount, application.offer_made_at
+    ))
+
+
+def publish_status_changes(changes):
+    """Push the rows returned by crud.bulk_transition_applications"""
+    broker.publish_many(
+        (
+            change["email"],
+            application_event(
+                change["application_id"], change["status"], change["offer_amount"], change["offer_made_at"]
+            ),
+        )
+        for change in changes
+    )
+
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+async def application_event_stream(user_email: str, heartbeat_seconds: float = HEARTBEAT_SECONDS,
+                                   expires_at: float = None):
+    """
+    Server-sent events for one seller, with comment lines to keep proxies from timing out
+    At expires_at (the token's exp, epoch seconds) a session.expired event ends the stream.
+    """
+    async with broker.subscription(user_email) as queue:
+        yield "retry: 5000\n\n"
+        while True:
+            timeout = heartbeat_seconds
+            if expires_at is not None:
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    yield format_sse({"type": "session.expired"})
+                    return
+                timeout = min(timeout, remaining)
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if expires_at is None or time.time() < expires_at:
+                    yield ": keep-alive\n\n"
+                continue
+            yield format_sse(event)
@@ -1,31 +1,49 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import os
+import time
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 import uvicorn
 
-from database import get_db, Base, engine
-from models import PropertyApplicationCreate, PropertyApplicationResponse, UserCreate, UserResponse, PropertySubmissionWithRegistration
-from auth import get_current_user, create_access_token, verify_password, get_password_hash
-from crud import create_user, get_user_by_email, create_property_application, get_user_applications
+from admission import AdmissionMiddleware, parse_limits
+from database import get_db, Base, engine, replica_router, PropertyPhoto
+from models import PropertyApplicationCreate, PropertyApplicationResponse, UserCreate, UserResponse, PropertySubmissionWithRegistration, BulkTransitionRequest, BulkTransitionResponse, ApplicationSearchResponse, SimilarPhotosResponse
+from auth import get_current_user, get_current_reader, get_current_reviewer, get_read_db, decode_access_token, optional_security, create_access_token, verify_password, get_password_hash
+from crud import create_user, get_user_by_email, create_property_application, get_user_applications, bulk_transition_applications, search_applications, find_similar_photos
 from config import settings
+from enqueue import enqueue
+from events import TICKET_SECONDS, application_event_stream, publish_application_update, publish_status_changes, stream_tickets
+from metrics import metrics
+import photohash
+from search import highlight, query_terms
+from tracing import TRACE_HEADER, trace_id_var, new_trace_id
 import secrets
 import string
 
 # Import Celery app and task
-from celery_app import celery_app  # Import the configured Celery instance
-from tasks.email import send_property_submission_email
+from celery_app import celery_app, PRIORITY_HIGH, PRIORITY_DEFAULT  # Import the configured Celery instance
+from tasks.email import send_property_submission_email, send_application_status_emails, status_notifications
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title=settings.APP_NAME, version=settings.APP_VERSION)
 
+# Shed bursts on the expensive routes with a quick 503 instead of letting them
+# fill the threadpool. Added first so it runs inside CORS and the request metrics
+admission_limits = parse_limits(settings.ADMISSION_LIMITS)
+app.add_middleware(
+    AdmissionMiddleware,
+    limits=admission_limits,
+    retry_after=settings.ADMISSION_RETRY_AFTER_SECONDS,
+)
+
 # CORS middleware
 # In production with monolithic deployment, CORS isn't needed for same-origin requests
 # But we'll keep it configured for any external access
@@ -42,6 +60,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def trace_and_measure(request: Request, call_next):
+    """Give every request a trace id (passed on to Celery tasks) and record its duration"""
+    trace_id = request.headers.get(TRACE_HEADER) or new_trace_id()
+    token = trace_id_var.set(trace_id)
+    started_at = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        trace_id_var.reset(token)
+    
+    # Label by route template, not the raw path, to keep the number of series small
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", "unmatched")
+    metrics.inc("http_requests_total", {"method": request.method, "route": route_path, "status": response.status_code})
+    metrics.observe("http_request_duration_seconds", time.perf_counter() - started_at, {"route": route_path})
+    
+    response.headers[TRACE_HEADER] = trace_id
+    return response
+
 security = HTTPBearer()
 
 # Check if we should serve static files (production mode)
@@ -78,8 +116,9 @@ def send_welcome_email(email: str, password: str, full_name: str) -> bool:
     print(f"========================")
     return True
 
+# async: answered on the event loop, so it doesn't wait for a threadpool slot
 @app.get("/api/health")
-def health_check():
+async def health_check():
     return {"message": "IBuyer API is running"}
 
 @app.post("/register", response_model=UserResponse)
@@ -92,6 +131,7 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     # Create new user
     hashed_password = get_password_hash(user.password)
     db_user = create_user(db, user, hashed_password)
+    replica_router.mark_write(db_user.email)
     return db_user
 
 class LoginRequest(BaseModel):
@@ -108,7 +148,7 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer", "user": user}
 
 @app.get("/me", response_model=UserResponse)
-def get_current_user_info(current_user = Depends(get_current_user)):
+def get_current_user_info(current_user = Depends(get_current_reader)):
     """Get current authenticated user's information"""
     return current_user
 
@@ -119,16 +159,68 @@ def submit_property_application(
     db: Session = Depends(get_db)
 ):
     db_application = create_property_application(db, application, current_user.id)
+    replica_router.mark_write(current_user.email)
+    publish_application_update(current_user.email, db_application)
     return db_application
 
 @app.get("/my-applications", response_model=List[PropertyApplicationResponse])
 def get_my_applications(
-    current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    include_archived: bool = False,
+    current_user = Depends(get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
-    applications = get_user_applications(db, current_user.id)
+    # Finished applications older than ARCHIVE_AFTER_DAYS only when asked for
+    applications = get_user_applications(db, current_user.id, include_archived=include_archived)
     return applications
 
+def stream_credentials_exception():
+    return HTTPException(
+        status_code=401,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+@app.post("/events/tickets")
+def create_stream_ticket(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    """
+    Single-use ticket for opening /events/applications, valid for TICKET_SECONDS
+    EventSource can't send the Authorization header, and a token in the URL would be logged.
+    """
+    payload = decode_access_token(credentials.credentials) if credentials else None
+    if not payload or not payload.get("sub"):
+        raise stream_credentials_exception()
+    ticket = stream_tickets.issue(payload["sub"], payload["exp"])
+    if ticket is None:
+        raise HTTPException(status_code=503, detail="Live updates are unavailable, please try again shortly")
+    return {"ticket": ticket, "expires_in": TICKET_SECONDS}
+
+@app.get("/events/applications")
+async def stream_application_events(
+    ticket: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """
+    Server-sent events with status and offer changes for the current user
+    Authenticated by a ticket from POST /events/tickets (?ticket=) or the usual
+    bearer token; the stream ends when that token expires.
+    No database session is held while the stream is open.
+    """
+    if credentials:
+        payload = decode_access_token(credentials.credentials) or {}
+        email, expires_at = payload.get("sub"), payload.get("exp")
+    elif ticket:
+        email, expires_at = await run_in_threadpool(stream_tickets.redeem, ticket) or (None, None)
+    else:
+        email = None
+    if email is None:
+        raise stream_credentials_exception()
+    
+    return StreamingResponse(
+        application_event_stream(email, expires_at=expires_at),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post("/submit-property-with-registration")
 def submit_property_with_registration(
     submission: PropertySubmissionWithRegistration,
@@ -179,6 +271,9 @@ def submit_property_with_registration(
     )
     
     application = create_property_application(db, property_data, user.id)
+    # The dashboard is loaded right after this, keep that read on the primary
+    replica_router.mark_write(user.email)
+    publish_application_update(user.email, application)
     
     # Queue email task (fire and forget, like Sidekiq's perform_async)
     email_data = {
@@ -194,8 +289,13 @@ def submit_property_with_registration(
     if existing_user is None:
         email_data['password'] = generated_password
     
-    # Queue the task (won't wait for it to complete)
-    send_property_submission_email.delay(email_data)
+    # Queue the task (won't wait for it to complete, or for Redis - see enqueue.py)
+    # Welcome emails carry the temporary password, so they jump the email queue
+    enqueue(
+        send_property_submission_email,
+        args=[email_data],
+        priority=PRIORITY_HIGH if existing_user is None else PRIORITY_DEFAULT
+    )
     
     return {
         "message": "Application submitted successfully",
@@ -226,6 +326,88 @@ async def upload_documents(
     # TODO: Implement file upload logic
     return {"message": f"Uploaded {len(files)} documents for application {application_id}"}
 
+@app.post("/admin/applications/transitions", response_model=BulkTransitionResponse)
+def transition_applications(
+    request: BulkTransitionRequest,
+    reviewer = Depends(get_current_reviewer),
+    db: Session = Depends(get_db)
+):
+    """
+    Move up to 1000 applications to their next status in one go (e.g. push a batch of offers)
+    Invalid transitions are reported back in `rejected`, the rest are applied.
+    Each application may appear once, a repeated one fails the request with 422.
+    """
+    updated, rejected = bulk_transition_applications(db, request.transitions)
+    
+    if updated:
+        publish_status_changes(updated)
+        # One job for the whole batch instead of one per seller
+        enqueue(send_application_status_emails, args=[status_notifications(updated)])
+    
+    return {
+        "updated": updated,
+        "rejected": [{"application_id": application_id, "reason": reason} for application_id, reason in rejected],
+    }
+
+@app.get("/admin/applications/search", response_model=ApplicationSearchResponse)
+def search_applications_for_review(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    reviewer = Depends(get_current_reviewer),
+    db: Session = Depends(get_read_db)
+):
+    """Search applications by project name, address or province (Thai or English)"""
+    # One extra row tells us whether there is a next page without a COUNT(*)
+    applications = search_applications(db, q, offset=(page - 1) * page_size, limit=page_size + 1)
+    terms = query_terms(q)
+    results = [
+        {
+            **PropertyApplicationResponse.model_validate(application).model_dump(),
+            "duplicate_of_id": application.duplicate_of_id,
+            "highlights": {
+                "project_name": highlight(application.project_name, terms),
+                "property_address": highlight(application.property_address, terms),
+            },
+        }
+        for application in applications[:page_size]
+    ]
+    return {"results": results, "page": page, "page_size": page_size, "has_more": len(applications) > page_size}
+
+@app.get("/admin/applications/{application_id}/similar-photos", response_model=SimilarPhotosResponse)
+def similar_photos_for_review(
+    application_id: int,
+    # Up to 7 bits each chunk index is probed within 1 bit; from 8 on lookups get about 8x slower
+    distance: int = Query(settings.PHOTO_MATCH_DISTANCE, ge=0, le=7),
+    reviewer = Depends(get_current_reviewer),
+    db: Session = Depends(get_read_db)
+):
+    """Photos of other applications that look like this application's photos (reused or stolen pictures)"""
+    photos = (
+        db.query(PropertyPhoto)
+        .filter(PropertyPhoto.application_id == application_id, PropertyPhoto.perceptual_hash.isnot(None))
+        .order_by(PropertyPhoto.id)
+        .all()
+    )
+    matches = [
+        {
+            "photo_id": photo.id,
+            "similar_photo_id": match.id,
+            "similar_application_id": match.application_id,
+            "distance": match_distance,
+        }
+        for photo in photos
+        for match, match_distance in find_similar_photos(
+            db, photohash.to_unsigned(photo.perceptual_hash), distance, exclude_application_id=application_id
+        )
+    ]
+    return {"application_id": application_id, "max_distance": distance, "matches": matches}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """API and Celery task metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/admin/flower-info")
 def flower_info():
     """Get Flower access information"""
@@ -233,7 +415,8 @@ def flower_info():
         "message": "Flower should run as a separate Railway service",
         "local_url": "http://localhost:5555 (run locally with: celery -A celery_app flower)",
         "production": "Create new Railway service with start command: celery -A celery_app flower --port=$PORT",
-        "note": "Flower needs its own service to be accessible in production"
+        "note": "Flower needs its own service to be accessible in production",
+        "metrics": "Per-task queue wait, run time, retries and failures are also exported at /metrics"
     }
 
 # Serve static files in production
@@ -0,0 +1,183 @@
+"""
+Metrics for the API and the Celery workers
+Counters and summaries rendered in the Prometheus text format at /metrics
+"""
+from collections import defaultdict
+import logging
+import os
+import threading
+import time
+
+import redis
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStore:
+    """Keeps metric values in this process only"""
+
+    def __init__(self):
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def incr(self, series: str, amount: float):
+        with self._lock:
+            self._values[series] += amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class RedisStore(MemoryStore):
+    """
+    Shares metric values between the API processes and the Celery workers
+
+    Increments are buffered locally and flushed to a single Redis hash in the
+    background, so recording a metric never waits on the network.
+    """
+
+    def __init__(self, url: str, key: str = "ibuyer:metrics", flush_interval: float = 5.0):
+        super().__init__()
+        self.url = url
+        self.key = key
+        self.flush_interval = flush_interval
+        self._client = None
+        self._flusher_pid = None
+        self._failing = False
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = redis.Redis.from_url(
+                self.url, socket_timeout=1, socket_connect_timeout=1, decode_responses=True
+            )
+        return self._client
+
+    def incr(self, series: str, amount: float):
+        self._ensure_flusher()
+        super().incr(series, amount)
+
+    def flush(self):
+        with self._lock:
+            pending = dict(self._values)
+            self._values.clear()
+        if not pending:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for series, amount in pending.items():
+                pipe.hincrbyfloat(self.key, series, amount)
+            pipe.execute()
+            self._failing = False
+        except redis.RedisError as exc:
+            # Keep the values for the next flush instead of dropping them
+            for series, amount in pending.items():
+                super().incr(series, amount)
+            if not self._failing:
+                logger.warning(f"Could not flush metrics to Redis: {exc}")
+                self._failing = True
+
+    def snapshot(self) -> dict:
+        self.flush()
+        try:
+            return {series: float(value) for series, value in self.client.hgetall(self.key).items()}
+        except redis.RedisError as exc:
+            logger.warning(f"Could not read metrics from Redis: {exc}")
+            return super().snapshot()
+
+    def _ensure_flusher(self):
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            if self._flusher_pid is not None:
+                # Forked worker process: the parent flushes what it buffered
+                self._values.clear()
+                self._client = None
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_forever, name="metrics-flusher", daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+class MetricsRegistry:
+    """Counters and summaries keyed by metric name and labels"""
+
+    def __init__(self, store=None):
+        self.store = store or MemoryStore()
+        self._descriptions = {}
+
+    def describe(self, name: str, kind: str, help_text: str):
+        """Register a metric so it gets HELP and TYPE lines ("counter" or "summary")"""
+        self._descriptions[name] = (kind, help_text)
+
+    def inc(self, name: str, labels: dict = None, amount: float = 1.0):
+        self.store.incr(_series(name, labels), amount)
+
+    def observe(self, name: str, value: float, labels: dict = None):
+        """Record one observation of a summary, e.g. a duration in seconds"""
+        self.store.incr(_series(f"{name}_sum", labels), value)
+        self.store.incr(_series(f"{name}_count", labels), 1)
+
+    def value(self, name: str, labels: dict = None) -> float:
+        return self.store.snapshot().get(_series(name, labels), 0.0)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        samples = defaultdict(list)
+        for series, value in sorted(self.store.snapshot().items()):
+            samples[self._metric_name(series)].append(f"{series} {value:g}")
+
+        lines = []
+        for name in sorted(samples):
+            if name in self._descriptions:
+                kind, help_text = self._descriptions[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples[name])
+        return "\n".join(lines) + "\n"
+
+    def _metric_name(self, series: str) -> str:
+        name = series.split("{", 1)[0]
+        for suffix in ("_sum", "_count"):
+            base = name[:-len(suffix)]
+            if name.endswith(suffix) and self._descriptions.get(base, ("",))[0] == "summary":
+                return base
+        return name
+
+
+def _series(name: str, labels: dict = None) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(
+        f'{key}="{_escape(str(value))}"' for key, value in sorted(labels.items())
+    )
+    return f"{name}{{{rendered}}}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _create_store():
+    if settings.METRICS_BACKEND == "redis":
+        return RedisStore(settings.REDIS_URL)
+    return MemoryStore()
+
+
+# Shared by the API and the workers so task metrics show up next to the HTTP ones
+metrics = MetricsRegistry(_create_store())
+
+metrics.describe("http_requests_total", "counter", "HTTP requests by route and status code")
+metrics.describe("http_request_duration_seconds", "summary", "Time spent handling HTTP requests")
@@ -0,0 +1,137 @@
+"""
+Database migrations, run once per deploy before the new release takes traffic:
+
+    python3 migrate.py
+
+The app only runs create_all when it starts, which creates missing tables and
+nothing else. Everything that changes existing tables is done here instead:
+
+- Columns added since a table was created. ALTER TABLE takes an ACCESS
+  EXCLUSIVE lock even when IF NOT EXISTS makes it a no-op, and waiting for it
+  behind one long query stalls every query queued after it. So columns that
+  are already there are skipped, and lock_timeout makes the migration fail
+  (run it again) rather than wait.
+- Indexes, built CONCURRENTLY so writes carry on while a large table is
+  indexed. That has to run outside a transaction.
+- pg_trgm, which needs a role allowed to create extensions. Search works
+  without it, just without typo tolerance.
+"""
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = "5s"
+
+# (table, column, type) - columns added to tables after their first release
+NEW_COLUMNS = [
+    ("property_applications", "search_text", "TEXT"),
+    ("property_applications", "fingerprint", "VARCHAR(40)"),
+    ("property_applications", "duplicate_of_id", "INTEGER"),
+    ("property_applications", "due_at", "TIMESTAMP WITH TIME ZONE"),
+    ("property_applications", "due_action", "VARCHAR(20)"),
+    ("property_documents", "ingestion_status", "VARCHAR(20) NOT NULL DEFAULT 'pending'"),
+    ("property_documents", "ingestion_error", "TEXT"),
+    ("property_documents", "ingested_at", "TIMESTAMP WITH TIME ZONE"),
+    ("property_documents", "queued_at", "TIMESTAMP WITH TIME ZONE"),
+    ("property_documents", "page_count", "INTEGER"),
+    ("property_documents", "extracted_text", "TEXT"),
+    ("property_documents", "deed_number", "VARCHAR(50)"),
+    ("property_documents", "land_area_sqm", "DOUBLE PRECISION"),
+    ("property_photos", "perceptual_hash", "BIGINT"),
+    ("property_photos", "hash_chunk_0", "INTEGER"),
+    ("property_photos", "hash_chunk_1", "INTEGER"),
+    ("property_photos", "hash_chunk_2", "INTEGER"),
+    ("property_photos", "hash_chunk_3", "INTEGER"),
+    ("property_photos", "hashed_at", "TIMESTAMP WITH TIME ZONE"),
+]
+
+# Archive tables were created from the live ones at some point, columns added
+# to a live table since then have to be added to its archive as well
+ARCHIVED_TABLES = ("property_applications", "property_documents", "property_photos")
+NEW_COLUMNS += [(f"{table}_archive", column, type_) for table, column, type_ in list(NEW_COLUMNS) if table in ARCHIVED_TABLES]
+
+# (enum type, value)
+NEW_ENUM_VALUES = [
+    ("applicationstatus", "OFFER_EXPIRED"),
+]
+
+# (name, definition) - CREATE INDEX CONCURRENTLY IF NOT EXISTS <name> <definition>
+INDEXES = [
+    ("ix_property_applications_fingerprint", "ON property_applications (fingerprint)"),
+    ("ix_property_applications_due_at", "ON property_applications (due_at) WHERE due_at IS NOT NULL"),
+    ("ix_property_applications_duplicate_of_id", "ON property_applications (duplicate_of_id)"),
+    ("ix_property_applications_search_text",
+     "ON property_applications USING GIN (to_tsvector('simple', coalesce(search_text, '')))"),
+    ("ix_property_documents_ingestion_status", "ON property_documents (ingestion_status)"),
+    ("ix_property_documents_deed_number", "ON property_documents (deed_number)"),
+    ("ix_property_photos_hash_chunk_0", "ON property_photos (hash_chunk_0)"),
+    ("ix_property_photos_hash_chunk_1", "ON property_photos (hash_chunk_1)"),
+    ("ix_property_photos_hash_chunk_2", "ON property_photos (hash_chunk_2)"),
+    ("ix_property_photos_hash_chunk_3", "ON property_photos (hash_chunk_3)"),
+]
+
+# Built only where pg_trgm is available
+TRIGRAM_INDEXES = [
+    ("ix_property_applications_project_name_trgm",
+     "ON property_applications USING GIN (project_name gin_trgm_ops)"),
+    ("ix_property_applications_address_trgm",
+     "ON property_applications USING GIN (property_address gin_trgm_ops)"),
+]
+
+
+def run_migrations(engine):
+    """Bring an existing Postgres database up to date, returns the statements run"""
+    if engine.dialect.name != "postgresql":
+        return []
+    executed = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        def run(statement):
+            executed.append(statement)
+            connection.execute(text(statement))
+
+        existing_columns = set(connection.execute(text(
+            "SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = current_schema()"
+        )).all())
+        existing_values = set(connection.execute(text(
+            "SELECT pg_type.typname, pg_enum.enumlabel FROM pg_enum JOIN pg_type ON pg_type.oid = pg_enum.enumtypid"
+        )).all())
+        connection.execute(text(f"SET lock_timeout = '{LOCK_TIMEOUT}'"))
+        for table, column, type_ in NEW_COLUMNS:
+            if (table, column) not in existing_columns:
+                run(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {type_}")
+        for enum, value in NEW_ENUM_VALUES:
+            if (enum, value) not in existing_values:
+                run(f"ALTER TYPE {enum} ADD VALUE IF NOT EXISTS '{value}'")
+        # Concurrent builds wait for older transactions, they may take a while
+        connection.execute(text("RESET lock_timeout"))
+
+        indexes = list(INDEXES)
+        if connection.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first():
+            run("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            indexes += TRIGRAM_INDEXES
+        else:
+            logger.warning("pg_trgm is not available on this server, search won't tolerate typos")
+
+        for name, definition in indexes:
+            # A concurrent build that failed (deploy killed, deadlock) leaves an
+            # invalid index behind, which IF NOT EXISTS would happily keep
+            invalid = connection.execute(text(
+                "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+                "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+            ), {"name": name}).first()
+            if invalid:
+                logger.warning(f"Rebuilding invalid index {name}")
+                run(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            run(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+    return executed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    for statement in run_migrations(engine):
+        logger.info(statement)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import Optional, List, Dict
 from datetime import datetime
 from database import PropertyType, ApplicationStatus
 
@@ -79,4 +79,60 @@ class PropertySubmissionWithRegistration(BaseModel):
     bathrooms: int
     asking_price: float
     property_condition: str
-    preferred_timeline: str
\ No newline at end of file
+    preferred_timeline: str
+
+class ApplicationTransition(BaseModel):
+    application_id: int
+    status: ApplicationStatus
+    offer_amount: Optional[float] = None  # Required when status is offer_made
+
+class BulkTransitionRequest(BaseModel):
+    transitions: List[ApplicationTransition] = Field(..., min_length=1, max_length=1000)
+    
+    @field_validator("transitions")
+    @classmethod
+    def one_transition_per_application(cls, transitions):
+        # Which of two transitions for the same application should win is anyone's guess
+        seen, repeated = set(), set()
+        for transition in transitions:
+            (repeated if transition.application_id in seen else seen).add(transition.application_id)
+        if repeated:
+            raise ValueError(f"More than one transition for applications {sorted(repeated)}")
+        return transitions
+
+class TransitionResult(BaseModel):
+    application_id: int
+    status: ApplicationStatus
+    offer_amount: Optional[float]
+    offer_made_at: Optional[datetime]
+
+class TransitionRejection(BaseModel):
+    application_id: int
+    reason: str
+
+class BulkTransitionResponse(BaseModel):
+    updated: List[TransitionResult]
+    rejected: List[TransitionRejection]
+
+class ApplicationSearchHit(PropertyApplicationResponse):
+    # First application for the same unit, when this one looks like a copy
+    duplicate_of_id: Optional[int]
+    # HTML snippets with the matching words wrapped in <mark>
+    highlights: Dict[str, str]
+
+class ApplicationSearchResponse(BaseModel):
+    results: List[ApplicationSearchHit]
+    page: int
+    page_size: int
+    has_more: bool
+
+class SimilarPhoto(BaseModel):
+    photo_id: int                 # Photo of the application asked about
+    similar_photo_id: int
+    similar_application_id: int
+    distance: int                 # Bits that differ out of 64, 0 = same picture
+
+class SimilarPhotosResponse(BaseModel):
+    application_id: int
+    max_distance: int
+    matches: List[SimilarPhoto]
@@ -0,0 +1,124 @@
+"""
+Perceptual photo hashes
+Scam and copy listings reuse photos from other listings, usually recompressed
+or resized, so the bytes differ. A difference hash (dHash) survives that: the
+photo is shrunk to 9x8 grey pixels and each bit says whether a pixel is
+brighter than its right neighbour. Copies end up a few bits apart, unrelated
+photos around 32.
+
+Lookups use multi-index hashing: the 64-bit hash is stored as 4 indexed
+16-bit chunks. Two hashes at most k bits apart have at least one chunk at most
+k // 4 bits apart, so a search probes each chunk index for the values within
+that radius and checks the full distance on the few rows it finds. The indexes
+are ordinary B-trees, kept up to date row by row as photos are hashed.
+
+Chunk values aren't uniform though: a plain strip of ceiling or floor hashes
+to 0, which is 11% of the top chunks with benchmarks/bench_photos.py --photos,
+and probing it reads all of them. The same argument works with fewer chunks -
+at most k bits apart means at least one of any n chunks is at most k // n bits
+apart - so a lookup can leave crowded chunks out and probe the others wider
+(see probe_plan).
+"""
+import itertools
+
+from PIL import Image, ImageOps
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# Flat photos (blank walls, black frames) hash to nearly all 0s or 1s and
+# would match each other. They get a hash but no chunks, so no matches.
+MIN_DETAIL_BITS = 8
+
+# Widest probe of a plan leaving chunks out: at 3 bits a chunk probe looks up
+# 697 values, at 4 already 2,517
+MAX_PROBE_RADIUS = 3
+
+# Backstop for photos whose every chunk is crowded: a probe stops after this
+# many rows, taken in no particular order, so a lookup that hits it may miss matches
+MAX_CANDIDATES_PER_CHUNK = 10000
+
+# Largest image hashed, after JPEG draft scaling (phone cameras take 12-50 MP)
+MAX_PIXELS = 60_000_000
+
+
+def dhash(path: str) -> int:
+    """64-bit difference hash of an image file, ValueError for images over MAX_PIXELS"""
+    with Image.open(path) as image:
+        image.draft("L", (64, 64))  # JPEG: decode straight at a fraction of the size
+        # Other formats decode at full size: refuse sizes no camera produces
+        # (a PNG bomb is a few KB on disk) before anything is decoded
+        if image.width * image.height > MAX_PIXELS:
+            raise ValueError(f"Image of {image.width}x{image.height} pixels is over the {MAX_PIXELS:,} pixel limit")
+        image = ImageOps.exif_transpose(image)
+        pixels = image.convert("L").resize((9, 8), Image.Resampling.BOX).tobytes()
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left, right = pixels[row * 9 + column], pixels[row * 9 + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def chunks(value: int) -> list:
+    """The hash split into CHUNKS values of CHUNK_BITS, most significant first"""
+    return [(value >> (CHUNK_BITS * index)) & CHUNK_MASK for index in reversed(range(CHUNKS))]
+
+
+def is_detailed(value: int) -> bool:
+    return MIN_DETAIL_BITS <= value.bit_count() <= HASH_BITS - MIN_DETAIL_BITS
+
+
+def chunk_probes(chunk: int, radius: int) -> list:
+    """Every chunk value within radius bits of chunk (1, 17, 137, ... values)"""
+    probes = [chunk]
+    for distance in range(1, radius + 1):
+        for bits in itertools.combinations(range(CHUNK_BITS), distance):
+            flipped = chunk
+            for bit in bits:
+                flipped ^= 1 << bit
+            probes.append(flipped)
+    return probes
+
+
+def probe_plan(value: int, max_distance: int, common: dict = None) -> list:
+    """
+    The chunk probes that find every hash at most max_distance bits from value,
+    as (chunk index, chunk values). common gives the share of photos having
+    each chunk value, as {index: ({value: share}, share of any other value)},
+    and the plan expected to read the fewest photos is picked: every chunk, or
+    fewer probed wider, up to MAX_PROBE_RADIUS.
+    """
+    common = common or {}
+    parts = chunks(value)
+
+    def share(index, probes):
+        shares, other = common.get(index, ({}, 0))
+        return sum(shares.get(probe, other) for probe in probes)
+
+    plan, plan_share = None, None
+    for count in range(CHUNKS, 0, -1):
+        radius = max_distance // count
+        if count < CHUNKS and radius > MAX_PROBE_RADIUS:
+            break
+        probes = [chunk_probes(part, radius) for part in parts]
+        for indexes in itertools.combinations(range(CHUNKS), count):
+            expected = sum(share(index, probes[index]) for index in indexes)
+            if plan is None or expected < plan_share:
+                plan, plan_share = [(index, probes[index]) for index in indexes], expected
+    return plan
+
+
+def to_signed(value: int) -> int:
+    """Unsigned 64-bit hash to the signed range of a BIGINT column"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value: int) -> int:
+    return value & ((1 << HASH_BITS) - 1)
@@ -0,0 +1,69 @@
+"""
+Full-text search helpers for the review console
+Thai is written without spaces between words, so Thai runs are indexed as
+overlapping character bigrams (the usual trick for CJK text). Latin words and
+numbers are indexed as lowercase words. Documents and queries go through the
+same tokenizer, so "Sukhumvit 39" and "ศุภาลัย" both match without a Thai
+dictionary, on Postgres and on SQLite alike.
+"""
+import html
+import re
+
+_TOKEN_RUN = re.compile(r"[\u0e00-\u0e7f]+|[^\W_\u0e00-\u0e7f]+")
+_THAI = re.compile(r"[\u0e00-\u0e7f]")
+
+
+def search_phrases(text: str) -> list:
+    """Token lists per word: [word] for Latin/numbers, the bigrams of a Thai run"""
+    phrases = []
+    for run in _TOKEN_RUN.findall(text or ""):
+        if _THAI.match(run):
+            phrases.append([run[i:i + 2] for i in range(max(len(run) - 1, 1))])
+        else:
+            phrases.append([run.lower()])
+    return phrases
+
+
+def search_tokens(text: str) -> list:
+    """Split text into index tokens: lowercase words plus bigrams for Thai runs"""
+    return [token for phrase in search_phrases(text) for token in phrase]
+
+
+def search_document(*fields) -> str:
+    """The tokenized text stored in property_applications.search_text"""
+    return " ".join(search_tokens(" ".join(field for field in fields if field)))
+
+
+def query_terms(query: str) -> list:
+    """Words and Thai runs of a query, used to highlight matches"""
+    return [run.lower() for run in _TOKEN_RUN.findall(query or "")]
+
+
+def highlight(text: str, terms: list, width: int = 120) -> str:
+    """
+    HTML-escaped snippet of text around the first match, matches in <mark>
+    Latin terms match at the start of a word (prefix search), Thai runs anywhere.
+    """
+    text = text or ""
+    patterns = [
+        re.escape(term) if _THAI.match(term) else r"(?<!\w)" + re.escape(term)
+        for term in sorted(set(terms), key=len, reverse=True)
+    ]
+    matches = list(re.finditer("|".join(patterns), text, re.IGNORECASE)) if patterns else []
+
+    start = 0
+    if matches and len(text) > width:
+        start = max(0, min(matches[0].start() - width // 4, len(text) - width))
+    end = min(len(text), start + width)
+
+    parts = ["…" if start > 0 else ""]
+    position = start
+    for match in matches:
+        if match.start() < position or match.end() > end:
+            continue
+        parts.append(html.escape(text[position:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        position = match.end()
+    parts.append(html.escape(text[position:end]))
+    parts.append("…" if end < len(text) else "")
+    return "".join(parts)
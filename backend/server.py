@@ -0,0 +1,118 @@
+"""
+Production API server launcher
+Runs main:app under gunicorn with uvicorn workers, one per CPU the container
+may actually use (cgroup quota, not the host's core count), capped by its
+memory limit.
+
+    python3 server.py                      # WEB_CONCURRENCY overrides the worker count
+    kill -HUP <master pid>                 # zero-downtime worker restart
+
+The app is imported once in the master and the workers are forked from it, so
+they share the imported code instead of each loading it. Workers restart after
+WEB_MAX_REQUESTS requests (plus jitter, so they don't all restart at once), like
+the Celery worker's --max-tasks-per-child.
+
+On SIGHUP gunicorn starts a new set of workers and only then asks the old ones
+to finish their requests and exit, so nothing is dropped. With the app
+preloaded the new workers run the code the master loaded - deploy new code by
+replacing the container, or with USR2 (new master) followed by QUIT to the old one.
+"""
+import math
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from config import settings
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def cpu_limit(cgroup_root: str = CGROUP_ROOT) -> float:
+    """CPUs this process may use: the cgroup quota if there is one, else the CPUs it may run on"""
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = _read(os.path.join(cgroup_root, "cpu.max"))  # cgroup v2: "200000 100000" or "max 100000"
+    if quota:
+        limit, period = quota.split()
+        if limit != "max":
+            return min(available, int(limit) / int(period))
+        return available
+    limit = _read(os.path.join(cgroup_root, "cpu", "cpu.cfs_quota_us"))  # cgroup v1, -1 means none
+    period = _read(os.path.join(cgroup_root, "cpu", "cpu.cfs_period_us"))
+    if limit and period and int(limit) > 0:
+        return min(available, int(limit) / int(period))
+    return available
+
+
+def memory_limit_mb(cgroup_root: str = CGROUP_ROOT):
+    """Container memory limit in MB, or None when there isn't one"""
+    for path in (os.path.join(cgroup_root, "memory.max"), os.path.join(cgroup_root, "memory", "memory.limit_in_bytes")):
+        value = _read(path)
+        if value and value != "max" and int(value) < 1 << 60:  # v1 reports "no limit" as a huge number
+            return int(value) // (1024 * 1024)
+    return None
+
+
+def worker_count(cgroup_root: str = CGROUP_ROOT) -> int:
+    """One worker per CPU, as many as fit in memory next to the master"""
+    if settings.WEB_CONCURRENCY:
+        return int(settings.WEB_CONCURRENCY)
+    workers = max(1, math.ceil(cpu_limit(cgroup_root)))
+    memory = memory_limit_mb(cgroup_root)
+    if memory:
+        fits = (memory - settings.WEB_MASTER_MEMORY_MB) // settings.WEB_WORKER_MEMORY_MB
+        workers = min(workers, max(1, fits))
+    return workers
+
+
+def gunicorn_options() -> dict:
+    return {
+        "bind": f"{settings.HOST}:{settings.PORT}",
+        "workers": worker_count(),
+        "worker_class": "uvicorn_worker.UvicornWorker",
+        "preload_app": True,
+        "max_requests": settings.WEB_MAX_REQUESTS,
+        "max_requests_jitter": max(1, settings.WEB_MAX_REQUESTS // 10),
+        "timeout": 60,             # Kill a worker stuck this long
+        "graceful_timeout": 30,    # Time old workers get to finish requests on HUP / shutdown
+        "keepalive": 5,
+        "forwarded_allow_ips": "*",  # Behind the platform's proxy
+        "accesslog": "-" if settings.DEBUG else None,
+        "post_fork": post_fork,
+    }
+
+
+def post_fork(server, worker):
+    """Connections opened while preloading belong to the master, don't share them"""
+    from database import engine, replica_router
+
+    engine.dispose(close=False)
+    for replica in replica_router.replica_engines:
+        replica.dispose(close=False)
+
+
+class Server(BaseApplication):
+    """gunicorn configured from code instead of a gunicorn.conf.py"""
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from main import app
+        return app
+
+
+def _read(path: str):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    Server(gunicorn_options()).run()
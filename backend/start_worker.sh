@@ -6,14 +6,6 @@ export PYTHONOPTIMIZE=2           # Remove docstrings and assertions
 export PYTHONUNBUFFERED=1         # Disable output buffering
 export MALLOC_TRIM_THRESHOLD_=0   # Return memory to OS more aggressively
 
-# Start Celery with minimal memory usage
-# --pool=solo uses single-threaded execution (lowest memory)
-# --without-gossip --without-mingle --without-heartbeat reduces network overhead
-exec python3 -m celery -A celery_app worker \
-    --loglevel=info \
-    --pool=solo \
-    --concurrency=1 \
-    --max-tasks-per-child=100 \
-    --without-gossip \
-    --without-mingle \
-    --without-heartbeat
\ No newline at end of file
+# Pool, concurrency and queues come from the worker profile (see worker.py)
+# CELERY_WORKER_PROFILE=solo is the lowest memory option and the default
+exec python3 worker.py
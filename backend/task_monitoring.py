@@ -0,0 +1,90 @@
+"""
+Celery task metrics and tracing
+Signal hooks that stamp every task message with the trace id of the request
+that enqueued it and record queue wait, run time, retries and failures per task.
+Works without a result backend - everything travels in the message headers.
+"""
+from datetime import datetime
+import logging
+import time
+
+from celery import signals
+
+from metrics import metrics
+from tracing import trace_id_var, current_trace_id, new_trace_id
+
+logger = logging.getLogger(__name__)
+
+# task_id -> perf_counter at start, per worker process
+_started_at = {}
+
+metrics.describe("celery_tasks_enqueued_total", "counter", "Tasks published to the broker")
+metrics.describe("celery_task_queue_wait_seconds", "summary", "Time between enqueue (or ETA) and start")
+metrics.describe("celery_task_runtime_seconds", "summary", "Time spent running the task")
+metrics.describe("celery_tasks_total", "counter", "Finished task runs by final state")
+metrics.describe("celery_task_retries_total", "counter", "Task retries")
+metrics.describe("celery_task_failures_total", "counter", "Tasks that failed for good")
+
+
+@signals.before_task_publish.connect
+def stamp_task_headers(sender=None, headers=None, **kwargs):
+    """Runs in whichever process enqueues the task (API or worker)"""
+    headers.setdefault("trace_id", current_trace_id() or new_trace_id())
+    headers.setdefault("enqueued_at", time.time())
+    metrics.inc("celery_tasks_enqueued_total", {"task": sender})
+
+
+@signals.task_prerun.connect
+def record_task_start(sender=None, task_id=None, task=None, **kwargs):
+    request = task.request
+    trace_id = _header(request, "trace_id")
+    trace_id_var.set(trace_id)  # Tasks enqueued from this one keep the same trace id
+
+    queue_wait = _queue_wait(_header(request, "enqueued_at"), request.get("eta"))
+    if queue_wait is not None:
+        metrics.observe("celery_task_queue_wait_seconds", queue_wait, {"task": sender.name})
+        logger.info(f"Task {sender.name}[{task_id}] trace_id={trace_id} waited {queue_wait:.3f}s in queue")
+
+    _started_at[task_id] = time.perf_counter()
+
+
+@signals.task_postrun.connect
+def record_task_finish(sender=None, task_id=None, state=None, **kwargs):
+    started_at = _started_at.pop(task_id, None)
+    if started_at is not None:
+        metrics.observe("celery_task_runtime_seconds", time.perf_counter() - started_at, {"task": sender.name})
+    metrics.inc("celery_tasks_total", {"task": sender.name, "state": state or "UNKNOWN"})
+    trace_id_var.set(None)
+
+
+@signals.task_retry.connect
+def record_task_retry(sender=None, **kwargs):
+    metrics.inc("celery_task_retries_total", {"task": sender.name})
+
+
+@signals.task_failure.connect
+def record_task_failure(sender=None, task_id=None, exception=None, **kwargs):
+    metrics.inc("celery_task_failures_total", {"task": sender.name, "exception": type(exception).__name__})
+
+
+def _header(request, name):
+    """Custom headers are top-level on the worker but nested when run eagerly"""
+    value = request.get(name)
+    if value is None and request.get("headers"):
+        value = request.headers.get(name)
+    return value
+
+
+def _queue_wait(enqueued_at, eta):
+    """Seconds the message sat in the queue, not counting a countdown/ETA delay"""
+    if enqueued_at is None:
+        return None
+    ready_at = float(enqueued_at)
+    if isinstance(eta, str):
+        try:
+            eta = datetime.fromisoformat(eta)
+        except ValueError:
+            eta = None
+    if isinstance(eta, datetime):
+        ready_at = max(ready_at, eta.timestamp())
+    return max(0.0, time.time() - ready_at)
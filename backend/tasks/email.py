@@ -3,6 +3,7 @@ Email task for property submission
 Just one task - send email after property is submitted
 """
 from celery_app import celery_app  # Import our configured Celery app
+from config import settings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -101,4 +102,107 @@ def send_property_submission_email(self, submission_data: dict):
     except Exception as exc:
         logger.error(f"Failed to send email to {submission_data.get('email')}: {exc}")
         # Retry with exponential backoff
-        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
\ No newline at end of file
+        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+
+def status_notifications(changes) -> list:
+    """send_application_status_emails payload for rows from crud.bulk_transition_applications"""
+    return [
+        {
+            'email': change['email'],
+            'full_name': change['full_name'],
+            'application_id': change['application_id'],
+            'status': change['status'].value,
+            'offer_amount': change['offer_amount'],
+        }
+        for change in changes
+    ]
+
+@celery_app.task(bind=True, max_retries=3)
+def send_application_status_emails(self, notifications: list):
+    """
+    Tell sellers their application moved on - one job for a whole reviewer batch
+    
+    Args:
+        notifications: [{
+            'email': str,
+            'full_name': str,
+            'application_id': int,
+            'status': str,
+            'offer_amount': float or None
+        }]
+    """
+    try:
+        logger.info(f"Sending {len(notifications)} application status emails")
+        
+        # TODO: Integrate with actual email service (SendGrid, AWS SES, etc.)
+        for notification in notifications:
+            if notification['status'] == 'offer_made':
+                headline = f"We've made you a cash offer of ฿{notification.get('offer_amount') or 0:,.0f}!"
+            else:
+                headline = f"Your application is now: {notification['status'].replace('_', ' ')}"
+            
+            print(f"""
+            ===== STATUS UPDATE EMAIL SENT =====
+            To: {notification['email']}
+            Subject: Update on your property application #{notification['application_id']}
+            
+            Dear {notification['full_name']},
+            
+            {headline}
+            
+            View your dashboard: https://denis-vibing-ibuyer-production.up.railway.app/dashboard
+            
+            Best regards,
+            iBuyer Thailand Team
+            ====================================
+            """)
+        
+        return {"status": "sent", "count": len(notifications)}
+        
+    except Exception as exc:
+        logger.error(f"Failed to send application status emails: {exc}")
+        # Retry with exponential backoff
+        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+
+@celery_app.task(bind=True, max_retries=3)
+def send_review_sla_escalation(self, overdue: list):
+    """
+    Remind the reviewers of submissions still waiting past the review SLA
+    
+    Args:
+        overdue: [{
+            'application_id': int,
+            'project_name': str,
+            'province': str,
+            'submitted_at': str (ISO 8601)
+        }]
+    """
+    try:
+        reviewers = settings.reviewer_emails
+        if not reviewers:
+            logger.warning(f"{len(overdue)} applications are past the review SLA but REVIEWER_EMAILS is empty")
+            return {"status": "skipped", "count": len(overdue)}
+        
+        lines = "\n".join(
+            f"            #{item['application_id']} {item.get('project_name') or ''} "
+            f"({item.get('province') or ''}), submitted {item['submitted_at']}"
+            for item in overdue
+        )
+        
+        # TODO: Integrate with actual email service (SendGrid, AWS SES, etc.)
+        print(f"""
+            ===== REVIEW SLA ESCALATION SENT =====
+            To: {', '.join(reviewers)}
+            Subject: {len(overdue)} applications waiting longer than {settings.REVIEW_SLA_HOURS} hours
+            
+            These sellers were promised a review within {settings.REVIEW_SLA_HOURS} hours:
+{lines}
+            ======================================
+            """)
+        
+        return {"status": "sent", "count": len(overdue)}
+        
+    except Exception as exc:
+        logger.error(f"Failed to send review SLA escalation: {exc}")
+        # Retry with exponential backoff
+        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
@@ -0,0 +1,244 @@
+"""
+Maintenance tasks
+Batch jobs on the low-priority maintenance queue. Long jobs work in chunks and
+enqueue the next chunk as a new task, so they can be stopped and resumed and
+never hold a worker for long.
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, insert, select
+
+from celery_app import celery_app
+from config import settings
+from crud import next_due
+from database import (
+    SessionLocal, User, PropertyApplication, PropertyDocument, PropertyPhoto,
+    ArchivedPropertyApplication, ArchivedPropertyDocument, ArchivedPropertyPhoto,
+    ApplicationStatus, TERMINAL_STATUSES, DUE_OFFER_EXPIRY, DUE_REVIEW_SLA, ensure_archive_partitions,
+)
+from dedup import listing_fingerprint
+from events import publish_status_changes
+from search import search_document
+from tasks.email import send_application_status_emails, send_review_sla_escalation, status_notifications
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task
+def backfill_search_text(after_id: int = 0, chunk_size: int = 1000):
+    """Fill search_text for applications submitted before search existed"""
+    db = SessionLocal()
+    try:
+        applications = (
+            db.query(PropertyApplication)
+            .filter(PropertyApplication.id > after_id, PropertyApplication.search_text.is_(None))
+            .order_by(PropertyApplication.id)
+            .limit(chunk_size)
+            .all()
+        )
+        for application in applications:
+            application.search_text = search_document(
+                application.project_name, application.property_address, application.province
+            )
+        db.commit()
+        last_id = applications[-1].id if applications else after_id
+    finally:
+        db.close()
+    
+    logger.info(f"Search text backfilled for {len(applications)} applications up to id {last_id}")
+    if len(applications) == chunk_size:
+        backfill_search_text.delay(last_id, chunk_size)
+    return {"processed": len(applications), "last_id": last_id}
+
+
+@celery_app.task
+def backfill_listing_fingerprints(after_id: int = 0, chunk_size: int = 1000):
+    """Fingerprint older applications and link the copies of the same unit"""
+    db = SessionLocal()
+    try:
+        applications = (
+            db.query(PropertyApplication)
+            .filter(PropertyApplication.id > after_id)
+            .order_by(PropertyApplication.id)
+            .limit(chunk_size)
+            .all()
+        )
+        for application in applications:
+            application.fingerprint = listing_fingerprint(
+                application.project_name,
+                application.property_type,
+                application.property_size_sqm,
+                application.bedrooms,
+                application.property_address,
+            )
+        
+        # First id per fingerprint: earlier chunks are already in the database,
+        # this chunk only in memory - one grouped query instead of one per row
+        fingerprints = {a.fingerprint for a in applications if a.fingerprint}
+        first_ids = dict(
+            db.query(PropertyApplication.fingerprint, func.min(PropertyApplication.id))
+            .filter(PropertyApplication.fingerprint.in_(fingerprints), PropertyApplication.id <= after_id)
+            .group_by(PropertyApplication.fingerprint)
+        ) if fingerprints else {}
+        duplicates = 0
+        for application in applications:
+            if application.fingerprint is None:
+                application.duplicate_of_id = None
+                continue
+            first_id = first_ids.setdefault(application.fingerprint, application.id)
+            application.duplicate_of_id = first_id if first_id != application.id else None
+            duplicates += application.duplicate_of_id is not None
+        db.commit()
+        last_id = applications[-1].id if applications else after_id
+    finally:
+        db.close()
+    
+    logger.info(f"Fingerprinted {len(applications)} applications up to id {last_id}, {duplicates} duplicates")
+    if len(applications) == chunk_size:
+        backfill_listing_fingerprints.delay(last_id, chunk_size)
+    return {"processed": len(applications), "duplicates": duplicates, "last_id": last_id}
+
+
+@celery_app.task
+def archive_finished_applications(after_id: int = 0, chunk_size: int = 500):
+    """
+    Move completed and declined applications untouched for ARCHIVE_AFTER_DAYS,
+    with their documents and photos, to the archive tables. Each chunk moves in
+    one transaction, so a stopped run simply continues with the next chunk.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(PropertyApplication.id, PropertyApplication.created_at)
+            .filter(
+                PropertyApplication.id > after_id,
+                PropertyApplication.status.in_(TERMINAL_STATUSES),
+                func.coalesce(PropertyApplication.updated_at, PropertyApplication.created_at) < cutoff,
+            )
+            .order_by(PropertyApplication.id)
+            .limit(chunk_size)
+            .all()
+        )
+        ids = [row.id for row in rows]
+        if ids:
+            ensure_archive_partitions(db, {row.created_at.year for row in rows})
+            # Children first, the hot tables still have foreign keys to the applications
+            _move_rows(db, PropertyDocument, ArchivedPropertyDocument, PropertyDocument.application_id.in_(ids))
+            _move_rows(db, PropertyPhoto, ArchivedPropertyPhoto, PropertyPhoto.application_id.in_(ids))
+            _move_rows(db, PropertyApplication, ArchivedPropertyApplication, PropertyApplication.id.in_(ids))
+            db.commit()
+        last_id = ids[-1] if ids else after_id
+    finally:
+        db.close()
+    
+    logger.info(f"Archived {len(ids)} finished applications up to id {last_id}")
+    if len(ids) == chunk_size:
+        archive_finished_applications.delay(last_id, chunk_size)
+    return {"archived": len(ids), "last_id": last_id}
+
+
+@celery_app.task
+def process_due_applications(batch_size: int = 200):
+    """
+    Expire unanswered offers and escalate submissions past the review SLA
+    Due rows are claimed with FOR UPDATE SKIP LOCKED, so several workers can
+    run this at once without picking the same application twice. Only rows
+    with a due_at are read, through the partial index - the cost follows the
+    number of due items, not the size of the table.
+    """
+    now = datetime.now(timezone.utc)
+    expired, overdue = [], []
+    db = SessionLocal()
+    try:
+        claimed = (
+            db.query(PropertyApplication, User.email, User.full_name)
+            .join(User)
+            .filter(PropertyApplication.due_at <= now)
+            .order_by(PropertyApplication.due_at)
+            .limit(batch_size)
+            .with_for_update(of=PropertyApplication, skip_locked=True)
+            .all()
+        )
+        for application, email, full_name in claimed:
+            if application.due_action == DUE_OFFER_EXPIRY and application.status == ApplicationStatus.OFFER_MADE:
+                application.status = ApplicationStatus.OFFER_EXPIRED
+                application.updated_at = now
+                application.due_at, application.due_action = None, None
+                expired.append({
+                    "application_id": application.id,
+                    "status": application.status,
+                    "offer_amount": application.offer_amount,
+                    "offer_made_at": application.offer_made_at,
+                    "email": email,
+                    "full_name": full_name,
+                })
+            elif application.due_action == DUE_REVIEW_SLA and application.status == ApplicationStatus.SUBMITTED:
+                # Remind the reviewers again every SLA period until someone picks it up
+                application.due_at = now + timedelta(hours=settings.REVIEW_SLA_HOURS)
+                overdue.append({
+                    "application_id": application.id,
+                    "project_name": application.project_name,
+                    "province": application.province,
+                    "submitted_at": application.created_at.isoformat() if application.created_at else None,
+                })
+            else:
+                # The application moved on without going through the scheduler
+                application.due_at, application.due_action = None, None
+        db.commit()
+    finally:
+        db.close()
+    
+    if expired:
+        publish_status_changes(expired)
+        send_application_status_emails.apply_async(args=[status_notifications(expired)])
+    if overdue:
+        send_review_sla_escalation.apply_async(args=[overdue])
+    logger.info(f"Due applications: {len(expired)} offers expired, {len(overdue)} reviews escalated")
+    if len(claimed) == batch_size:
+        process_due_applications.delay(batch_size)
+    return {"expired": len(expired), "escalated": len(overdue)}
+
+
+@celery_app.task
+def backfill_due_dates(after_id: int = 0, chunk_size: int = 1000):
+    """Schedule review SLAs and offer expiry for applications from before the scheduler"""
+    db = SessionLocal()
+    try:
+        applications = (
+            db.query(PropertyApplication)
+            .filter(
+                PropertyApplication.id > after_id,
+                PropertyApplication.due_at.is_(None),
+                PropertyApplication.status.in_([ApplicationStatus.SUBMITTED, ApplicationStatus.OFFER_MADE]),
+            )
+            .order_by(PropertyApplication.id)
+            .limit(chunk_size)
+            .all()
+        )
+        for application in applications:
+            since = application.offer_made_at if application.status == ApplicationStatus.OFFER_MADE else None
+            application.due_at, application.due_action = next_due(
+                application.status, since or application.created_at or datetime.now(timezone.utc)
+            )
+        db.commit()
+        last_id = applications[-1].id if applications else after_id
+    finally:
+        db.close()
+    
+    logger.info(f"Due dates backfilled for {len(applications)} applications up to id {last_id}")
+    if len(applications) == chunk_size:
+        backfill_due_dates.delay(last_id, chunk_size)
+    return {"processed": len(applications), "last_id": last_id}
+
+
+def _move_rows(db, model, archive_model, condition):
+    """INSERT ... SELECT into the archive table, then delete from the hot one"""
+    columns = [column.name for column in archive_model.__table__.columns]
+    source = model.__table__
+    db.execute(
+        insert(archive_model.__table__)
+        .from_select(columns, select(*[source.c[name] for name in columns]).where(condition))
+    )
+    db.execute(delete(source).where(condition))
@@ -0,0 +1,230 @@
+"""
+Media tasks
+Document ingestion on the media queue: page count, embedded text, deed number
+and land area are read from uploaded PDFs and stored on the document, so
+reviewers don't have to open every file. Deed numbers feed search and
+duplicate detection. Photos get a perceptual hash, so reviewers can find the
+same picture on other listings (see photohash.py).
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, or_, update
+from sqlalchemy.sql import func
+
+from celery_app import celery_app
+from config import settings
+from crud import find_similar_photos
+from database import SessionLocal, PropertyApplication, PropertyDocument, PropertyPhoto
+from documents import DocumentExtractionError, DocumentTimeout, extract_in_subprocess
+import photohash
+from search import search_document
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A document queued or being extracted for this long lost its task (worker
+# killed, message dropped) and is queued again by the sweep
+REQUEUE_AFTER = timedelta(hours=1)
+
+
+@celery_app.task
+def ingest_property_document(document_id: int):
+    """Extract one uploaded document and store what was found on it"""
+    db = SessionLocal()
+    try:
+        # Claim the row: of two tasks for the same document only one gets it
+        claimed = db.execute(
+            update(PropertyDocument)
+            .where(PropertyDocument.id == document_id, PropertyDocument.ingestion_status.in_(("pending", "queued")))
+            .values(ingestion_status="processing", queued_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        document = db.query(PropertyDocument).filter(PropertyDocument.id == document_id).first()
+        if not claimed:
+            return {"document_id": document_id, "status": document.ingestion_status if document else None}
+
+        try:
+            try:
+                extracted = extract_in_subprocess(
+                    document.file_path,
+                    timeout=settings.DOCUMENT_EXTRACTION_TIMEOUT_SECONDS,
+                    max_memory_mb=settings.DOCUMENT_EXTRACTION_MEMORY_MB,
+                )
+            except (DocumentTimeout, DocumentExtractionError) as exc:
+                # A broken or oversized file won't get better on retry
+                logger.warning(f"Could not extract document {document_id}: {exc}")
+                document.ingestion_status = "failed"
+                document.ingestion_error = f"{type(exc).__name__}: {exc}"[:1000]
+                document.ingested_at = func.now()
+                db.commit()
+                return {"document_id": document_id, "status": "failed"}
+
+            document.page_count = extracted["page_count"]
+            document.extracted_text = extracted["text"]
+            document.deed_number = extracted["deed_number"]
+            document.land_area_sqm = extracted["area_sqm"]
+            document.ingestion_status = "done"
+            document.ingestion_error = None
+            document.ingested_at = func.now()
+            db.flush()
+
+            _index_deed_numbers(db, document.application)
+            db.commit()
+            logger.info(f"Ingested document {document_id}: {document.page_count} pages, deed {document.deed_number}")
+            return {
+                "document_id": document_id,
+                "status": "done",
+                "page_count": document.page_count,
+                "deed_number": document.deed_number,
+            }
+        except Exception:
+            # Anything else (couldn't start the process, database trouble) fails
+            # the task. The row goes back to pending for the next sweep instead
+            # of sitting in processing until REQUEUE_AFTER
+            db.rollback()
+            db.execute(
+                update(PropertyDocument)
+                .where(PropertyDocument.id == document_id, PropertyDocument.ingestion_status == "processing")
+                .values(ingestion_status="pending", queued_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            raise
+    finally:
+        db.close()
+
+
+@celery_app.task
+def ingest_pending_documents(after_id: int = 0, chunk_size: int = 500):
+    """
+    Queue ingestion for every document still waiting, a chunk at a time
+    Documents are marked queued, so the next sweep doesn't queue them again
+    while they wait behind a backlog; only ones queued REQUEUE_AFTER ago are.
+    """
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        document_ids = [
+            row.id for row in
+            db.query(PropertyDocument.id)
+            .filter(
+                PropertyDocument.id > after_id,
+                or_(
+                    PropertyDocument.ingestion_status == "pending",
+                    and_(
+                        PropertyDocument.ingestion_status.in_(("queued", "processing")),
+                        PropertyDocument.queued_at < now - REQUEUE_AFTER,
+                    ),
+                ),
+            )
+            .order_by(PropertyDocument.id)
+            .limit(chunk_size)
+        ]
+        if document_ids:
+            db.execute(
+                update(PropertyDocument)
+                .where(PropertyDocument.id.in_(document_ids))
+                .values(ingestion_status="queued", queued_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+    finally:
+        db.close()
+
+    for document_id in document_ids:
+        ingest_property_document.delay(document_id)
+    last_id = document_ids[-1] if document_ids else after_id
+    if len(document_ids) == chunk_size:
+        ingest_pending_documents.delay(last_id, chunk_size)
+    return {"queued": len(document_ids), "last_id": last_id}
+
+
+@celery_app.task
+def hash_property_photo(photo_id: int):
+    """Store the perceptual hash of one uploaded photo"""
+    db = SessionLocal()
+    try:
+        photo = db.query(PropertyPhoto).filter(PropertyPhoto.id == photo_id).first()
+        if photo is None or photo.hashed_at is not None:
+            return {"photo_id": photo_id, "status": "done" if photo else None}
+
+        try:
+            value = photohash.dhash(photo.file_path)
+        except Exception as exc:
+            # Missing or not an image: retrying won't help
+            logger.warning(f"Could not hash photo {photo_id}: {exc}")
+            photo.hashed_at = func.now()
+            db.commit()
+            return {"photo_id": photo_id, "status": "failed"}
+
+        photo.perceptual_hash = photohash.to_signed(value)
+        if photohash.is_detailed(value):
+            photo.hash_chunk_0, photo.hash_chunk_1, photo.hash_chunk_2, photo.hash_chunk_3 = photohash.chunks(value)
+        photo.hashed_at = func.now()
+        db.commit()
+
+        # Same photo on another listing: a copy, or someone else's pictures.
+        # Only reported, developers' project photos are legitimately shared
+        matches = find_similar_photos(
+            db, value, settings.PHOTO_MATCH_DISTANCE, exclude_application_id=photo.application_id
+        )
+        similar_application_ids = sorted({match.application_id for match, _ in matches})
+        if similar_application_ids:
+            logger.info(
+                f"Photo {photo_id} of application {photo.application_id} also appears on "
+                f"applications {similar_application_ids}"
+            )
+        return {"photo_id": photo_id, "status": "done", "similar_application_ids": similar_application_ids}
+    finally:
+        db.close()
+
+
+@celery_app.task
+def hash_pending_photos(after_id: int = 0, chunk_size: int = 500):
+    """Queue hashing for every photo not hashed yet, a chunk at a time"""
+    db = SessionLocal()
+    try:
+        photo_ids = [
+            row.id for row in
+            db.query(PropertyPhoto.id)
+            .filter(PropertyPhoto.id > after_id, PropertyPhoto.hashed_at.is_(None))
+            .order_by(PropertyPhoto.id)
+            .limit(chunk_size)
+        ]
+    finally:
+        db.close()
+
+    for photo_id in photo_ids:
+        hash_property_photo.delay(photo_id)
+    last_id = photo_ids[-1] if photo_ids else after_id
+    if len(photo_ids) == chunk_size:
+        hash_pending_photos.delay(last_id, chunk_size)
+    return {"queued": len(photo_ids), "last_id": last_id}
+
+
+def _index_deed_numbers(db, application):
+    """
+    Add the application's deed numbers to its search text, and link it to the
+    first other application that uploaded a deed with the same number
+    """
+    deed_numbers = sorted({
+        number for (number,) in
+        db.query(PropertyDocument.deed_number)
+        .filter(PropertyDocument.application_id == application.id, PropertyDocument.deed_number.isnot(None))
+    })
+    application.search_text = search_document(
+        application.project_name, application.property_address, application.province, *deed_numbers
+    )
+    if not deed_numbers or application.duplicate_of_id is not None:
+        return
+
+    first = (
+        db.query(PropertyApplication.id, PropertyApplication.duplicate_of_id)
+        .join(PropertyDocument, PropertyDocument.application_id == PropertyApplication.id)
+        .filter(PropertyDocument.deed_number.in_(deed_numbers), PropertyApplication.id < application.id)
+        .order_by(PropertyApplication.id)
+        .first()
+    )
+    if first is not None:
+        application.duplicate_of_id = first.duplicate_of_id or first.id
@@ -1,14 +1,28 @@
 """
 Test configuration and fixtures
 """
+import os
+import tempfile
+
+# Keep metrics and live events in-process for tests, no Redis needed
+os.environ.setdefault("METRICS_BACKEND", "memory")
+os.environ.setdefault("EVENTS_BACKEND", "memory")
+# Publish task messages in the request thread, journal them to a temp dir (no Redis here)
+os.environ.setdefault("ENQUEUE_MODE", "sync")
+os.environ.setdefault("ENQUEUE_JOURNAL_DIR", tempfile.mkdtemp(prefix="ibuyer-enqueue-"))
+
 import pytest
+import redis
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
+import main
 from main import app
-from database import Base, get_db
+from config import settings
+from database import Base, PropertyApplication, get_db
+from tasks import maintenance, media
 
 
 # Create in-memory SQLite database for tests
@@ -67,4 +81,158 @@ def auth_headers(client, test_user):
     })
     
     token = response.json()["access_token"]
-    return {"Authorization": f"Bearer {token}"}
\ No newline at end of file
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def reviewer_headers(auth_headers, monkeypatch):
+    """Authentication headers for a reviewer (listed in mixed case, the check ignores it)"""
+    monkeypatch.setattr(settings, "REVIEWER_EMAILS", "Test@Example.com")
+    return auth_headers
+
+
+@pytest.fixture
+def sent_batches(monkeypatch):
+    """Capture status email jobs instead of talking to the broker"""
+    batches = []
+    
+    def enqueue(task, args=None, kwargs=None, **options):
+        assert task is main.send_application_status_emails
+        batches.append(args[0])
+    
+    monkeypatch.setattr(main, "enqueue", enqueue)
+    return batches
+
+
+class Sweep:
+    """
+    Runs a chunked sweep task in-process against the test database
+    The follow-up chunks it queues land in next_chunks and the per-row jobs in
+    queued, instead of going to the broker.
+    """
+    
+    def __init__(self, monkeypatch):
+        self.monkeypatch = monkeypatch
+        self.task = None
+        self.next_chunks = []
+        self.queued = []
+        for module in (maintenance, media):
+            monkeypatch.setattr(module, "SessionLocal", TestingSessionLocal)
+    
+    def record(self, task, row_task=None):
+        self.task = task
+        self.monkeypatch.setattr(task, "delay", lambda *args: self.next_chunks.append(args))
+        if row_task is not None:
+            self.monkeypatch.setattr(row_task, "delay", self.queued.append)
+        return self
+    
+    def finish(self):
+        """Run the queued chunks, and the ones they queue, until the sweep is done"""
+        while self.next_chunks:
+            self.task(*self.next_chunks.pop())
+
+
+@pytest.fixture(scope="module")
+def postgres_engine():
+    """A scratch Postgres database from TEST_POSTGRES_URL, tables dropped first"""
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL not set")
+    postgres = create_engine(url)
+    Base.metadata.drop_all(bind=postgres)
+    Base.metadata.create_all(bind=postgres)
+    yield postgres
+    Base.metadata.drop_all(bind=postgres)
+    postgres.dispose()
+
+
+@pytest.fixture
+def sweep(monkeypatch):
+    return Sweep(monkeypatch)
+
+
+def submit(client, headers, address, project_name="Noble Remix", size=35.0):
+    """Submit a condo listing, returns the created application as JSON"""
+    return client.post("/property-application", json={
+        "property_type": "condo",
+        "project_name": project_name,
+        "province": "Bangkok",
+        "property_address": address,
+        "property_size_sqm": size,
+        "bedrooms": 1,
+        "bathrooms": 1,
+        "asking_price": 4500000,
+        "property_condition": "good",
+        "preferred_timeline": "asap"
+    }, headers=headers).json()
+
+
+def get_application(application_id):
+    db = TestingSessionLocal()
+    try:
+        return db.get(PropertyApplication, application_id)
+    finally:
+        db.close()
+
+
+class FakePipeline:
+    """Queues commands and runs them all on execute, like MULTI/EXEC"""
+    
+    def __init__(self, target):
+        self.target = target
+        self.commands = []
+    
+    def get(self, key):
+        self.commands.append(lambda: self.target.get(key))
+    
+    def delete(self, key):
+        self.commands.append(lambda: self.target.delete(key))
+    
+    def hincrbyfloat(self, key, field, amount):
+        self.commands.append(lambda: self.target.hincrbyfloat(key, field, amount))
+    
+    def execute(self):
+        if self.target.down:
+            raise redis.ConnectionError("down")
+        return [command() for command in self.commands]
+
+
+class FakeRedis:
+    """Just enough of a Redis client for the Redis backed stores, keys never expire"""
+    
+    def __init__(self):
+        self.keys = {}
+        self.down = False
+    
+    def check(self):
+        if self.down:
+            raise redis.ConnectionError("down")
+    
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+    
+    def set(self, key, value, ex=None, px=None):
+        self.check()
+        self.keys[key] = str(value).encode()
+    
+    def get(self, key):
+        self.check()
+        return self.keys.get(key)
+    
+    def delete(self, key):
+        self.check()
+        return int(self.keys.pop(key, None) is not None)
+    
+    def exists(self, key):
+        self.check()
+        return int(key in self.keys)
+    
+    def hincrbyfloat(self, key, field, amount):
+        self.check()
+        fields = self.keys.setdefault(key, {})
+        fields[field] = fields.get(field, 0.0) + amount
+        return fields[field]
+    
+    def hgetall(self, key):
+        self.check()
+        return {field: str(value) for field, value in self.keys.get(key, {}).items()}
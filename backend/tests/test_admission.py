@@ -0,0 +1,118 @@
+"""
+Admission control tests
+"""
+import asyncio
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+import main
+from admission import AdmissionMiddleware, Overloaded, RouteLimit, parse_limits
+from metrics import metrics
+
+
+class TestRouteLimit:
+    """Slots, queue budget and hand-over"""
+
+    def test_waiter_gets_the_released_slot(self):
+        async def scenario():
+            limit = RouteLimit("/login", concurrency=1, queue_budget=1)
+            await limit.acquire()
+            waiter = asyncio.ensure_future(limit.acquire())
+            await asyncio.sleep(0)
+            assert limit.waiting == 1
+            limit.release()
+            await waiter
+            return limit.active, limit.waiting
+
+        assert asyncio.run(scenario()) == (1, 0)
+
+    def test_times_out_after_budget(self):
+        async def scenario():
+            limit = RouteLimit("/login", concurrency=1, queue_budget=0.01)
+            await limit.acquire()
+            with pytest.raises(Overloaded) as exc:
+                await limit.acquire()
+            limit.release()
+            return exc.value.reason, limit.active, limit.waiting
+
+        assert asyncio.run(scenario()) == ("timeout", 0, 0)
+
+    def test_full_queue_sheds_immediately(self):
+        async def scenario():
+            limit = RouteLimit("/login", concurrency=1, queue_budget=1, max_waiting=1)
+            await limit.acquire()
+            waiter = asyncio.ensure_future(limit.acquire())
+            await asyncio.sleep(0)
+            with pytest.raises(Overloaded) as exc:
+                await limit.acquire()
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            return exc.value.reason, limit.waiting
+
+        assert asyncio.run(scenario()) == ("queue_full", 0)
+
+    def test_parse_limits(self):
+        limits = parse_limits("/login=8:0.5, /register=2")
+        assert (limits["/login"].concurrency, limits["/login"].queue_budget) == (8, 0.5)
+        assert (limits["/register"].concurrency, limits["/register"].queue_budget) == (2, 1.0)
+
+    def test_needs_a_slot(self):
+        with pytest.raises(ValueError):
+            RouteLimit("/login", concurrency=0, queue_budget=1)
+
+
+class TestAdmissionMiddleware:
+    """Only limited routes queue, the rest go straight through"""
+
+    def test_burst_is_shed_while_other_routes_answer(self):
+        async def scenario():
+            release = asyncio.Event()
+
+            async def slow(request):
+                await release.wait()
+                return PlainTextResponse("done")
+
+            async def health(request):
+                return PlainTextResponse("ok")
+
+            app = Starlette(routes=[Route("/slow", slow, methods=["POST"]), Route("/health", health)])
+            limits = {"/slow": RouteLimit("/slow", concurrency=1, queue_budget=0.05, max_waiting=1)}
+            transport = httpx.ASGITransport(app=AdmissionMiddleware(app, limits, retry_after=3))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                running = asyncio.ensure_future(client.post("/slow"))
+                await asyncio.sleep(0.01)
+                shed = await asyncio.gather(client.post("/slow"), client.post("/slow"))
+                health = await client.get("/health")
+                release.set()
+                return (await running), shed, health
+
+        running, shed, health = asyncio.run(scenario())
+        assert running.status_code == 200
+        assert sorted(response.status_code for response in shed) == [503, 503]
+        assert all(response.headers["Retry-After"] == "3" for response in shed)
+        assert health.status_code == 200
+        assert metrics.value("http_requests_shed_total", {"route": "/slow", "reason": "queue_full"}) >= 1
+        assert metrics.value("http_requests_shed_total", {"route": "/slow", "reason": "timeout"}) >= 1
+
+
+class TestApiAdmission:
+    """The expensive API routes are limited, health never is"""
+
+    def test_login_is_shed_when_its_slots_are_taken(self, client, monkeypatch):
+        limit = main.admission_limits["/login"]
+        monkeypatch.setattr(limit, "active", limit.concurrency)
+        monkeypatch.setattr(limit, "queue_budget", 0.01)
+
+        response = client.post("/login", json={"email": "a@b.c", "password": "secret"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(main.settings.ADMISSION_RETRY_AFTER_SECONDS)
+        assert client.get("/api/health").status_code == 200
+        assert 'http_requests_shed_total{reason="timeout",route="/login"}' in client.get("/metrics").text
+
+    def test_limited_routes(self):
+        assert {"/login", "/register", "/submit-property-with-registration"} <= set(main.admission_limits)
+        assert "/api/health" not in main.admission_limits
@@ -0,0 +1,112 @@
+"""
+Archival of finished applications tests
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from crud import get_user_applications, get_all_applications
+from database import (
+    ApplicationStatus, PropertyApplication, PropertyDocument,
+    ArchivedPropertyApplication, ArchivedPropertyDocument,
+)
+from migrate import NEW_COLUMNS
+from tasks import maintenance
+from tests.conftest import TestingSessionLocal, submit
+
+
+def age(application_id, status, days):
+    """Put an application in a status, last touched `days` ago"""
+    db = TestingSessionLocal()
+    try:
+        application = db.get(PropertyApplication, application_id)
+        application.status = status
+        db.flush()
+        application.updated_at = datetime.now(timezone.utc) - timedelta(days=days)
+        db.commit()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def applications(client, auth_headers):
+    """Old completed, old declined, recent completed, and old but still open"""
+    ids = [submit(client, auth_headers, f"Room {n}")["id"] for n in range(4)]
+    age(ids[0], ApplicationStatus.COMPLETED, 400)
+    age(ids[1], ApplicationStatus.OFFER_DECLINED, 400)
+    age(ids[2], ApplicationStatus.COMPLETED, 10)
+    age(ids[3], ApplicationStatus.OFFER_MADE, 400)
+
+    db = TestingSessionLocal()
+    db.add(PropertyDocument(
+        application_id=ids[0], document_name="deed.pdf", document_type="title_deed",
+        file_path="/uploads/deed.pdf", file_size=1,
+    ))
+    db.commit()
+    db.close()
+    return ids
+
+
+class TestArchiveTask:
+    """Finished applications move to the archive in resumable chunks"""
+
+    def test_moves_old_finished_applications_in_chunks(self, applications, sweep):
+        sweep.record(maintenance.archive_finished_applications)
+        assert maintenance.archive_finished_applications(0, 1) == {"archived": 1, "last_id": applications[0]}
+        assert sweep.next_chunks == [(applications[0], 1)]
+        sweep.finish()
+
+        db = TestingSessionLocal()
+        try:
+            assert sorted(a.id for a in db.query(PropertyApplication)) == applications[2:]
+            archived = db.query(ArchivedPropertyApplication).order_by(ArchivedPropertyApplication.id).all()
+            assert [a.id for a in archived] == applications[:2]
+            assert archived[0].status == ApplicationStatus.COMPLETED
+            assert archived[0].property_address == "Room 0"
+            assert db.query(PropertyDocument).count() == 0
+            assert db.query(ArchivedPropertyDocument).one().application_id == applications[0]
+        finally:
+            db.close()
+
+    def test_nothing_to_archive(self, client, auth_headers, sweep):
+        submit(client, auth_headers, "Room 1")
+        assert maintenance.archive_finished_applications(0, 10) == {"archived": 0, "last_id": 0}
+
+
+class TestReadingArchivedApplications:
+    """Archived applications are only read when asked for"""
+
+    @pytest.fixture(autouse=True)
+    def archived(self, applications, sweep):
+        maintenance.archive_finished_applications(0, 10)
+
+    def test_crud_include_archived(self, applications):
+        db = TestingSessionLocal()
+        try:
+            user_id = db.get(PropertyApplication, applications[2]).user_id
+            assert [a.id for a in get_user_applications(db, user_id)] == applications[2:]
+            assert [a.id for a in get_user_applications(db, user_id, include_archived=True)] == applications
+            assert len(get_all_applications(db)) == 2
+            assert len(get_all_applications(db, include_archived=True)) == 4
+        finally:
+            db.close()
+
+    def test_my_applications_include_archived(self, client, auth_headers, applications):
+        response = client.get("/my-applications", headers=auth_headers)
+        assert [a["id"] for a in response.json()] == applications[2:]
+
+        response = client.get("/my-applications?include_archived=true", headers=auth_headers)
+        assert response.status_code == 200
+        assert [a["id"] for a in response.json()] == applications
+        assert response.json()[1]["status"] == "offer_declined"
+
+
+class TestArchiveSchema:
+    """Archive tables on existing Postgres databases keep up with the live ones"""
+
+    def test_new_columns_are_added_to_archives(self):
+        assert ("property_applications_archive", "due_at", "TIMESTAMP WITH TIME ZONE") in NEW_COLUMNS
+        for table in ("property_applications", "property_documents", "property_photos"):
+            for name, column, type_ in NEW_COLUMNS:
+                if name == table:
+                    assert (f"{table}_archive", column, type_) in NEW_COLUMNS
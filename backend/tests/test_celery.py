@@ -0,0 +1,84 @@
+"""
+Celery queue topology and worker profile tests
+"""
+import pytest
+
+from celery_app import celery_app, PRIORITY_LOW
+from config import settings
+from worker import worker_argv, WORKER_PROFILES
+
+
+def route_for(task_name):
+    return celery_app.amqp.router.route({}, task_name)
+
+
+class TestTaskRouting:
+    """Tasks land on the queue for their kind of work"""
+    
+    def test_email_tasks_use_email_queue(self):
+        route = route_for("tasks.email.send_property_submission_email")
+        assert route["queue"].name == "email"
+    
+    def test_maintenance_tasks_are_low_priority(self):
+        route = route_for("tasks.maintenance.cleanup")
+        assert route["queue"].name == "maintenance"
+        assert route["priority"] == PRIORITY_LOW
+    
+    def test_unrouted_tasks_use_batch_queue(self):
+        assert route_for("tasks.unknown.job")["queue"].name == "maintenance"
+
+
+class TestWorkerProfiles:
+    """Worker command line built from CELERY_WORKER_PROFILE"""
+    
+    def test_solo_profile_consumes_every_queue_email_first(self):
+        argv = worker_argv("solo")
+        assert "--pool=solo" in argv
+        assert "--concurrency=1" in argv
+        assert "--queues=email,media,valuation,maintenance" in argv
+    
+    def test_prefork_profile_autoscales(self):
+        argv = worker_argv("prefork")
+        assert "--pool=prefork" in argv
+        assert "--autoscale=4,1" in argv
+        assert not any(arg.startswith("--concurrency") for arg in argv)
+    
+    def test_threads_profile_only_sends_email(self):
+        argv = worker_argv("threads")
+        assert "--pool=threads" in argv
+        assert "--queues=email" in argv
+    
+    def test_environment_overrides(self, monkeypatch):
+        monkeypatch.setattr(settings, "CELERY_QUEUES", "valuation")
+        monkeypatch.setattr(settings, "CELERY_AUTOSCALE", "8,2")
+        argv = worker_argv("prefork")
+        assert "--queues=valuation" in argv
+        assert "--autoscale=8,2" in argv
+    
+    def test_fixed_concurrency_disables_autoscale(self, monkeypatch):
+        monkeypatch.setattr(settings, "CELERY_CONCURRENCY", "3")
+        argv = worker_argv("prefork")
+        assert "--concurrency=3" in argv
+        assert not any(arg.startswith("--autoscale") for arg in argv)
+    
+    def test_beat_only_when_enabled(self, monkeypatch):
+        assert "--beat" not in worker_argv("solo")
+        monkeypatch.setattr(settings, "CELERY_BEAT", True)
+        assert "--beat" in worker_argv("solo")
+    
+    def test_default_profile_from_settings(self, monkeypatch):
+        monkeypatch.setattr(settings, "CELERY_WORKER_PROFILE", "threads")
+        assert "--pool=threads" in worker_argv()
+    
+    def test_unknown_profile(self):
+        with pytest.raises(ValueError):
+            worker_argv("gevent")
+    
+    def test_profiles_only_reference_known_queues(self):
+        queue_names = {queue.name for queue in celery_app.conf.task_queues}
+        for profile in WORKER_PROFILES.values():
+            assert set(profile["queues"]) <= queue_names
+    
+    def test_scheduled_tasks_exist(self):
+        for entry in celery_app.conf.beat_schedule.values():
+            assert entry["task"] in celery_app.tasks
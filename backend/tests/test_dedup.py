@@ -0,0 +1,77 @@
+"""
+Near-duplicate listing detection tests
+"""
+import pytest
+
+from database import PropertyApplication
+from dedup import unit_tokens, listing_fingerprint
+from tasks import maintenance
+from tests.conftest import TestingSessionLocal, get_application, submit
+
+
+class TestUnitTokens:
+    """Unit and floor numbers parsed from free-form addresses"""
+    
+    @pytest.mark.parametrize("address, tokens", [
+        ("Room 1203, Noble Remix, Sukhumvit 39", ["u:1203"]),
+        ("1203 Sukhumvit Soi 39", ["u:1203"]),
+        ("rm.1203 fl 12", ["u:1203"]),
+        ("Unit 5, 12th floor", ["f:12", "u:5"]),
+        ("ห้อง 5 ชั้น 12 ซอยสุขุมวิท", ["f:12", "u:5"]),
+        ("99/123 Moo 4, Nonthaburi", ["u:99/123"]),
+        ("No. 88 - 12 Rama 9", ["u:88/12"]),
+        ("Sukhumvit Soi 39, Bangkok", []),
+    ])
+    def test_parse(self, address, tokens):
+        assert unit_tokens(address) == tokens
+
+
+class TestFingerprint:
+    """Copies of the same unit share a fingerprint"""
+    
+    def test_same_unit_written_differently(self):
+        assert listing_fingerprint("Noble Remix", "condo", 35.2, 1, "Room 1203, Sukhumvit 39") == \
+            listing_fingerprint("noble-remix", "condo", 35.8, 1, "1203 Sukhumvit Soi 39, Bangkok")
+    
+    def test_different_units(self):
+        base = listing_fingerprint("Noble Remix", "condo", 35, 1, "Room 1203")
+        assert base != listing_fingerprint("Noble Remix", "condo", 35, 1, "Room 1204")
+        assert base != listing_fingerprint("Noble Remix", "condo", 35, 2, "Room 1203")
+        assert base != listing_fingerprint("Noble Remix", "condo", 60, 1, "Room 1203")
+        assert base != listing_fingerprint("Rhythm", "condo", 35, 1, "Room 1203")
+    
+    def test_no_unit_number_no_fingerprint(self):
+        assert listing_fingerprint("Noble Remix", "condo", 35, 1, "Sukhumvit 39") is None
+
+
+class TestDuplicateLinking:
+    """New submissions are linked to the first copy of the same unit"""
+    
+    def test_copies_point_at_the_first_submission(self, client, auth_headers):
+        first = submit(client, auth_headers, "Room 1203, Sukhumvit 39")
+        second = submit(client, auth_headers, "1203 Sukhumvit Soi 39", size=35.5)
+        third = submit(client, auth_headers, "Unit 1203 Noble Remix")
+        other = submit(client, auth_headers, "Room 1204, Sukhumvit 39")
+        
+        assert get_application(first["id"]).duplicate_of_id is None
+        assert get_application(second["id"]).duplicate_of_id == first["id"]
+        assert get_application(third["id"]).duplicate_of_id == first["id"]
+        assert get_application(other["id"]).duplicate_of_id is None
+    
+    def test_backfill_in_chunks(self, client, auth_headers, sweep):
+        ids = [submit(client, auth_headers, address)["id"] for address in (
+            "Room 1203, Sukhumvit 39", "Room 1204", "1203 Sukhumvit", "Sukhumvit 39", "Unit 1203"
+        )]
+        db = TestingSessionLocal()
+        db.query(PropertyApplication).update({"fingerprint": None, "duplicate_of_id": None})
+        db.commit()
+        db.close()
+        
+        sweep.record(maintenance.backfill_listing_fingerprints)
+        result = maintenance.backfill_listing_fingerprints(0, 2)
+        assert result == {"processed": 2, "duplicates": 0, "last_id": ids[1]}
+        assert sweep.next_chunks == [(ids[1], 2)]
+        sweep.finish()
+        
+        assert [get_application(i).duplicate_of_id for i in ids] == [None, None, ids[0], None, ids[0]]
+        assert get_application(ids[3]).fingerprint is None
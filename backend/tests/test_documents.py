@@ -0,0 +1,219 @@
+"""
+Document ingestion tests
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+from database import PropertyDocument
+from documents import (
+    extract_key_fields, extract_pdf, extract_in_subprocess, DocumentExtractionError, DocumentTimeout,
+)
+from tasks import media
+from tests.conftest import TestingSessionLocal, get_application, submit
+
+
+def make_pdf(path, pages):
+    """Write a minimal PDF with one line of Helvetica text per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for line in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({line}) Tj ET".encode()
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream.decode()}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{number} 0 R" for number in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number, content in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n{content}\nendobj\n".encode()
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    body += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(body)
+    return str(path)
+
+
+class TestKeyFields:
+    """Deed number and area picked out of extracted text"""
+
+    @pytest.mark.parametrize("text, deed_number, area_sqm", [
+        ("Title Deed No. 12345 Area 1 rai", "12345", None),
+        ("CHANOTE NUMBER: 98,765", "98765", None),
+        ("โฉนดที่ดิน เลขที่ ๑๒๓๔๕ เนื้อที่ ๑ ไร่ ๒ งาน ๕๐ ตารางวา", "12345", 1600 + 800 + 200),
+        ("Condominium unit, area 35.5 sq.m.", None, 35.5),
+        ("ห้องชุด เนื้อที่ 1,250 ตร.ม.", None, 1250),
+        ("Nothing useful here", None, None),
+    ])
+    def test_fields(self, text, deed_number, area_sqm):
+        assert extract_key_fields(text) == {"deed_number": deed_number, "area_sqm": area_sqm}
+
+
+class TestExtraction:
+    """PDFs are read page by page, with limits"""
+
+    def test_extract_pdf(self, tmp_path):
+        path = make_pdf(tmp_path / "deed.pdf", ["Title Deed No. 4521", "Area 120 sq.m."])
+        extracted = extract_pdf(path)
+        assert extracted["page_count"] == 2
+        assert "Title Deed No. 4521" in extracted["text"]
+        assert extracted["deed_number"] == "4521"
+        assert extracted["area_sqm"] == 120
+
+    def test_page_and_text_limits(self, tmp_path):
+        path = make_pdf(tmp_path / "long.pdf", [f"Page {n} of a long scan" for n in range(5)])
+        extracted = extract_pdf(path, max_pages=2)
+        assert extracted["page_count"] == 5
+        assert "Page 1" in extracted["text"] and "Page 2" not in extracted["text"]
+        assert extract_pdf(path, max_chars=10)["text"] == "Page 0 of"
+
+    def test_runs_in_a_child_process(self, tmp_path):
+        extracted = extract_in_subprocess(make_pdf(tmp_path / "deed.pdf", ["Chanote No. 77"]), timeout=60)
+        assert extracted["deed_number"] == "77"
+        with pytest.raises(DocumentExtractionError, match="FileNotFoundError"):
+            extract_in_subprocess(str(tmp_path / "missing.pdf"), timeout=60)
+
+    def test_memory_limit(self, tmp_path):
+        with pytest.raises(DocumentExtractionError):
+            extract_in_subprocess(make_pdf(tmp_path / "deed.pdf", ["Chanote No. 77"]), timeout=60, max_memory_mb=16)
+
+
+def ingest_in_worker_child(document_id):
+    """Runs inside a billiard pool process, daemonic like Celery's prefork children"""
+    import billiard
+    assert billiard.current_process().daemon
+    return media.ingest_property_document(document_id)
+
+
+def add_document(application_id, file_path):
+    db = TestingSessionLocal()
+    try:
+        document = PropertyDocument(
+            application_id=application_id, document_name="deed.pdf", document_type="title_deed",
+            file_path=file_path, file_size=1,
+        )
+        db.add(document)
+        db.commit()
+        return document.id
+    finally:
+        db.close()
+
+
+def load_document(document_id):
+    db = TestingSessionLocal()
+    try:
+        return db.get(PropertyDocument, document_id)
+    finally:
+        db.close()
+
+
+@pytest.mark.usefixtures("sweep")
+class TestIngestionTask:
+    """Extracted fields are stored and feed search and duplicate detection"""
+
+    def test_ingest_stores_fields_and_links_same_deed(self, client, auth_headers, tmp_path):
+        deed = make_pdf(tmp_path / "deed.pdf", ["Title Deed No. 4521", "Area 120 sq.m."])
+        first = submit(client, auth_headers, "Sukhumvit 39")
+        second = submit(client, auth_headers, "Sukhumvit Soi 39, Bangkok")
+        first_document = add_document(first["id"], deed)
+        second_document = add_document(second["id"], deed)
+
+        result = media.ingest_property_document(first_document)
+        assert result == {"document_id": first_document, "status": "done", "page_count": 2, "deed_number": "4521"}
+        media.ingest_property_document(second_document)
+
+        document = load_document(first_document)
+        assert document.ingestion_status == "done" and document.ingested_at is not None
+        assert document.land_area_sqm == 120
+        assert "4521" in get_application(first["id"]).search_text.split()
+        assert get_application(first["id"]).duplicate_of_id is None
+        assert get_application(second["id"]).duplicate_of_id == first["id"]
+
+        # Already ingested documents are left alone
+        assert media.ingest_property_document(first_document) == {"document_id": first_document, "status": "done"}
+
+    def test_failed_extraction_is_recorded(self, client, auth_headers, monkeypatch):
+        def too_slow(path, timeout, max_memory_mb):
+            raise DocumentTimeout("Extraction took longer than 60s")
+        monkeypatch.setattr(media, "extract_in_subprocess", too_slow)
+        application = submit(client, auth_headers, "Sukhumvit 39")
+        document_id = add_document(application["id"], "/nowhere/deed.pdf")
+
+        assert media.ingest_property_document(document_id)["status"] == "failed"
+        document = load_document(document_id)
+        assert document.ingestion_status == "failed"
+        assert document.ingestion_error.startswith("DocumentTimeout")
+
+    def test_unexpected_error_puts_the_document_back(self, client, auth_headers, monkeypatch, sweep):
+        def cannot_start(path, timeout, max_memory_mb):
+            raise OSError("Resource temporarily unavailable")
+        monkeypatch.setattr(media, "extract_in_subprocess", cannot_start)
+        application = submit(client, auth_headers, "Sukhumvit 39")
+        document_id = add_document(application["id"], "/nowhere/deed.pdf")
+
+        with pytest.raises(OSError):
+            media.ingest_property_document(document_id)
+        assert load_document(document_id).ingestion_status == "pending"
+        sweep.record(media.ingest_pending_documents, media.ingest_property_document)
+        media.ingest_pending_documents()
+        assert sweep.queued == [document_id]
+
+    def test_ingest_inside_prefork_worker_child(self, client, auth_headers, tmp_path):
+        from billiard.pool import Pool
+
+        application = submit(client, auth_headers, "Sukhumvit 39")
+        document_id = add_document(application["id"], make_pdf(tmp_path / "deed.pdf", ["Title Deed No. 88"]))
+        pool = Pool(1)
+        try:
+            result = pool.apply_async(ingest_in_worker_child, (document_id,)).get(timeout=60)
+        finally:
+            pool.terminate()
+            pool.join()
+        assert result["status"] == "done"
+        assert result["deed_number"] == "88"
+
+    def test_sweep_queues_pending_documents_in_chunks(self, client, auth_headers, sweep):
+        application = submit(client, auth_headers, "Sukhumvit 39")
+        ids = [add_document(application["id"], "/nowhere/deed.pdf") for _ in range(3)]
+        sweep.record(media.ingest_pending_documents, media.ingest_property_document)
+
+        assert media.ingest_pending_documents(0, 2) == {"queued": 2, "last_id": ids[1]}
+        assert sweep.next_chunks == [(ids[1], 2)]
+        sweep.finish()
+        assert sweep.queued == ids
+
+    def test_sweep_skips_queued_documents_until_stale(self, client, auth_headers, sweep):
+        application = submit(client, auth_headers, "Sukhumvit 39")
+        ids = [add_document(application["id"], "/nowhere/deed.pdf") for _ in range(2)]
+        sweep.record(media.ingest_pending_documents, media.ingest_property_document)
+
+        assert media.ingest_pending_documents()["queued"] == 2
+        assert load_document(ids[0]).ingestion_status == "queued"
+        # Still waiting behind a backlog: not queued a second time
+        assert media.ingest_pending_documents()["queued"] == 0
+
+        db = TestingSessionLocal()
+        db.get(PropertyDocument, ids[0]).queued_at = datetime.now(timezone.utc) - media.REQUEUE_AFTER * 2
+        db.commit()
+        db.close()
+        assert media.ingest_pending_documents() == {"queued": 1, "last_id": ids[0]}
+
+    def test_duplicate_task_does_not_extract_again(self, client, auth_headers, monkeypatch):
+        extracted = []
+        monkeypatch.setattr(media, "extract_in_subprocess", lambda path, **limits: extracted.append(path))
+        application = submit(client, auth_headers, "Sukhumvit 39")
+        document_id = add_document(application["id"], "/nowhere/deed.pdf")
+        db = TestingSessionLocal()
+        db.get(PropertyDocument, document_id).ingestion_status = "processing"  # Claimed by another task
+        db.commit()
+        db.close()
+
+        assert media.ingest_property_document(document_id) == {"document_id": document_id, "status": "processing"}
+        assert extracted == []
@@ -0,0 +1,172 @@
+"""
+Task enqueue client tests
+"""
+import fcntl
+import json
+import os
+import socket
+import stat
+
+import pytest
+from kombu.exceptions import OperationalError
+
+from enqueue import TaskPublisher
+from tracing import trace_id_var
+
+
+class FakeTask:
+    def __init__(self, broker, name):
+        self.broker = broker
+        self.name = name
+
+    def apply_async(self, **options):
+        if self.broker.down:
+            raise OperationalError("Error 111 connecting to localhost:6379. Connection refused.")
+        self.broker.published.append((self.name, options))
+
+
+class FakeBroker:
+    """Stands in for the Celery app: records published messages, can go down"""
+
+    def __init__(self):
+        self.down = False
+        self.published = []
+        self.tasks = {name: FakeTask(self, name) for name in ("tasks.email.welcome", "tasks.email.status")}
+
+
+@pytest.fixture
+def broker():
+    return FakeBroker()
+
+
+def journal_lines(directory):
+    lines = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as journal:
+            lines.extend(json.loads(line) for line in journal)
+    return lines
+
+
+class TestSyncMode:
+    """Publishing in the request thread"""
+
+    def test_publishes_with_headers_taken_at_enqueue(self, broker, tmp_path):
+        publisher = TaskPublisher(broker, str(tmp_path), mode="sync")
+        token = trace_id_var.set("trace-123")
+        try:
+            task_id = publisher.enqueue(broker.tasks["tasks.email.welcome"], args=[{"email": "a@b.c"}], priority=0)
+        finally:
+            trace_id_var.reset(token)
+
+        [(name, options)] = broker.published
+        assert name == "tasks.email.welcome"
+        assert options["args"] == [{"email": "a@b.c"}]
+        assert options["priority"] == 0
+        assert options["task_id"] == task_id
+        assert options["headers"]["trace_id"] == "trace-123"
+        assert options["headers"]["enqueued_at"] > 0
+        assert options["retry"] is False
+
+    def test_spills_while_broker_is_down_and_replays(self, broker, tmp_path):
+        publisher = TaskPublisher(broker, str(tmp_path), mode="sync")
+        broker.down = True
+        first = publisher.enqueue("tasks.email.welcome", args=[1])
+        publisher.enqueue("tasks.email.status", args=[2])
+
+        journaled = journal_lines(tmp_path)
+        assert [message["args"] for message in journaled] == [[1], [2]]
+        assert journaled[0]["task_id"] == first
+
+        # Still down: nothing is lost, the messages stay journaled
+        publisher._broker_down_until = 0
+        assert publisher.replay() == 0
+        assert len(journal_lines(tmp_path)) == 2
+
+        broker.down = False
+        publisher._broker_down_until = 0
+        assert publisher.replay() == 2
+        assert [options["args"] for _, options in broker.published] == [[1], [2]]
+        assert broker.published[0][1]["task_id"] == first
+        assert os.listdir(tmp_path) == []
+
+    def test_skips_the_broker_right_after_a_failure(self, broker, tmp_path):
+        publisher = TaskPublisher(broker, str(tmp_path), mode="sync", retry_seconds=60)
+        broker.down = True
+        publisher.enqueue("tasks.email.welcome")
+        broker.down = False
+        publisher.enqueue("tasks.email.welcome")
+        assert broker.published == []
+        assert len(journal_lines(tmp_path)) == 2
+
+    def test_journal_is_bounded(self, broker, tmp_path):
+        publisher = TaskPublisher(broker, str(tmp_path), mode="sync", journal_max_bytes=600)
+        broker.down = True
+        for number in range(10):
+            publisher.enqueue("tasks.email.welcome", args=[number])
+        assert 0 < len(journal_lines(tmp_path)) < 10
+        assert sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)) <= 600
+
+    def test_replays_journals_of_dead_processes_only(self, broker, tmp_path):
+        message = {"task": "tasks.email.welcome", "args": [], "kwargs": {}, "options": {}, "task_id": "t", "headers": {}}
+        # A running process holds the lock on its journal, the kernel drops it when the process dies
+        (tmp_path / "enqueue-web-1-12.jsonl").write_text(json.dumps(message) + "\n")
+        (tmp_path / "enqueue-web-2-12.jsonl").write_text(json.dumps(message) + "\n")
+        with open(tmp_path / "enqueue-web-1-12.jsonl") as running:
+            fcntl.flock(running, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            assert TaskPublisher(broker, str(tmp_path), mode="sync").replay() == 1
+        assert os.listdir(tmp_path) == ["enqueue-web-1-12.jsonl"]
+
+    def test_journal_is_locked_while_the_process_runs(self, broker, tmp_path):
+        publisher = TaskPublisher(broker, str(tmp_path), mode="sync")
+        broker.down = True
+        publisher.enqueue("tasks.email.welcome")
+        [name] = os.listdir(tmp_path)
+        assert name.startswith(f"enqueue-{socket.gethostname()}-{os.getpid()}-")
+
+        broker.down = False
+        assert TaskPublisher(broker, str(tmp_path), mode="sync").replay() == 0
+        publisher._broker_down_until = 0
+        assert publisher.replay() == 1
+        assert os.listdir(tmp_path) == []
+
+    def test_orphaned_journal_with_our_pid_is_kept(self, broker, tmp_path):
+        # Left by a container before a restart, same hostname, and pids start over
+        orphaned = tmp_path / f"enqueue-{socket.gethostname()}-{os.getpid()}.jsonl"
+        orphaned.write_text(json.dumps({"task": "tasks.email.welcome", "args": [1]}) + "\n")
+        publisher = TaskPublisher(broker, str(tmp_path), mode="sync", retry_seconds=60)
+        broker.down = True
+        publisher.enqueue("tasks.email.welcome", args=[2])
+        assert sorted(message["args"] for message in journal_lines(tmp_path)) == [[1], [2]]
+
+    def test_journal_is_private(self, broker, tmp_path):
+        publisher = TaskPublisher(broker, str(tmp_path / "journal"), mode="sync")
+        broker.down = True
+        publisher.enqueue("tasks.email.welcome", args=[{"password": "secret"}])
+        [name] = os.listdir(tmp_path / "journal")
+        assert stat.S_IMODE(os.stat(tmp_path / "journal" / name).st_mode) == 0o600
+        assert stat.S_IMODE(os.stat(tmp_path / "journal").st_mode) == 0o700
+
+    def test_unknown_mode(self, broker, tmp_path):
+        with pytest.raises(ValueError):
+            TaskPublisher(broker, str(tmp_path), mode="eager")
+
+
+class TestAsyncMode:
+    """Publishing from a background thread"""
+
+    def test_background_thread_publishes(self, broker, tmp_path):
+        publisher = TaskPublisher(broker, str(tmp_path), mode="async")
+        for number in range(5):
+            publisher.enqueue("tasks.email.status", args=[number])
+        assert publisher.flush()
+        assert [options["args"] for _, options in broker.published] == [[n] for n in range(5)]
+
+    def test_full_queue_spills_instead_of_blocking(self, broker, tmp_path):
+        publisher = TaskPublisher(broker, str(tmp_path), mode="async", max_pending=1)
+        publisher._publisher_pid = os.getpid()  # No background thread: the queue stays full
+        publisher.enqueue("tasks.email.status", args=[1])
+        publisher.enqueue("tasks.email.status", args=[2])
+        assert [message["args"] for message in journal_lines(tmp_path)] == [[2]]
+
+        publisher.shutdown()  # What's left in memory goes to the journal on exit
+        assert [message["args"] for message in journal_lines(tmp_path)] == [[2], [1]]
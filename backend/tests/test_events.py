@@ -0,0 +1,183 @@
+"""
+Live application event tests (server-sent events)
+"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import events
+from events import LocalBroker, LocalTickets, RedisTickets, application_event_stream, format_sse
+from tests.conftest import FakeRedis
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = LocalBroker()
+    monkeypatch.setattr(events, "broker", broker)
+    return broker
+
+
+async def wait_for_subscriber(broker, count=1):
+    while broker.connection_count < count:
+        await asyncio.sleep(0.01)
+
+
+class TestLocalBroker:
+    """In-process fan-out used by tests and development"""
+    
+    def test_publish_from_another_thread(self, broker):
+        async def scenario():
+            async with broker.subscription("seller@example.com") as queue:
+                thread = threading.Thread(
+                    target=broker.publish, args=("seller@example.com", {"type": "ping"})
+                )
+                thread.start()
+                thread.join()
+                return await asyncio.wait_for(queue.get(), timeout=1)
+        
+        assert asyncio.run(scenario()) == {"type": "ping"}
+        assert broker.connection_count == 0
+    
+    def test_events_only_reach_their_user(self, broker):
+        async def scenario():
+            async with broker.subscription("seller@example.com") as queue:
+                broker.publish("someone-else@example.com", {"type": "ping"})
+                await asyncio.sleep(0.05)
+                return queue.empty()
+        
+        assert asyncio.run(scenario())
+    
+    def test_slow_clients_drop_oldest_events(self, broker, monkeypatch):
+        monkeypatch.setattr(events, "MAX_PENDING_EVENTS", 2)
+        
+        async def scenario():
+            async with broker.subscription("seller@example.com") as queue:
+                for number in range(3):
+                    broker.publish("seller@example.com", {"number": number})
+                await asyncio.sleep(0.05)
+                return [queue.get_nowait()["number"] for _ in range(queue.qsize())]
+        
+        assert asyncio.run(scenario()) == [1, 2]
+
+
+class TestRedisTickets:
+    """Tickets issued by one API process work on any other, once"""
+    
+    def test_redeemed_once_by_another_process(self):
+        fake = FakeRedis()
+        issuer, streamer = RedisTickets("redis://unused"), RedisTickets("redis://unused")
+        issuer._client = streamer._client = fake
+        ticket = issuer.issue("seller@example.com", 1234.0)
+        assert streamer.redeem(ticket) == ("seller@example.com", 1234.0)
+        assert streamer.redeem(ticket) is None
+    
+    def test_redis_down(self):
+        tickets = RedisTickets("redis://unused")
+        tickets._client = FakeRedis()
+        tickets._client.down = True
+        assert tickets.issue("seller@example.com", 1234.0) is None
+        assert tickets.redeem("anything") is None
+
+
+class TestEventStream:
+    """Server-sent event framing and heartbeats"""
+    
+    def test_stream_sends_heartbeats_and_events(self, broker):
+        async def scenario():
+            stream = application_event_stream("seller@example.com", heartbeat_seconds=0.05)
+            chunks = [await stream.__anext__()]
+            chunks.append(await stream.__anext__())  # Nothing happened yet
+            broker.publish("seller@example.com", {"type": "application.updated", "status": "offer_made"})
+            chunks.append(await stream.__anext__())
+            await stream.aclose()
+            return chunks
+        
+        retry, heartbeat, event = asyncio.run(scenario())
+        assert retry == "retry: 5000\n\n"
+        assert heartbeat == ": keep-alive\n\n"
+        assert event.startswith("event: application.updated\n")
+        assert broker.connection_count == 0
+    
+    def test_stream_ends_when_the_token_expires(self, broker):
+        async def scenario():
+            stream = application_event_stream(
+                "seller@example.com", heartbeat_seconds=10, expires_at=time.time() + 0.05
+            )
+            chunks = [chunk async for chunk in stream]
+            return chunks
+        
+        retry, expired = asyncio.run(scenario())
+        assert expired == format_sse({"type": "session.expired"})
+        assert broker.connection_count == 0
+    
+    def test_format_sse(self):
+        message = format_sse({"type": "application.updated", "application_id": 1})
+        name, data, _, _ = message.split("\n")
+        assert name == "event: application.updated"
+        assert json.loads(data[len("data: "):]) == {"type": "application.updated", "application_id": 1}
+
+
+class TestEventsEndpoint:
+    """Authentication and publishing from the API"""
+    
+    def test_requires_valid_token(self, client):
+        assert client.get("/events/applications").status_code == 401
+        assert client.get("/events/applications?ticket=made-up").status_code == 401
+        assert client.post("/events/tickets").status_code == 401
+    
+    def test_token_in_query_string_is_not_accepted(self, client, auth_headers):
+        token = auth_headers["Authorization"].split(" ", 1)[1]
+        assert client.get(f"/events/applications?token={token}").status_code == 401
+    
+    def test_ticket_opens_one_stream(self, client, auth_headers, monkeypatch):
+        opened = []
+        
+        async def one_event(email, expires_at=None):
+            opened.append(expires_at)
+            yield format_sse({"type": "hello", "user": email})
+        
+        monkeypatch.setattr("main.application_event_stream", one_event)
+        response = client.post("/events/tickets", headers=auth_headers)
+        assert response.status_code == 200
+        ticket = response.json()["ticket"]
+        
+        response = client.get(f"/events/applications?ticket={ticket}")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert '"user": "test@example.com"' in response.text
+        assert opened[0] > time.time()  # The token's expiry
+        # Single use: a replayed URL from a log or proxy is refused
+        assert client.get(f"/events/applications?ticket={ticket}").status_code == 401
+    
+    def test_tickets_expire(self, monkeypatch):
+        monkeypatch.setattr(events, "TICKET_SECONDS", 0)
+        tickets = LocalTickets()
+        assert tickets.redeem(tickets.issue("seller@example.com", time.time() + 60)) is None
+    
+    def test_submission_is_pushed_to_open_dashboards(self, client, auth_headers, broker):
+        property_data = {
+            "property_type": "condo",
+            "project_name": "Live Tower",
+            "province": "Bangkok",
+            "property_address": "2 Event Street",
+            "property_size_sqm": 35.0,
+            "bedrooms": 1,
+            "bathrooms": 1,
+            "asking_price": 2500000,
+            "property_condition": "good",
+            "preferred_timeline": "asap"
+        }
+        
+        async def scenario():
+            async with broker.subscription("test@example.com") as queue:
+                await asyncio.to_thread(
+                    client.post, "/property-application", json=property_data, headers=auth_headers
+                )
+                return await asyncio.wait_for(queue.get(), timeout=1)
+        
+        event = asyncio.run(scenario())
+        assert event["type"] == "application.updated"
+        assert event["status"] == "submitted"
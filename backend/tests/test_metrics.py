@@ -0,0 +1,120 @@
+"""
+Metrics and task tracing tests
+"""
+import time
+
+import pytest
+
+from metrics import MetricsRegistry, MemoryStore, RedisStore, metrics
+from task_monitoring import stamp_task_headers, _queue_wait
+from tasks.email import send_property_submission_email
+from tests.conftest import FakeRedis
+from tracing import trace_id_var
+
+
+@pytest.fixture
+def registry():
+    registry = MetricsRegistry(MemoryStore())
+    registry.describe("jobs_total", "counter", "Jobs")
+    registry.describe("job_seconds", "summary", "Job duration")
+    return registry
+
+
+class TestMetricsRegistry:
+    """Counters and summaries rendered in the Prometheus text format"""
+    
+    def test_counter_with_labels(self, registry):
+        registry.inc("jobs_total", {"task": "a"})
+        registry.inc("jobs_total", {"task": "a"})
+        assert registry.value("jobs_total", {"task": "a"}) == 2
+        assert 'jobs_total{task="a"} 2' in registry.render()
+    
+    def test_summary_renders_sum_and_count_under_one_type(self, registry):
+        registry.observe("job_seconds", 0.5)
+        registry.observe("job_seconds", 1.5)
+        output = registry.render()
+        assert output.count("# TYPE job_seconds summary") == 1
+        assert "job_seconds_sum 2" in output
+        assert "job_seconds_count 2" in output
+    
+    def test_label_values_are_escaped(self, registry):
+        registry.inc("jobs_total", {"task": 'say "hi"'})
+        assert 'task="say \\"hi\\""' in registry.render()
+
+
+class TestRedisStore:
+    """Buffered metrics shared through Redis"""
+    
+    def test_flush_and_snapshot(self):
+        store = RedisStore("redis://unused")
+        store._client = FakeRedis()
+        store.incr("jobs_total", 3)
+        assert store.snapshot() == {"jobs_total": 3.0}
+    
+    def test_values_kept_while_redis_is_down(self):
+        store = RedisStore("redis://unused")
+        store._client = FakeRedis()
+        store._client.down = True
+        store.incr("jobs_total", 1)
+        store.flush()
+        assert store.snapshot() == {"jobs_total": 1.0}
+        
+        store._client.down = False
+        store.flush()
+        assert store._client.keys == {store.key: {"jobs_total": 1.0}}
+
+
+class TestTaskTracing:
+    """Trace ids and timings travel in the task message headers"""
+    
+    def test_publish_stamps_current_trace_id(self):
+        token = trace_id_var.set("req-123")
+        try:
+            headers = {}
+            stamp_task_headers(sender="tasks.email.send_property_submission_email", headers=headers)
+        finally:
+            trace_id_var.reset(token)
+        assert headers["trace_id"] == "req-123"
+        assert headers["enqueued_at"] <= time.time()
+    
+    def test_publish_keeps_existing_headers(self):
+        headers = {"trace_id": "original", "enqueued_at": 1.0}
+        stamp_task_headers(sender="tasks.email.send_property_submission_email", headers=headers)
+        assert headers == {"trace_id": "original", "enqueued_at": 1.0}
+    
+    def test_queue_wait_ignores_countdown(self):
+        now = time.time()
+        assert _queue_wait(now - 10, None) >= 10
+        eta = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(now - 2))
+        assert _queue_wait(now - 10, eta) < 5
+        assert _queue_wait(None, None) is None
+    
+    def test_task_run_records_metrics(self):
+        labels = {"task": send_property_submission_email.name}
+        runs_before = metrics.value("celery_task_runtime_seconds_count", labels)
+        waits_before = metrics.value("celery_task_queue_wait_seconds_count", labels)
+        
+        send_property_submission_email.apply(
+            args=[{"email": "seller@example.com", "full_name": "Seller"}],
+            headers={"trace_id": "req-456", "enqueued_at": time.time()},
+        )
+        
+        assert metrics.value("celery_task_runtime_seconds_count", labels) == runs_before + 1
+        assert metrics.value("celery_task_queue_wait_seconds_count", labels) == waits_before + 1
+        assert metrics.value("celery_tasks_total", {**labels, "state": "SUCCESS"}) >= 1
+
+
+class TestMetricsEndpoint:
+    """HTTP metrics and trace id header"""
+    
+    def test_request_gets_trace_id(self, client):
+        response = client.get("/api/health", headers={"X-Request-ID": "abc"})
+        assert response.headers["X-Request-ID"] == "abc"
+        assert client.get("/api/health").headers["X-Request-ID"]
+    
+    def test_metrics_endpoint(self, client):
+        client.get("/api/health")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert 'http_requests_total{method="GET",route="/api/health",status="200"}' in response.text
+        assert "# TYPE http_request_duration_seconds summary" in response.text
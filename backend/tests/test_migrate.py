@@ -0,0 +1,50 @@
+"""
+Database migration tests
+"""
+import pytest
+from sqlalchemy import event, inspect, text
+
+from database import Base
+from migrate import run_migrations
+from tests.conftest import engine
+
+
+def test_sqlite_needs_no_migrations():
+    assert run_migrations(engine) == []
+
+
+@pytest.mark.postgres
+class TestPostgresMigrations:
+    """Existing tables are brought up to date, without touching what's already there"""
+    
+    def test_adds_missing_columns_and_indexes(self, postgres_engine):
+        with postgres_engine.begin() as connection:
+            connection.execute(text("DROP INDEX ix_property_applications_due_at"))
+            connection.execute(text("ALTER TABLE property_applications DROP COLUMN due_at"))
+            connection.execute(text("ALTER TABLE property_applications_archive DROP COLUMN due_at"))
+        
+        executed = run_migrations(postgres_engine)
+        assert [statement for statement in executed if statement.startswith("ALTER")] == [
+            "ALTER TABLE property_applications ADD COLUMN IF NOT EXISTS due_at TIMESTAMP WITH TIME ZONE",
+            "ALTER TABLE property_applications_archive ADD COLUMN IF NOT EXISTS due_at TIMESTAMP WITH TIME ZONE",
+        ]
+        inspector = inspect(postgres_engine)
+        assert "due_at" in {column["name"] for column in inspector.get_columns("property_applications")}
+        assert "ix_property_applications_due_at" in {index["name"] for index in inspector.get_indexes("property_applications")}
+    
+    def test_up_to_date_tables_are_not_altered(self, postgres_engine):
+        run_migrations(postgres_engine)
+        assert not [statement for statement in run_migrations(postgres_engine) if statement.startswith("ALTER")]
+    
+    def test_starting_the_app_alters_nothing(self, postgres_engine):
+        executed = []
+        
+        def record(connection, cursor, statement, parameters, context, executemany):
+            executed.append(statement.lstrip().upper())
+        
+        event.listen(postgres_engine, "before_cursor_execute", record)
+        try:
+            Base.metadata.create_all(bind=postgres_engine)
+        finally:
+            event.remove(postgres_engine, "before_cursor_execute", record)
+        assert not [statement for statement in executed if statement.startswith(("ALTER", "CREATE"))]
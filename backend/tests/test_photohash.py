@@ -0,0 +1,231 @@
+"""
+Perceptual photo hash tests
+"""
+import random
+
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+from sqlalchemy import event
+
+import crud
+import photohash
+from crud import find_similar_photos
+from database import PropertyPhoto
+from tasks import media
+from tests.conftest import TestingSessionLocal, engine, submit
+
+
+def make_photo(path, seed, size=(640, 480), quality=90):
+    """A random 'room': coloured boxes on a gradient, saved as JPEG"""
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        box = [x, y, x + rng.randrange(40, 240), y + rng.randrange(40, 200)]
+        draw.rectangle(box, fill=tuple(rng.randrange(256) for _ in range(3)))
+    image.save(path, "JPEG", quality=quality)
+    return str(path)
+
+
+def copy_of(source, path, size, quality):
+    """The same photo resized and recompressed, as reposted listings do"""
+    with Image.open(source) as image:
+        image.resize(size).filter(ImageFilter.GaussianBlur(1)).save(path, "JPEG", quality=quality)
+    return str(path)
+
+
+def add_photo(application_id, path):
+    db = TestingSessionLocal()
+    try:
+        photo = PropertyPhoto(application_id=application_id, photo_name="photo.jpg", file_path=path, file_size=1)
+        db.add(photo)
+        db.commit()
+        return photo.id
+    finally:
+        db.close()
+
+
+class TestHash:
+    """dHash survives recompression, tells different photos apart"""
+
+    def test_copies_are_close_and_other_photos_far(self, tmp_path):
+        original = make_photo(tmp_path / "a.jpg", seed=1)
+        copy = copy_of(original, tmp_path / "copy.jpg", (320, 240), quality=40)
+        other = make_photo(tmp_path / "b.jpg", seed=2)
+
+        assert photohash.hamming(photohash.dhash(original), photohash.dhash(copy)) <= 4
+        assert photohash.hamming(photohash.dhash(original), photohash.dhash(other)) > 12
+
+    def test_chunks_and_signed_storage(self):
+        value = 0xFEDC_BA98_7654_3210
+        assert photohash.chunks(value) == [0xFEDC, 0xBA98, 0x7654, 0x3210]
+        assert photohash.to_signed(value) < 0
+        assert photohash.to_unsigned(photohash.to_signed(value)) == value
+
+    def test_oversized_images_are_refused_before_decoding(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(photohash, "MAX_PIXELS", 200 * 150)
+        Image.new("RGB", (300, 300), "white").save(tmp_path / "big.png")
+        with pytest.raises(ValueError):
+            photohash.dhash(str(tmp_path / "big.png"))
+        # JPEGs are measured after draft scaling, 640x480 decodes at 160x120
+        photohash.dhash(make_photo(tmp_path / "room.jpg", seed=1))
+
+    @pytest.mark.parametrize("radius, count", [(0, 1), (1, 17), (2, 137)])
+    def test_probes_cover_the_radius(self, radius, count):
+        probes = photohash.chunk_probes(0b1010, radius)
+        assert len(set(probes)) == count
+        assert all(photohash.hamming(probe, 0b1010) <= radius for probe in probes)
+
+    def test_crowded_chunk_is_left_out_of_the_plan(self):
+        value = 0x0000_1234_5678_9ABC
+        assert [(index, len(values)) for index, values in photohash.probe_plan(value, 6)] == [
+            (0, 17), (1, 17), (2, 17), (3, 17),
+        ]
+        rare = 1 / 50_000
+        common = {index: ({}, rare) for index in range(photohash.CHUNKS)}
+        common[0] = ({0x0000: 0.08}, rare)
+        plan = photohash.probe_plan(value, 6, common)
+        assert [(index, len(values)) for index, values in plan] == [(1, 137), (2, 137), (3, 137)]
+        # Leaving out a second chunk probes the others 6 // 2 = 3 bits wide, a third would be 6 bits
+        common[1] = ({0x1234: 0.06}, rare)
+        common[2] = ({0x5678: 0.05}, rare)
+        assert [index for index, _ in photohash.probe_plan(value, 6, common)] == [2, 3]
+        # Wider probes only pay off when they save reading crowded values
+        common = {index: ({}, rare) for index in range(photohash.CHUNKS)}
+        common[0] = ({0x0000: 0.0001}, rare)
+        assert [index for index, _ in photohash.probe_plan(value, 6, common)] == [0, 1, 2, 3]
+
+    def test_plan_finds_everything_within_the_distance(self):
+        rng = random.Random(5)
+        for _ in range(300):
+            value, distance = rng.getrandbits(64), rng.choice([4, 6, 8, 10])
+            common = {
+                index: ({chunk: rng.random() / 10}, rng.random() / 10_000)
+                for index, chunk in enumerate(photohash.chunks(value))
+            }
+            other = value ^ sum(1 << bit for bit in rng.sample(range(64), distance))
+            plan = photohash.probe_plan(value, distance, common)
+            assert any(photohash.chunks(other)[index] in values for index, values in plan)
+
+    def test_flat_photos_are_not_matchable(self, tmp_path):
+        Image.new("RGB", (200, 200), "white").save(tmp_path / "wall.jpg")
+        assert not photohash.is_detailed(photohash.dhash(str(tmp_path / "wall.jpg")))
+
+
+class TestSimilarPhotos:
+    """Multi-index lookups find the same matches as comparing every hash"""
+
+    def test_matches_linear_scan(self, client, auth_headers):
+        application = submit(client, auth_headers, "Sukhumvit 39")
+        rng = random.Random(7)
+        base = rng.getrandbits(64)
+        hashes = [base ^ (1 << bit) ^ (1 << (bit + 20)) for bit in range(10)]  # 2 bits away
+        hashes += [base ^ sum(1 << bit for bit in rng.sample(range(64), 7)) for _ in range(10)]
+        hashes += [rng.getrandbits(64) for _ in range(200)]
+
+        db = TestingSessionLocal()
+        try:
+            for value in hashes:
+                chunk_0, chunk_1, chunk_2, chunk_3 = photohash.chunks(value)
+                db.add(PropertyPhoto(
+                    application_id=application["id"], photo_name="p.jpg", file_path="/p.jpg", file_size=1,
+                    perceptual_hash=photohash.to_signed(value),
+                    hash_chunk_0=chunk_0, hash_chunk_1=chunk_1, hash_chunk_2=chunk_2, hash_chunk_3=chunk_3,
+                ))
+            db.commit()
+
+            for distance in (0, 3, 7, 8):
+                matches = find_similar_photos(db, base, distance, limit=1000)
+                found = [photohash.to_unsigned(photo.perceptual_hash) for photo, _ in matches]
+                expected = [value for value in hashes if photohash.hamming(value, base) <= distance]
+                assert sorted(found) == sorted(expected)
+        finally:
+            db.close()
+
+
+    def test_crowded_chunk_is_not_read(self, client, auth_headers):
+        crud._chunk_stop_lists.clear()
+        application = submit(client, auth_headers, "Sukhumvit 39")
+        rng = random.Random(11)
+        base = rng.getrandbits(64) & ~(0xFFFF << 48)  # Top chunk 0x0000, a flat strip of ceiling
+        # 2 bits off in each of the other chunks: only the top chunk is within 6 // 4 bits
+        copy = base ^ 0b11 ^ (0b11 << 16) ^ (0b11 << 32)
+        crowd = [rng.getrandbits(48) for _ in range(30)]
+
+        executed = []
+
+        def record(connection, cursor, statement, parameters, context, executemany):
+            executed.append(statement)
+
+        db = TestingSessionLocal()
+        try:
+            for value in crowd + [copy]:
+                chunk_0, chunk_1, chunk_2, chunk_3 = photohash.chunks(value)
+                db.add(PropertyPhoto(
+                    application_id=application["id"], photo_name="p.jpg", file_path="/p.jpg", file_size=1,
+                    perceptual_hash=photohash.to_signed(value),
+                    hash_chunk_0=chunk_0, hash_chunk_1=chunk_1, hash_chunk_2=chunk_2, hash_chunk_3=chunk_3,
+                ))
+            db.commit()
+
+            event.listen(engine, "before_cursor_execute", record)
+            matches = find_similar_photos(db, base, 6)
+            assert [photohash.to_unsigned(photo.perceptual_hash) for photo, _ in matches] == [copy]
+            assert not [statement for statement in executed if "hash_chunk_0 IN" in statement]
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+            db.close()
+            crud._chunk_stop_lists.clear()
+
+
+@pytest.mark.usefixtures("sweep")
+class TestHashTask:
+    """Photos are hashed in the background and reuse shows up for reviewers"""
+
+    def test_reused_photo_is_reported(self, client, reviewer_headers, tmp_path):
+        original = make_photo(tmp_path / "room.jpg", seed=3)
+        first = submit(client, reviewer_headers, "Room 5, Sukhumvit 11")
+        second = submit(client, reviewer_headers, "Room 9, Rama 9")
+        first_photo = add_photo(first["id"], original)
+        add_photo(first["id"], make_photo(tmp_path / "other.jpg", seed=4))
+        second_photo = add_photo(second["id"], copy_of(original, tmp_path / "copy.jpg", (800, 600), quality=50))
+
+        assert media.hash_property_photo(first_photo)["similar_application_ids"] == []
+        result = media.hash_property_photo(second_photo)
+        assert result["similar_application_ids"] == [first["id"]]
+        # Already hashed photos are left alone
+        assert media.hash_property_photo(second_photo) == {"photo_id": second_photo, "status": "done"}
+
+        response = client.get(f"/admin/applications/{second['id']}/similar-photos", headers=reviewer_headers)
+        assert response.status_code == 200
+        [match] = response.json()["matches"]
+        assert match["photo_id"] == second_photo
+        assert match["similar_photo_id"] == first_photo
+        assert match["similar_application_id"] == first["id"]
+
+    def test_unreadable_photo_is_marked_done(self, client, auth_headers):
+        application = submit(client, auth_headers, "Sukhumvit 39")
+        photo_id = add_photo(application["id"], "/nowhere/photo.jpg")
+        assert media.hash_property_photo(photo_id) == {"photo_id": photo_id, "status": "failed"}
+        assert media.hash_pending_photos() == {"queued": 0, "last_id": 0}
+
+    def test_oversized_photo_is_marked_failed(self, client, auth_headers, tmp_path, monkeypatch):
+        monkeypatch.setattr(photohash, "MAX_PIXELS", 100 * 100)
+        Image.new("RGB", (200, 200), "white").save(tmp_path / "big.png")
+        application = submit(client, auth_headers, "Sukhumvit 39")
+        photo_id = add_photo(application["id"], str(tmp_path / "big.png"))
+        assert media.hash_property_photo(photo_id) == {"photo_id": photo_id, "status": "failed"}
+
+    def test_sweep_queues_unhashed_photos_in_chunks(self, client, auth_headers, sweep):
+        application = submit(client, auth_headers, "Sukhumvit 39")
+        ids = [add_photo(application["id"], "/nowhere/photo.jpg") for _ in range(3)]
+        sweep.record(media.hash_pending_photos, media.hash_property_photo)
+
+        assert media.hash_pending_photos(0, 2) == {"queued": 2, "last_id": ids[1]}
+        assert sweep.next_chunks == [(ids[1], 2)]
+        sweep.finish()
+        assert sweep.queued == ids
+
+    def test_requires_reviewer(self, client, auth_headers):
+        assert client.get("/admin/applications/1/similar-photos", headers=auth_headers).status_code == 403
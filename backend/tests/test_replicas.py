@@ -0,0 +1,170 @@
+"""
+Read replica routing tests
+"""
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+import auth
+from database import Base, LocalWriteMarks, RedisWriteMarks, ReplicaRouter
+from tests.conftest import FakeRedis
+
+
+def sqlite_engine():
+    return create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+
+def broken_engine():
+    return create_engine("sqlite:////nonexistent-dir/replica.db")
+
+
+class TestReplicaRouter:
+    """Round-robin, health checks and read-your-own-writes"""
+    
+    def test_round_robin(self):
+        first, second = sqlite_engine(), sqlite_engine()
+        router = ReplicaRouter([first, second])
+        picks = [router.pick() for _ in range(4)]
+        assert picks == [first, second, first, second]
+    
+    def test_unhealthy_replica_is_skipped(self):
+        healthy, broken = sqlite_engine(), broken_engine()
+        router = ReplicaRouter([broken, healthy])
+        assert [router.pick() for _ in range(3)] == [healthy, healthy, healthy]
+        assert router.is_healthy(broken) is False
+    
+    def test_primary_when_no_replica_is_healthy(self):
+        assert ReplicaRouter([broken_engine()]).pick() is None
+        assert ReplicaRouter([]).pick() is None
+    
+    def test_health_is_cached_between_checks(self):
+        replica = sqlite_engine()
+        router = ReplicaRouter([replica], health_check_seconds=60)
+        router._health[replica] = (False, float("inf"))
+        assert router.pick() is None
+    
+    def test_first_check_runs_once_for_concurrent_requests(self, monkeypatch):
+        replica = sqlite_engine()
+        router = ReplicaRouter([replica])
+        checks = []
+        
+        def slow_check(engine):
+            checks.append(engine)
+            time.sleep(0.05)
+            router._health[engine] = (True, time.monotonic())
+            return router._health[engine]
+        
+        monkeypatch.setattr(router, "_check", slow_check)
+        requests = [threading.Thread(target=router.pick) for _ in range(8)]
+        for request in requests:
+            request.start()
+        for request in requests:
+            request.join()
+        assert checks == [replica]
+    
+    def test_stale_result_is_refreshed_in_the_background(self, monkeypatch):
+        replica = sqlite_engine()
+        router = ReplicaRouter([replica], health_check_seconds=0.01)
+        router._health[replica] = (True, time.monotonic() - 1)
+        started, finish = threading.Event(), threading.Event()
+        
+        def slow_check(engine):
+            started.set()
+            finish.wait(5)
+            router._health[engine] = (False, time.monotonic())
+            return router._health[engine]
+        
+        monkeypatch.setattr(router, "_check", slow_check)
+        # The request doesn't wait for the check, and a second one doesn't start another
+        assert router.pick() is replica
+        assert started.wait(5)
+        assert router.pick() is replica and router._refreshing == {replica}
+        finish.set()
+        for _ in range(100):
+            if not router._refreshing:
+                break
+            time.sleep(0.01)
+        assert router._health[replica][0] is False
+    
+    def test_recent_writes_stick_to_primary(self):
+        router = ReplicaRouter([], read_your_writes_seconds=10)
+        router.mark_write("seller@example.com")
+        assert router.wrote_recently("seller@example.com")
+        assert not router.wrote_recently("other@example.com")
+        assert not router.wrote_recently(None)
+    
+    def test_recent_writes_expire(self):
+        router = ReplicaRouter([], read_your_writes_seconds=0)
+        router.mark_write("seller@example.com")
+        assert not router.wrote_recently("seller@example.com")
+    
+    def test_recent_writes_are_seen_by_other_workers(self):
+        fake = FakeRedis()
+        workers = []
+        for _ in range(2):
+            marks = RedisWriteMarks("redis://unused")
+            marks._client = fake
+            workers.append(ReplicaRouter([], write_marks=marks))
+        workers[0].mark_write("seller@example.com")
+        assert workers[1].wrote_recently("seller@example.com")
+        assert not workers[1].wrote_recently("other@example.com")
+    
+    def test_primary_while_redis_is_down(self):
+        marks = RedisWriteMarks("redis://unused")
+        marks._client = FakeRedis()
+        marks._client.down = True
+        router = ReplicaRouter([], write_marks=marks)
+        router.mark_write("seller@example.com")
+        assert router.wrote_recently("other@example.com")
+
+
+@pytest.fixture
+def empty_replica(monkeypatch):
+    """A replica that never received the primary's rows"""
+    replica = sqlite_engine()
+    Base.metadata.create_all(bind=replica)
+    router = ReplicaRouter([replica])
+    monkeypatch.setattr(auth, "replica_router", router)
+    monkeypatch.setattr("main.replica_router", router)
+    return router
+
+
+class TestReadEndpoints:
+    """Read-only endpoints go to the replica, fresh writes stay on the primary"""
+    
+    property_data = {
+        "property_type": "condo",
+        "project_name": "Replica Tower",
+        "province": "Bangkok",
+        "property_address": "1 Replica Road",
+        "property_size_sqm": 40.0,
+        "bedrooms": 1,
+        "bathrooms": 1,
+        "asking_price": 3000000,
+        "property_condition": "good",
+        "preferred_timeline": "asap"
+    }
+    
+    def test_read_after_write_uses_primary(self, client, auth_headers, empty_replica):
+        client.post("/property-application", json=self.property_data, headers=auth_headers)
+        
+        response = client.get("/my-applications", headers=auth_headers)
+        assert response.status_code == 200
+        assert len(response.json()) == 1
+    
+    def test_reads_go_to_replica(self, client, auth_headers, empty_replica):
+        client.post("/property-application", json=self.property_data, headers=auth_headers)
+        empty_replica.write_marks = LocalWriteMarks()
+        
+        # The user row falls back to the primary, the applications come from the replica
+        assert client.get("/me", headers=auth_headers).status_code == 200
+        response = client.get("/my-applications", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json() == []
@@ -0,0 +1,125 @@
+"""
+Offer expiry and review SLA scheduler tests
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from database import PropertyApplication, ApplicationStatus, DUE_OFFER_EXPIRY, DUE_REVIEW_SLA
+from tasks import maintenance
+from tests.conftest import TestingSessionLocal, get_application, submit
+
+
+def make_due(application_id, **values):
+    """Move an application's due time into the past"""
+    db = TestingSessionLocal()
+    try:
+        application = db.get(PropertyApplication, application_id)
+        application.due_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+        for name, value in values.items():
+            setattr(application, name, value)
+        db.commit()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def jobs(monkeypatch, sweep):
+    """Capture the jobs the scheduler enqueues"""
+    jobs = {"status": [], "escalation": [], "next": sweep.record(maintenance.process_due_applications).next_chunks}
+    monkeypatch.setattr(
+        maintenance.send_application_status_emails, "apply_async", lambda args, **options: jobs["status"].append(args[0])
+    )
+    monkeypatch.setattr(
+        maintenance.send_review_sla_escalation, "apply_async", lambda args, **options: jobs["escalation"].append(args[0])
+    )
+    return jobs
+
+
+class TestDueDates:
+    """Submissions and transitions keep due_at up to date"""
+
+    def test_submission_gets_review_sla(self, client, auth_headers):
+        before = datetime.now(timezone.utc)
+        application = get_application(submit(client, auth_headers, "Room 1")["id"])
+        assert application.due_action == DUE_REVIEW_SLA
+        due_at = application.due_at.replace(tzinfo=timezone.utc)
+        assert timedelta(hours=23) < due_at - before <= timedelta(hours=24, seconds=5)
+
+    def test_transitions_move_due_date(self, client, reviewer_headers, sent_batches):
+        application_id = submit(client, reviewer_headers, "Room 1")["id"]
+        client.post("/admin/applications/transitions", json={"transitions": [
+            {"application_id": application_id, "status": "under_review"},
+        ]}, headers=reviewer_headers)
+        assert get_application(application_id).due_at is None
+
+        client.post("/admin/applications/transitions", json={"transitions": [
+            {"application_id": application_id, "status": "offer_made", "offer_amount": 4000000},
+        ]}, headers=reviewer_headers)
+        application = get_application(application_id)
+        assert application.due_action == DUE_OFFER_EXPIRY
+        assert application.due_at.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc) + timedelta(days=6)
+
+
+class TestProcessDueApplications:
+    """The beat task only handles due rows, and each of them once"""
+
+    def test_expires_offers_and_escalates_reviews(self, client, auth_headers, jobs):
+        offered, waiting, later = (submit(client, auth_headers, f"Room {n}")["id"] for n in range(3))
+        make_due(offered, status=ApplicationStatus.OFFER_MADE, offer_amount=4000000, due_action=DUE_OFFER_EXPIRY)
+        make_due(waiting)
+
+        assert maintenance.process_due_applications() == {"expired": 1, "escalated": 1}
+
+        expired = get_application(offered)
+        assert expired.status == ApplicationStatus.OFFER_EXPIRED
+        assert expired.due_at is None
+        assert jobs["status"] == [[{
+            "email": "test@example.com", "full_name": "Test User", "application_id": offered,
+            "status": "offer_expired", "offer_amount": 4000000,
+        }]]
+
+        assert [item["application_id"] for item in jobs["escalation"][0]] == [waiting]
+        reminded = get_application(waiting)
+        assert reminded.status == ApplicationStatus.SUBMITTED
+        assert reminded.due_at.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc) + timedelta(hours=23)
+
+        # Nothing is due any more, the untouched submission was never due
+        assert maintenance.process_due_applications() == {"expired": 0, "escalated": 0}
+        assert get_application(later).status == ApplicationStatus.SUBMITTED
+
+    def test_stale_due_entries_are_cleared(self, client, auth_headers, jobs):
+        application_id = submit(client, auth_headers, "Room 1")["id"]
+        make_due(application_id, status=ApplicationStatus.OFFER_ACCEPTED, due_action=DUE_OFFER_EXPIRY)
+
+        assert maintenance.process_due_applications() == {"expired": 0, "escalated": 0}
+        assert get_application(application_id).status == ApplicationStatus.OFFER_ACCEPTED
+        assert get_application(application_id).due_at is None
+        assert jobs["status"] == [] and jobs["escalation"] == []
+
+    def test_full_batch_continues(self, client, auth_headers, jobs):
+        for n in range(3):
+            make_due(submit(client, auth_headers, f"Room {n}")["id"])
+        assert maintenance.process_due_applications(batch_size=2)["escalated"] == 2
+        assert jobs["next"] == [(2,)]
+        assert maintenance.process_due_applications(batch_size=2)["escalated"] == 1
+
+
+class TestBackfillDueDates:
+    """Applications from before the scheduler get due dates"""
+
+    def test_backfill(self, client, auth_headers, sweep):
+        submitted, offered, accepted = (submit(client, auth_headers, f"Room {n}")["id"] for n in range(3))
+        offer_made_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        db = TestingSessionLocal()
+        db.query(PropertyApplication).update({"due_at": None, "due_action": None})
+        db.get(PropertyApplication, offered).status = ApplicationStatus.OFFER_MADE
+        db.get(PropertyApplication, offered).offer_made_at = offer_made_at
+        db.get(PropertyApplication, accepted).status = ApplicationStatus.OFFER_ACCEPTED
+        db.commit()
+        db.close()
+
+        assert maintenance.backfill_due_dates(0, 100) == {"processed": 2, "last_id": offered}
+        assert get_application(submitted).due_action == DUE_REVIEW_SLA
+        assert get_application(offered).due_at.replace(tzinfo=timezone.utc) == offer_made_at + timedelta(days=7)
+        assert get_application(accepted).due_at is None
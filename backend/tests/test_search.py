@@ -0,0 +1,181 @@
+"""
+Review console search tests
+"""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+import crud
+from crud import search_applications
+from database import PropertyApplication, User
+from migrate import run_migrations
+from models import PropertyApplicationCreate
+from search import search_tokens, search_document, highlight, query_terms
+from tasks import maintenance
+from tests.conftest import TestingSessionLocal, submit
+
+
+class TestTokenizer:
+    """Thai bigrams and lowercase words"""
+    
+    def test_latin_words_and_numbers(self):
+        assert search_tokens("Sukhumvit Soi 39, Bangkok") == ["sukhumvit", "soi", "39", "bangkok"]
+    
+    def test_thai_runs_become_bigrams(self):
+        assert search_tokens("ศุภาลัย") == ["ศุ", "ุภ", "ภา", "าล", "ลั", "ัย"]
+        assert search_tokens("ก") == ["ก"]
+    
+    def test_mixed_text(self):
+        assert search_document("Noble", "ชั้น 12", None) == "noble ชั ั้ ้น 12"
+    
+    def test_thai_marks_round_trip(self):
+        # Vowel and tone marks stay on their bigrams, each run can be rebuilt from them
+        for run in ["ห้อง", "ชั้นที่", "๑๒", "เพชรบุรีตัดใหม่"]:
+            bigrams = search_tokens(run)
+            assert bigrams[0] + "".join(bigram[1] for bigram in bigrams[1:]) == run
+
+
+class TestHighlight:
+    """Snippets for the review console"""
+    
+    def test_marks_matches_and_escapes_html(self):
+        snippet = highlight("<b>Room 12</b> Sukhumvit 39", query_terms("sukhumvit 39"))
+        assert snippet == "&lt;b&gt;Room 12&lt;/b&gt; <mark>Sukhumvit</mark> <mark>39</mark>"
+    
+    def test_latin_terms_match_word_prefixes_only(self):
+        assert highlight("Asoke", ["so"]) == "Asoke"
+        assert highlight("Sold", ["so"]) == "<mark>So</mark>ld"
+    
+    def test_thai_terms_match_inside_words(self):
+        assert highlight("ซอยสุขุมวิท", query_terms("สุขุมวิท")) == "ซอย<mark>สุขุมวิท</mark>"
+    
+    def test_long_text_is_cut_around_the_match(self):
+        text = "x " * 200 + "Thonglor" + " y" * 200
+        snippet = highlight(text, ["thonglor"], width=40)
+        assert snippet.startswith("…") and snippet.endswith("…")
+        assert "<mark>Thonglor</mark>" in snippet
+
+
+@pytest.fixture
+def listings(client, auth_headers):
+    submit(client, auth_headers, "Room 1203, Sukhumvit 39", project_name="Noble Remix")
+    submit(client, auth_headers, "ห้อง 55/12 ซอยสุขุมวิท 39 (Sukhumvit 39)", project_name="ศุภาลัย โอเรียนทัล")
+    submit(client, auth_headers, "Room 8, Sukhumvit 63", project_name="Rhythm Ekkamai")
+
+
+@pytest.mark.usefixtures("listings")
+class TestSearchEndpoint:
+    """GET /admin/applications/search"""
+    
+    def search(self, client, headers, **params):
+        response = client.get("/admin/applications/search", params=params, headers=headers)
+        assert response.status_code == 200
+        return response.json()
+    
+    def test_requires_reviewer(self, client, auth_headers):
+        response = client.get("/admin/applications/search", params={"q": "noble"}, headers=auth_headers)
+        assert response.status_code == 403
+    
+    def test_english_address(self, client, reviewer_headers):
+        results = self.search(client, reviewer_headers, q="Sukhumvit 39")["results"]
+        assert {hit["project_name"] for hit in results} == {"Noble Remix", "ศุภาลัย โอเรียนทัล"}
+        noble = next(hit for hit in results if hit["project_name"] == "Noble Remix")
+        assert noble["highlights"]["property_address"] == "Room 1203, <mark>Sukhumvit</mark> <mark>39</mark>"
+    
+    def test_thai_without_spaces(self, client, reviewer_headers):
+        results = self.search(client, reviewer_headers, q="สุขุมวิท")["results"]
+        assert [hit["project_name"] for hit in results] == ["ศุภาลัย โอเรียนทัล"]
+        assert "<mark>สุขุมวิท</mark>" in results[0]["highlights"]["property_address"]
+    
+    def test_last_word_is_a_prefix(self, client, reviewer_headers):
+        results = self.search(client, reviewer_headers, q="ekka")["results"]
+        assert [hit["project_name"] for hit in results] == ["Rhythm Ekkamai"]
+    
+    def test_pagination(self, client, reviewer_headers):
+        first = self.search(client, reviewer_headers, q="sukhumvit", page_size=2)
+        second = self.search(client, reviewer_headers, q="sukhumvit", page_size=2, page=2)
+        assert len(first["results"]) == 2 and first["has_more"] is True
+        assert len(second["results"]) == 1 and second["has_more"] is False
+        ids = {hit["id"] for hit in first["results"] + second["results"]}
+        assert len(ids) == 3
+    
+    def test_no_searchable_words(self, client, reviewer_headers):
+        assert self.search(client, reviewer_headers, q="!!!")["results"] == []
+
+
+class TestSearchBackfill:
+    """Applications submitted before search existed"""
+    
+    def test_backfill_fills_missing_search_text(self, client, auth_headers, sweep):
+        submit(client, auth_headers, "1 Legacy Road", project_name="Old Project")
+        db = TestingSessionLocal()
+        db.query(PropertyApplication).update({"search_text": None})
+        db.commit()
+        assert search_applications(db, "legacy") == []
+        
+        assert maintenance.backfill_search_text(0, 100) == {"processed": 1, "last_id": 1}
+        assert [a.project_name for a in search_applications(db, "legacy")] == ["Old Project"]
+        db.close()
+    
+    def test_thai_word_with_stacked_marks(self, client, auth_headers):
+        submit(client, auth_headers, "ห้องชั้นที่ 12 ถนนเพชรบุรีตัดใหม่", project_name="เดอะ ริช")
+        db = TestingSessionLocal()
+        try:
+            assert [a.project_name for a in search_applications(db, "ชั้นที่")] == ["เดอะ ริช"]
+            assert [a.project_name for a in search_applications(db, "เพชรบุรี")] == ["เดอะ ริช"]
+            assert search_applications(db, "ชั้นล่าง") == []
+        finally:
+            db.close()
+
+
+@pytest.fixture(scope="module")
+def postgres_db(postgres_engine):
+    run_migrations(postgres_engine)
+    crud._trigram_support.clear()
+    
+    db = sessionmaker(bind=postgres_engine)()
+    user = User(email="pg@example.com", hashed_password="x", full_name="Pg", phone_number="0")
+    db.add(user)
+    db.commit()
+    for project_name, address in [
+        ("Noble Remix", "Room 1203, Sukhumvit 39"),
+        ("ศุภาลัย โอเรียนทัล", "ห้อง 55/12 ซอยสุขุมวิท 39 (Sukhumvit 39)"),
+        ("เดอะ ริช", "ห้องชั้นที่ 12 ถนนเพชรบุรีตัดใหม่"),
+    ]:
+        crud.create_property_application(db, PropertyApplicationCreate(
+            property_type="condo", project_name=project_name, province="Bangkok", property_address=address,
+            property_size_sqm=45.0, bedrooms=1, bathrooms=1, asking_price=4500000,
+            property_condition="good", preferred_timeline="asap",
+        ), user.id)
+    yield db
+    db.close()
+    crud._trigram_support.clear()
+
+
+@pytest.mark.postgres
+class TestPostgresSearch:
+    """The tsvector branch on a real Postgres: Thai bigrams survive to_tsvector('simple')"""
+    
+    def projects(self, db, query):
+        return sorted(application.project_name for application in search_applications(db, query))
+    
+    def test_thai_bigrams_round_trip(self, postgres_db):
+        lexemes = postgres_db.execute(
+            text("SELECT unnest(tsvector_to_array(to_tsvector('simple', :document)))"),
+            {"document": search_document("ศุภาลัย")},
+        ).scalars().all()
+        assert sorted(lexemes) == sorted(search_tokens("ศุภาลัย"))
+    
+    def test_thai_words(self, postgres_db):
+        assert self.projects(postgres_db, "สุขุมวิท") == ["ศุภาลัย โอเรียนทัล"]
+        assert self.projects(postgres_db, "ชั้นที่") == ["เดอะ ริช"]
+        assert self.projects(postgres_db, "ชั้นล่าง") == []
+    
+    def test_english_and_prefix(self, postgres_db):
+        assert self.projects(postgres_db, "Sukhumvit 39") == ["Noble Remix", "ศุภาลัย โอเรียนทัล"]
+        assert self.projects(postgres_db, "nob") == ["Noble Remix"]
+    
+    def test_typos_with_trigrams(self, postgres_db):
+        if not crud.has_trigrams(postgres_db):
+            pytest.skip("pg_trgm not available on this server")
+        assert self.projects(postgres_db, "Nobel Remix") == ["Noble Remix"]
@@ -0,0 +1,98 @@
+"""
+Production server launcher tests
+"""
+import os
+
+import pytest
+
+import server
+from config import settings
+
+
+@pytest.fixture
+def cgroup(tmp_path):
+    """Fake /sys/fs/cgroup, write files with cgroup(name, value)"""
+    def write(name, value):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"{value}\n")
+    write.root = str(tmp_path)
+    return write
+
+
+@pytest.fixture
+def cpus(monkeypatch):
+    """Pretend the process may run on 8 CPUs"""
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+
+
+class TestCpuLimit:
+    """CPU quota from cgroup v2 or v1, else the CPUs we may run on"""
+
+    def test_cgroup_v2_quota(self, cgroup, cpus):
+        cgroup("cpu.max", "150000 100000")
+        assert server.cpu_limit(cgroup.root) == 1.5
+
+    def test_cgroup_v2_no_quota(self, cgroup, cpus):
+        cgroup("cpu.max", "max 100000")
+        assert server.cpu_limit(cgroup.root) == 8
+
+    def test_cgroup_v1_quota(self, cgroup, cpus):
+        cgroup("cpu/cpu.cfs_quota_us", "200000")
+        cgroup("cpu/cpu.cfs_period_us", "100000")
+        assert server.cpu_limit(cgroup.root) == 2
+
+    def test_cgroup_v1_no_quota(self, cgroup, cpus):
+        cgroup("cpu/cpu.cfs_quota_us", "-1")
+        cgroup("cpu/cpu.cfs_period_us", "100000")
+        assert server.cpu_limit(cgroup.root) == 8
+
+    def test_quota_above_available_cpus(self, cgroup, cpus):
+        cgroup("cpu.max", "1600000 100000")
+        assert server.cpu_limit(cgroup.root) == 8
+
+
+class TestWorkerCount:
+    """One worker per CPU, as many as fit in memory"""
+
+    def test_rounds_fractional_cpus_up(self, cgroup, cpus):
+        cgroup("cpu.max", "150000 100000")
+        assert server.worker_count(cgroup.root) == 2
+
+    def test_capped_by_memory(self, cgroup, cpus, monkeypatch):
+        monkeypatch.setattr(settings, "WEB_MASTER_MEMORY_MB", 100)
+        monkeypatch.setattr(settings, "WEB_WORKER_MEMORY_MB", 100)
+        cgroup("cpu.max", "max 100000")
+        cgroup("memory.max", str(512 * 1024 * 1024))
+        assert server.memory_limit_mb(cgroup.root) == 512
+        assert server.worker_count(cgroup.root) == 4
+
+    def test_at_least_one_worker(self, cgroup, cpus):
+        cgroup("cpu.max", "max 100000")
+        cgroup("memory/memory.limit_in_bytes", str(64 * 1024 * 1024))
+        assert server.worker_count(cgroup.root) == 1
+
+    def test_no_memory_limit(self, cgroup):
+        cgroup("memory.max", "max")
+        assert server.memory_limit_mb(cgroup.root) is None
+
+    def test_web_concurrency_wins(self, cgroup, cpus, monkeypatch):
+        monkeypatch.setattr(settings, "WEB_CONCURRENCY", "3")
+        assert server.worker_count(cgroup.root) == 3
+
+
+class TestOptions:
+    """gunicorn settings"""
+
+    def test_preload_and_recycling(self, monkeypatch):
+        monkeypatch.setattr(settings, "WEB_MAX_REQUESTS", 500)
+        options = server.gunicorn_options()
+        assert options["preload_app"] is True
+        assert options["worker_class"] == "uvicorn_worker.UvicornWorker"
+        assert options["max_requests"] == 500
+        assert options["max_requests_jitter"] == 50
+
+    def test_options_are_valid_gunicorn_settings(self):
+        app = server.Server(server.gunicorn_options())
+        assert app.cfg.preload_app is True
+        assert app.cfg.workers >= 1
@@ -0,0 +1,160 @@
+"""
+Bulk status / offer transition tests
+"""
+import pytest
+from sqlalchemy import event
+
+from database import PropertyApplication, ApplicationStatus, User
+from tests.conftest import TestingSessionLocal, engine, get_application
+
+
+@pytest.fixture
+def statements():
+    """SQL statements sent to the test database while the test runs"""
+    executed = []
+    
+    def record(connection, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+    
+    event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def create_applications(count, status=ApplicationStatus.SUBMITTED):
+    db = TestingSessionLocal()
+    try:
+        user = db.query(User).filter(User.email == "test@example.com").one()
+        applications = [
+            PropertyApplication(
+                user_id=user.id,
+                property_type="CONDO",
+                property_address=f"{number} Bulk Road",
+                property_size_sqm=30.0,
+                bedrooms=1,
+                bathrooms=1,
+                asking_price=2000000,
+                property_condition="good",
+                preferred_timeline="asap",
+                status=status,
+            )
+            for number in range(count)
+        ]
+        db.add_all(applications)
+        db.commit()
+        return [application.id for application in applications]
+    finally:
+        db.close()
+
+
+class TestBulkTransitions:
+    """POST /admin/applications/transitions"""
+    
+    def test_requires_reviewer(self, client, auth_headers):
+        response = client.post(
+            "/admin/applications/transitions",
+            json={"transitions": [{"application_id": 1, "status": "under_review"}]},
+            headers=auth_headers,
+        )
+        assert response.status_code == 403
+    
+    def test_move_to_review(self, client, reviewer_headers, sent_batches):
+        ids = create_applications(3)
+        response = client.post(
+            "/admin/applications/transitions",
+            json={"transitions": [{"application_id": i, "status": "under_review"} for i in ids]},
+            headers=reviewer_headers,
+        )
+        
+        assert response.status_code == 200
+        assert sorted(row["application_id"] for row in response.json()["updated"]) == ids
+        assert response.json()["rejected"] == []
+        assert get_application(ids[0]).status == ApplicationStatus.UNDER_REVIEW
+        assert get_application(ids[0]).updated_at is not None
+        assert len(sent_batches) == 1 and len(sent_batches[0]) == 3
+    
+    def test_make_offers(self, client, reviewer_headers, sent_batches):
+        first, second = create_applications(2, ApplicationStatus.UNDER_REVIEW)
+        response = client.post(
+            "/admin/applications/transitions",
+            json={"transitions": [
+                {"application_id": first, "status": "offer_made", "offer_amount": 1800000},
+                {"application_id": second, "status": "offer_made", "offer_amount": 1900000},
+            ]},
+            headers=reviewer_headers,
+        )
+        
+        assert response.status_code == 200
+        assert get_application(first).offer_amount == 1800000
+        assert get_application(second).offer_amount == 1900000
+        assert get_application(first).offer_made_at is not None
+        assert sent_batches[0][0]["status"] == "offer_made"
+    
+    def test_invalid_transitions_are_rejected(self, client, reviewer_headers, sent_batches):
+        submitted, = create_applications(1)
+        under_review, = create_applications(1, ApplicationStatus.UNDER_REVIEW)
+        response = client.post(
+            "/admin/applications/transitions",
+            json={"transitions": [
+                {"application_id": submitted, "status": "completed"},
+                {"application_id": under_review, "status": "offer_made"},
+                {"application_id": 999999, "status": "under_review"},
+            ]},
+            headers=reviewer_headers,
+        )
+        
+        reasons = {row["application_id"]: row["reason"] for row in response.json()["rejected"]}
+        assert response.json()["updated"] == []
+        assert reasons[submitted] == "Cannot move from submitted to completed"
+        assert "offer_amount" in reasons[under_review]
+        assert reasons[999999] == "Application not found"
+        assert get_application(submitted).status == ApplicationStatus.SUBMITTED
+        assert sent_batches == []
+    
+    def test_concurrent_change_is_not_overwritten(self, client, reviewer_headers, sent_batches, monkeypatch):
+        application_id, = create_applications(1)
+        
+        import crud
+        original_update = crud.update
+        
+        def change_status_first(*args, **kwargs):
+            db = TestingSessionLocal()
+            db.get(PropertyApplication, application_id).status = ApplicationStatus.UNDER_REVIEW
+            db.commit()
+            db.close()
+            return original_update(*args, **kwargs)
+        
+        monkeypatch.setattr(crud, "update", change_status_first)
+        response = client.post(
+            "/admin/applications/transitions",
+            json={"transitions": [{"application_id": application_id, "status": "under_review"}]},
+            headers=reviewer_headers,
+        )
+        assert response.json()["updated"] == []
+        assert "changed while updating" in response.json()["rejected"][0]["reason"]
+    
+    def test_five_hundred_offers_in_one_request(self, client, reviewer_headers, sent_batches, statements):
+        def make_offers(count):
+            ids = create_applications(count, ApplicationStatus.UNDER_REVIEW)
+            payload = {"transitions": [
+                {"application_id": i, "status": "offer_made", "offer_amount": 1000000 + i} for i in ids
+            ]}
+            statements.clear()
+            response = client.post("/admin/applications/transitions", json=payload, headers=reviewer_headers)
+            assert response.status_code == 200
+            assert len(response.json()["updated"]) == count
+            return len(statements)
+        
+        # Reviewer lookup, current statuses, one UPDATE - however many applications change
+        assert make_offers(5) == make_offers(500) == 3
+        assert len(sent_batches) == 2
+    
+    def test_repeated_application_is_refused(self, client, reviewer_headers, sent_batches):
+        [application_id] = create_applications(1, ApplicationStatus.UNDER_REVIEW)
+        response = client.post("/admin/applications/transitions", json={"transitions": [
+            {"application_id": application_id, "status": "offer_made", "offer_amount": 1000000},
+            {"application_id": application_id, "status": "offer_made", "offer_amount": 2000000},
+        ]}, headers=reviewer_headers)
+        assert response.status_code == 422
+        assert str(application_id) in response.text
+        assert sent_batches == []
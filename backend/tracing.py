@@ -0,0 +1,20 @@
+"""
+Request / trace ids
+The id of the HTTP request that is being handled, so background jobs it
+enqueues can be linked back to it in the logs and in Flower
+"""
+from contextvars import ContextVar
+from typing import Optional
+import uuid
+
+TRACE_HEADER = "X-Request-ID"
+
+trace_id_var: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_trace_id() -> Optional[str]:
+    return trace_id_var.get()
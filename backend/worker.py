@@ -0,0 +1,79 @@
+"""
+Celery worker launcher
+Picks a worker profile from the environment, like choosing a Sidekiq config per dyno
+
+    CELERY_WORKER_PROFILE=solo     python3 worker.py   # everything in one process (Railway 1GB)
+    CELERY_WORKER_PROFILE=threads  python3 worker.py   # I/O bound: transactional email
+    CELERY_WORKER_PROFILE=prefork  python3 worker.py   # CPU bound: media, valuation, maintenance
+
+CELERY_QUEUES, CELERY_CONCURRENCY and CELERY_AUTOSCALE override the profile defaults.
+CELERY_BEAT=true also runs the scheduler (archiving, document sweeps) in the
+worker - set it on exactly one worker, or scheduled jobs run more than once.
+To keep welcome emails away from batch work run one `threads` worker and one
+`prefork` worker; the `solo` profile drains the email queue first but a single
+long job still blocks it.
+"""
+from celery_app import celery_app, TASK_QUEUES
+from config import settings
+
+WORKER_PROFILES = {
+    # Single process, lowest memory usage, consumes every queue in priority order
+    'solo': {
+        'pool': 'solo',
+        'concurrency': 1,
+        'queues': TASK_QUEUES,
+    },
+    # Threads are cheap and email sending just waits on the network
+    'threads': {
+        'pool': 'threads',
+        'concurrency': 8,
+        'queues': ('email',),
+    },
+    # Separate processes for CPU heavy work, scaled between the autoscale bounds
+    'prefork': {
+        'pool': 'prefork',
+        'autoscale': (4, 1),
+        'queues': ('media', 'valuation', 'maintenance'),
+    },
+}
+
+
+def worker_argv(profile_name: str = None) -> list:
+    """Build the `celery worker` command line for a profile"""
+    profile_name = profile_name or settings.CELERY_WORKER_PROFILE
+    if profile_name not in WORKER_PROFILES:
+        raise ValueError(
+            f"Unknown worker profile {profile_name!r}, expected one of {', '.join(WORKER_PROFILES)}"
+        )
+    profile = WORKER_PROFILES[profile_name]
+    
+    queues = settings.CELERY_QUEUES or ','.join(profile['queues'])
+    argv = [
+        'worker',
+        '--loglevel=info',
+        f"--pool={profile['pool']}",
+        f'--queues={queues}',
+        '--max-tasks-per-child=100',
+        # Reduce network overhead, we don't need worker-to-worker chatter
+        '--without-gossip',
+        '--without-mingle',
+        '--without-heartbeat',
+    ]
+    
+    autoscale = settings.CELERY_AUTOSCALE or profile.get('autoscale')
+    if profile['pool'] == 'prefork' and autoscale and not settings.CELERY_CONCURRENCY:
+        if not isinstance(autoscale, str):
+            autoscale = ','.join(str(bound) for bound in autoscale)
+        argv.append(f'--autoscale={autoscale}')
+    else:
+        argv.append(f"--concurrency={settings.CELERY_CONCURRENCY or profile.get('concurrency', 1)}")
+    
+    if settings.CELERY_BEAT:
+        # Embedded scheduler for the jobs in beat_schedule, see celery_app.py
+        argv.append('--beat')
+    
+    return argv
+
+
+if __name__ == '__main__':
+    celery_app.worker_main(worker_argv())
@@ -16,6 +16,8 @@ export const API_ENDPOINTS = {
   SUBMIT_PROPERTY: `${API_BASE_URL}/submit-property-with-registration`,
   MY_APPLICATIONS: `${API_BASE_URL}/my-applications`,
   PROPERTY_APPLICATION: `${API_BASE_URL}/property-application`,
+  APPLICATION_EVENTS: `${API_BASE_URL}/events/applications`,
+  APPLICATION_EVENT_TICKETS: `${API_BASE_URL}/events/tickets`,
   
   // Uploads
   UPLOAD_PHOTOS: (id: number) => `${API_BASE_URL}/upload-photos/${id}`,
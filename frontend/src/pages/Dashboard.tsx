@@ -34,6 +34,58 @@ const Dashboard = () => {
     fetchApplications()
   }, [])
 
+  // Status and offer changes are pushed by the server, no need to poll
+  useEffect(() => {
+    if (!localStorage.getItem('token')) return
+
+    let source: EventSource | null = null
+    let retry: ReturnType<typeof setTimeout> | undefined
+    let stopped = false
+
+    // Stream tickets are single use, so every (re)connect asks for a new one
+    const connect = async () => {
+      let ticket: string
+      try {
+        const response = await axios.post(API_ENDPOINTS.APPLICATION_EVENT_TICKETS)
+        ticket = response.data.ticket
+      } catch (err) {
+        if (axios.isAxiosError(err) && err.response?.status === 401) return // Logged out or token expired
+        retry = setTimeout(connect, 5000)
+        return
+      }
+      if (stopped) return
+
+      source = new EventSource(`${API_ENDPOINTS.APPLICATION_EVENTS}?ticket=${encodeURIComponent(ticket)}`)
+      source.addEventListener('application.updated', (event) => {
+        const update = JSON.parse((event as MessageEvent).data)
+        setApplications((current) =>
+          current.map((app) =>
+            app.id === update.application_id
+              ? {
+                  ...app,
+                  status: update.status,
+                  offer_amount: update.offer_amount ?? undefined,
+                  offer_made_at: update.offer_made_at ?? undefined,
+                }
+              : app
+          )
+        )
+      })
+      source.addEventListener('session.expired', () => source?.close())
+      source.onerror = () => {
+        source?.close()
+        if (!stopped) retry = setTimeout(connect, 5000)
+      }
+    }
+
+    connect()
+    return () => {
+      stopped = true
+      clearTimeout(retry)
+      source?.close()
+    }
+  }, [])
+
   const fetchApplications = async () => {
     try {
       const response = await axios.get(API_ENDPOINTS.MY_APPLICATIONS)
@@ -52,6 +104,7 @@ const Dashboard = () => {
       offer_made: 'bg-green-100 text-green-800',
       offer_accepted: 'bg-green-200 text-green-900',
       offer_declined: 'bg-red-100 text-red-800',
+      offer_expired: 'bg-orange-100 text-orange-800',
       completed: 'bg-gray-100 text-gray-800',
     }
     return colors[status as keyof typeof colors] || 'bg-gray-100 text-gray-800'
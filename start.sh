@@ -8,4 +8,4 @@ echo "Starting IBuyer Thailand Application..."
 cd frontend/dist && python3 -m http.server 3000 &
 
 # Start the FastAPI backend
-cd /app/backend && python3 main.py
\ No newline at end of file
+cd /app/backend && python3 server.py
\ No newline at end of file